@@ -0,0 +1,656 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from collections import namedtuple, defaultdict, Counter
+from ipaddress import ip_interface
+
+from imnetdb.db.common_client import chunked, DEFAULT_CHUNK_SIZE
+from imnetdb.db.ipaddrs import ip_value_fields
+from imnetdb.stencil import Stencils
+
+__all__ = ['Action', 'Plan', 'build_plan', 'execute_plan']
+
+
+Action = namedtuple('Action', ['op', 'kind', 'key', 'fields'])
+
+_MISSING = object()
+
+# the order in which the kinds of changes are reported
+
+_KINDS = (
+    'device', 'interface', 'lag', 'lag_member', 'vlan', 'vlan_assigned',
+    'cable', 'ip_interface', 'ip_assigned'
+)
+
+_OP_SYMBOLS = dict(create='+', update='~', delete='-')
+
+# the Interface and LAG nodes that VLANs and IP interfaces are assigned to are identified by a
+# target tuple (collection name, device name, node name).
+
+_TARGET_FIELDS = (('interface', 'Interface'), ('lag', 'LAG'))
+
+
+def _jsonable(fields):
+    # desired values are compared with stored values, so tuples and the like are first
+    # converted to their stored (JSON) form.
+    return json.loads(json.dumps(fields))
+
+
+def _changed_fields(current, fields):
+    return {field: value for field, value in fields.items() if current.get(field, _MISSING) != value}
+
+
+def _target(spec):
+    for field, col_name in _TARGET_FIELDS:
+        if field in spec:
+            return col_name, spec['device'], spec[field]
+    raise ValueError(f'assignment requires device and interface, or device and lag: {spec}')
+
+
+def _format_key(key):
+    return ':'.join(str(item) for item in key) if isinstance(key, tuple) else str(key)
+
+
+class Plan(object):
+    """
+    The changes computed by :func:`build_plan`: the create, update, and delete actions by kind.
+    Each action is an :class:`Action` (op, kind, key, fields); for an update, the fields are only
+    those that differ from the stored document.
+    """
+
+    def __init__(self):
+        self.actions = list()
+
+        # document ids of the existing nodes, by (collection name, key...) tuple
+        self.ids = dict()
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def add(self, op, kind, key, fields=None):
+        self.actions.append(Action(op, kind, key, fields))
+
+    def of(self, kind, op):
+        """
+        Return the list of actions of the given kind and op.
+        """
+        return [action for action in self.actions if action.kind == kind and action.op == op]
+
+    def summary(self):
+        """
+        Return a dict of kind -> Counter of op.
+        """
+        summary = defaultdict(Counter)
+        for action in self.actions:
+            summary[action.kind][action.op] += 1
+        return dict(summary)
+
+    def format(self):
+        """
+        Return the plan as text, one line per action.
+        """
+        lines = list()
+        for kind in _KINDS:
+            for action in self.actions:
+                if action.kind != kind:
+                    continue
+                line = f'{_OP_SYMBOLS[action.op]} {kind} {_format_key(action.key)}'
+                if action.op == 'update':
+                    line += ' ' + json.dumps(action.fields, sort_keys=True)
+                lines.append(line)
+
+        return '\n'.join(lines) if lines else 'no changes'
+
+    def __str__(self):
+        return self.format()
+
+
+# -----------------------------------------------------------------------------
+# desired state
+# -----------------------------------------------------------------------------
+
+def _desired(desired_state):
+    stencils = desired_state.get('stencils')
+    if isinstance(stencils, dict):
+        stencil_defs, stencils = stencils, Stencils()
+        stencils.load(stencil_defs)
+
+    want = dict(devices=dict(), interfaces=dict(), lags=dict(), lag_members=dict(), vlans=dict(),
+                vlan_assigned=dict(), cables=dict(), ips=dict(), ip_assigned=dict())
+
+    for device_name, spec in desired_state.get('devices', {}).items():
+        spec = dict(spec)
+        stencil_name = spec.pop('stencil', None)
+        if stencil_name:
+            if stencils is None:
+                raise ValueError(f'device {device_name} uses stencil {stencil_name}, '
+                                 f'but the desired state does not include stencils')
+            device_fields, interfaces = stencils.device_state(stencils[stencil_name], **spec)
+        else:
+            device_fields, interfaces = spec, dict()
+
+        want['devices'][device_name] = _jsonable(dict(device_fields, _key=device_name, name=device_name))
+
+        for if_name, if_fields in interfaces.items():
+            want['interfaces'][(device_name, if_name)] = if_fields
+
+    for device_name, interfaces in desired_state.get('interfaces', {}).items():
+        for if_name, if_fields in interfaces.items():
+            want['interfaces'].setdefault((device_name, if_name), dict()).update(if_fields)
+
+    want['interfaces'] = {key: _jsonable(dict(if_fields, device=key[0], name=key[1]))
+                          for key, if_fields in want['interfaces'].items()}
+
+    for device_name, lags in desired_state.get('lags', {}).items():
+        for lag_name, spec in lags.items():
+            spec = dict(spec)
+            want['lag_members'][(device_name, lag_name)] = set(spec.pop('interfaces', []))
+            want['lags'][(device_name, lag_name)] = _jsonable(dict(spec, device=device_name, name=lag_name))
+
+    for vlan_name, spec in desired_state.get('vlans', {}).items():
+        spec = dict(spec)
+        want['vlan_assigned'][vlan_name] = {_target(item) for item in spec.pop('assigned', [])}
+        want['vlans'][vlan_name] = _jsonable(dict(spec, _key=vlan_name, name=vlan_name))
+
+    for row in desired_state.get('cables', []):
+        dev_a, if_a, dev_b, if_b = row
+        want['cables'][frozenset(((dev_a, if_a), (dev_b, if_b)))] = tuple(row)
+
+    for rt_name, ips in desired_state.get('ip_interfaces', {}).items():
+        for ip_value, spec in ips.items():
+            spec = dict(spec)
+            assigned = spec.pop('assigned', None)
+            ip_addr = ip_interface(ip_value)
+            key = (rt_name, str(ip_addr))
+            want['ip_assigned'][key] = _target(assigned) if assigned else None
+            want['ips'][key] = _jsonable(dict(spec, rt=rt_name, name=str(ip_addr), version=ip_addr.version,
+                                              **ip_value_fields(ip_addr)))
+
+    return want
+
+
+# -----------------------------------------------------------------------------
+# current state
+# -----------------------------------------------------------------------------
+
+_query_current_devices = """
+FOR doc IN Device
+    RETURN doc
+"""
+
+_query_current_interfaces = """
+FOR device_name IN @devices
+    FOR doc IN Interface
+        FILTER doc.device == device_name
+        RETURN doc
+"""
+
+_query_current_lags = """
+FOR device_name IN @devices
+    FOR doc IN LAG
+        FILTER doc.device == device_name
+        RETURN MERGE(doc, {
+            members: (FOR rel IN lag_member FILTER rel._to == doc._id RETURN DOCUMENT(rel._from).name)
+        })
+"""
+
+_query_current_cables = """
+FOR device_name IN @devices
+    FOR if_node IN Interface
+        FILTER if_node.device == device_name
+        FOR rel IN cabled
+            FILTER rel._from == if_node._id
+            COLLECT cable_id = rel._to
+            RETURN {
+                cable: cable_id,
+                ends: (
+                    FOR cable_rel IN cabled
+                        FILTER cable_rel._to == cable_id
+                        LET end_node = DOCUMENT(cable_rel._from)
+                        RETURN [end_node.device, end_node.name]
+                )
+            }
+"""
+
+_query_current_vlans = """
+FOR doc IN VLAN
+    RETURN MERGE(doc, {
+        assigned: (
+            FOR rel IN vlan_assigned
+                FILTER rel._from == doc._id
+                LET node = DOCUMENT(rel._to)
+                RETURN [PARSE_IDENTIFIER(node._id).collection, node.device, node.name, node._id]
+        )
+    })
+"""
+
+_query_current_ips = """
+FOR rt_name IN @rts
+    FOR doc IN IPInterface
+        FILTER doc.rt == rt_name
+        LET node = FIRST(FOR rel IN ip_assigned FILTER rel._from == doc._id RETURN DOCUMENT(rel._to))
+        RETURN MERGE(doc, {
+            assigned: node ? [PARSE_IDENTIFIER(node._id).collection, node.device, node.name, node._id] : null
+        })
+"""
+
+
+def _stream(client, query, batch_size, **bind_vars):
+    return client.query(query, batch_size=batch_size, stream=True, bind_vars=bind_vars)
+
+
+# -----------------------------------------------------------------------------
+# plan
+# -----------------------------------------------------------------------------
+
+def _plan_nodes(plan, kind, want, have, prune):
+    for key, fields in want.items():
+        current = have.get(key)
+        if current is None:
+            plan.add('create', kind, key, fields)
+            continue
+
+        changed = _changed_fields(current, fields)
+        if changed:
+            plan.add('update', kind, key, changed)
+
+    if prune:
+        for key in have.keys() - want.keys():
+            plan.add('delete', kind, key)
+
+
+def build_plan(client, desired_state, prune=False, batch_size=10000):
+    """
+    Compute the minimal changes that make the database match the desired state.  The current
+    state is read in a few bulk, streamed queries, and compared locally.
+
+    The desired state is a dict with the (all optional) items:
+
+        stencils: a Stencils instance, or a dict of stencil definitions
+        devices: {device_name: {stencil: stencil_name, **device_fields}}
+        interfaces: {device_name: {if_name: if_fields}}, merged over the stencil interfaces
+        lags: {device_name: {lag_name: {interfaces: [if_name, ...], **lag_fields}}}
+        vlans: {vlan_name: {assigned: [assignment, ...], **vlan_fields}}
+        cables: [(device_a, if_name_a, device_b, if_name_b), ...]
+        ip_interfaces: {rt_name: {ip_ifaddr: {assigned: assignment, **ip_fields}}}
+
+    where an assignment is dict(device=device_name, interface=if_name), or
+    dict(device=device_name, lag=lag_name).
+
+    Only the given fields are compared; other fields stored in a document are left as they are.
+    The LAG members, VLAN assignments, and IP assignments of the described nodes are made exactly
+    as described.  Documents that are not described are deleted only when `prune` is True: all
+    Devices and VLANs, the Interfaces, LAGs, and Cables of the devices, and the IP interfaces of
+    the described routing tables.
+
+    Parameters
+    ----------
+    client : IMNetDB
+        The database client
+
+    desired_state : dict
+        The desired state, as described above
+
+    prune : bool (optional)
+        When True, plan the deletion of the documents not described
+
+    batch_size : int (optional)
+        The number of documents fetched from the server per request
+
+    Returns
+    -------
+    Plan
+    """
+    want = _desired(desired_state)
+    plan = Plan()
+    ids = plan.ids
+
+    # devices
+
+    have_devices = {doc['name']: doc for doc in _stream(client, _query_current_devices, batch_size)}
+    for doc in have_devices.values():
+        ids[('Device', doc['name'])] = doc['_id']
+
+    _plan_nodes(plan, 'device', want['devices'], have_devices, prune)
+
+    scope_devices = sorted(set(want['devices']) | (set(have_devices) if prune else set()))
+
+    # interfaces and LAGs of the devices
+
+    have_interfaces = dict()
+    for doc in _stream(client, _query_current_interfaces, batch_size, devices=scope_devices):
+        have_interfaces[(doc['device'], doc['name'])] = doc
+        ids[('Interface', doc['device'], doc['name'])] = doc['_id']
+
+    _plan_nodes(plan, 'interface', want['interfaces'], have_interfaces, prune)
+
+    have_lags, have_lag_members = dict(), dict()
+    for doc in _stream(client, _query_current_lags, batch_size, devices=scope_devices):
+        key = (doc['device'], doc['name'])
+        have_lag_members[key] = set(doc.pop('members'))
+        have_lags[key] = doc
+        ids[('LAG',) + key] = doc['_id']
+
+    _plan_nodes(plan, 'lag', want['lags'], have_lags, prune)
+
+    # the Interfaces and LAGs that relationships can refer to; those that exist, or will exist.
+
+    known = {('Interface',) + key for key in want['interfaces'].keys() | have_interfaces.keys()}
+    known.update(('LAG',) + key for key in want['lags'].keys() | have_lags.keys())
+
+    def check_known(target, what):
+        if target not in known:
+            raise ValueError(f'{what} refers to unknown {target[0]} {_format_key(target[1:])}')
+
+    for key, members in want['lag_members'].items():
+        for if_name in members:
+            check_known(('Interface', key[0], if_name), f'LAG {_format_key(key)}')
+
+        have_members = have_lag_members.get(key, set())
+        for if_name in sorted(members - have_members):
+            plan.add('create', 'lag_member', key + (if_name,))
+        for if_name in sorted(have_members - members):
+            plan.add('delete', 'lag_member', key + (if_name,))
+
+    # cables of the devices
+
+    have_cables = dict()
+    for item in _stream(client, _query_current_cables, batch_size, devices=scope_devices):
+        have_cables[frozenset(tuple(end) for end in item['ends'])] = item['cable']
+
+    for ends, row in want['cables'].items():
+        if ends not in have_cables:
+            plan.add('create', 'cable', row)
+
+    if prune:
+        for ends, cable_id in have_cables.items():
+            if ends not in want['cables']:
+                plan.add('delete', 'cable', tuple(item for end in sorted(ends) for item in end),
+                         dict(cable=cable_id))
+
+    # VLANs
+
+    have_vlans, have_vlan_assigned = dict(), dict()
+    for doc in _stream(client, _query_current_vlans, batch_size):
+        assigned = set()
+        for col_name, device_name, node_name, node_id in doc.pop('assigned'):
+            assigned.add((col_name, device_name, node_name))
+            ids[(col_name, device_name, node_name)] = node_id
+        have_vlans[doc['name']] = doc
+        have_vlan_assigned[doc['name']] = assigned
+        ids[('VLAN', doc['name'])] = doc['_id']
+
+    _plan_nodes(plan, 'vlan', want['vlans'], have_vlans, prune)
+
+    for vlan_name, targets in want['vlan_assigned'].items():
+        for target in targets:
+            check_known(target, f'VLAN {vlan_name}')
+
+        have_targets = have_vlan_assigned.get(vlan_name, set())
+        for target in sorted(targets - have_targets):
+            plan.add('create', 'vlan_assigned', (vlan_name,) + target)
+        for target in sorted(have_targets - targets):
+            plan.add('delete', 'vlan_assigned', (vlan_name,) + target)
+
+    # IP interfaces of the routing tables
+
+    rts = sorted({rt_name for rt_name, _ip in want['ips']})
+    have_ips, have_ip_assigned = dict(), dict()
+    for doc in _stream(client, _query_current_ips, batch_size, rts=rts):
+        key = (doc['rt'], doc['name'])
+        assigned = doc.pop('assigned')
+        if assigned:
+            col_name, device_name, node_name, node_id = assigned
+            have_ip_assigned[key] = (col_name, device_name, node_name)
+            ids[(col_name, device_name, node_name)] = node_id
+        have_ips[key] = doc
+        ids[('IPInterface',) + key] = doc['_id']
+
+    _plan_nodes(plan, 'ip_interface', want['ips'], have_ips, prune)
+
+    for key, target in want['ip_assigned'].items():
+        if target:
+            check_known(target, f'IP interface {_format_key(key)}')
+
+        have_target = have_ip_assigned.get(key)
+        if have_target == target:
+            continue
+        if have_target:
+            plan.add('delete', 'ip_assigned', key + have_target)
+        if target:
+            plan.add('create', 'ip_assigned', key + target)
+
+    return plan
+
+
+# -----------------------------------------------------------------------------
+# execute
+# -----------------------------------------------------------------------------
+
+_query_upsert = """
+FOR item IN @items
+    UPSERT item.key
+    INSERT item.fields
+    UPDATE item.fields
+    IN @@col_name OPTIONS {keepNull: False}
+    RETURN NEW._id
+"""
+
+_query_remove_edges_of = """
+FOR node_id IN @node_ids
+    FOR rel IN @@edge_name
+        FILTER rel._from == node_id OR rel._to == node_id
+        REMOVE rel IN @@edge_name
+"""
+
+_query_remove_nodes = """
+FOR node_id IN @node_ids
+    REMOVE PARSE_IDENTIFIER(node_id).key IN @@col_name
+"""
+
+_query_remove_edges = """
+FOR rel IN @rels
+    FOR edge IN @@edge_name
+        FILTER edge._from == rel._from AND edge._to == rel._to
+        REMOVE edge IN @@edge_name
+"""
+
+_query_add_pool_items = """
+FOR item IN @items
+    UPSERT {value: item.value}
+    INSERT item
+    UPDATE {}
+    IN @@col_name
+"""
+
+_query_remove_pool_items = """
+FOR item IN @@col_name
+    FILTER item.value IN @values
+    REMOVE item IN @@col_name
+"""
+
+
+def _node_key(col_name, key):
+    if col_name in ('Device', 'VLAN'):
+        return dict(_key=key)
+    if col_name == 'IPInterface':
+        return dict(rt=key[0], name=key[1])
+    return dict(device=key[0], name=key[1])
+
+
+class _Executor(object):
+
+    def __init__(self, client, plan, chunk_size):
+        self.client = client
+        self.plan = plan
+        self.chunk_size = chunk_size
+        self.ids = dict(plan.ids)
+
+    def upsert(self, kind, col_name):
+        actions = [action for action in self.plan.actions if action.kind == kind and action.op != 'delete']
+        for chunk in chunked(actions, self.chunk_size):
+            node_ids = self.client.query(_query_upsert, bind_vars={
+                'items': [dict(key=_node_key(col_name, action.key), fields=action.fields) for action in chunk],
+                '@col_name': col_name
+            })
+            for action, node_id in zip(chunk, node_ids):
+                key = action.key if isinstance(action.key, tuple) else (action.key,)
+                self.ids[(col_name,) + key] = node_id
+
+        return [action for action in actions if action.op == 'create']
+
+    def remove_nodes(self, kind, col_name):
+        node_ids = list()
+        for action in self.plan.of(kind, 'delete'):
+            key = action.key if isinstance(action.key, tuple) else (action.key,)
+            node_ids.append(self.ids[(col_name,) + key])
+
+        self._remove_node_ids(col_name, node_ids)
+        return node_ids
+
+    def _remove_node_ids(self, col_name, node_ids):
+        if not node_ids:
+            return
+
+        edge_names = {edge_name for from_col, edge_name, to_col in self.client.db_model['edges']
+                      if col_name in (from_col, to_col)}
+
+        for chunk in chunked(node_ids, self.chunk_size):
+            for edge_name in sorted(edge_names):
+                self.client.query(_query_remove_edges_of, bind_vars={'node_ids': chunk, '@edge_name': edge_name})
+            self.client.query(_query_remove_nodes, bind_vars={'node_ids': chunk, '@col_name': col_name})
+
+    def edges(self, kind, edge_name, op):
+        rels = list()
+        for action in self.plan.of(kind, op):
+            if kind == 'lag_member':
+                device_name, lag_name, if_name = action.key
+                rels.append(dict(_from=self.ids[('Interface', device_name, if_name)],
+                                 _to=self.ids[('LAG', device_name, lag_name)]))
+            elif kind == 'vlan_assigned':
+                vlan_name, *target = action.key
+                rels.append(dict(_from=self.ids[('VLAN', vlan_name)], _to=self.ids[tuple(target)]))
+            else:
+                rt_name, ip_name, *target = action.key
+                rels.append(dict(_from=self.ids[('IPInterface', rt_name, ip_name)], _to=self.ids[tuple(target)]))
+
+        if op == 'create':
+            self.client.ensure_edges(((dict(_id=rel['_from']), edge_name, dict(_id=rel['_to'])) for rel in rels),
+                                     chunk_size=self.chunk_size)
+            return
+
+        for chunk in chunked(rels, self.chunk_size):
+            self.client.query(_query_remove_edges, bind_vars={'rels': chunk, '@edge_name': edge_name})
+
+    def run(self):
+        client = self.client
+        result = dict(cabling=None)
+
+        # first the deletes, so that re-cabled interfaces and re-assigned IPs are free.
+
+        self.edges('ip_assigned', 'ip_assigned', 'delete')
+        self.edges('vlan_assigned', 'vlan_assigned', 'delete')
+        self.edges('lag_member', 'lag_member', 'delete')
+        self._remove_node_ids('Cable', [action.fields['cable'] for action in self.plan.of('cable', 'delete')])
+        self.remove_nodes('ip_interface', 'IPInterface')
+        self.remove_nodes('lag', 'LAG')
+        self.remove_nodes('vlan', 'VLAN')
+
+        pool = client.interfaces.pool
+        removed_if_ids = self.remove_nodes('interface', 'Interface')
+        for chunk in chunked(removed_if_ids, self.chunk_size):
+            client.query(_query_remove_pool_items, bind_vars={'values': chunk, '@col_name': pool.col_name})
+
+        self.remove_nodes('device', 'Device')
+
+        # then the creates and updates of the nodes
+
+        self.upsert('device', 'Device')
+
+        created = self.upsert('interface', 'Interface')
+        client.ensure_edges(((dict(_id=self.ids[('Device', action.key[0])]), 'equip_interface',
+                              dict(_id=self.ids[('Interface',) + action.key])) for action in created),
+                            chunk_size=self.chunk_size)
+
+        for chunk in chunked(created, self.chunk_size):
+            client.query(_query_add_pool_items, bind_vars={
+                'items': [dict(action.fields, value=self.ids[('Interface',) + action.key], used=False)
+                          for action in chunk],
+                '@col_name': pool.col_name
+            })
+
+        self.upsert('lag', 'LAG')
+        self.upsert('vlan', 'VLAN')
+
+        created = self.upsert('ip_interface', 'IPInterface')
+        if created:
+            rt_nodes = {rt_node['name']: rt_node for rt_node in
+                        client.routing_tables.ensure_many(sorted({action.key[0] for action in created}))}
+            client.ensure_edges(((dict(_id=self.ids[('IPInterface',) + action.key]),
+                                  client.routing_tables.EDGE_NAME, rt_nodes[action.key[0]])
+                                 for action in created), chunk_size=self.chunk_size)
+
+        # and then the relationships
+
+        self.edges('lag_member', 'lag_member', 'create')
+        self.edges('vlan_assigned', 'vlan_assigned', 'create')
+        self.edges('ip_assigned', 'ip_assigned', 'create')
+
+        rows = [action.key for action in self.plan.of('cable', 'create')]
+        if rows:
+            result['cabling'] = client.cabling.ensure_many(rows, chunk_size=self.chunk_size)
+
+        return result
+
+
+def execute_plan(client, plan, chunk_size=DEFAULT_CHUNK_SIZE, atomic=True):
+    """
+    Make the changes of a plan, in bulk queries, by default within a single transaction.
+
+    The transaction is an ArangoDB stream transaction that write-locks every collection, and is
+    bound by the server stream transaction limits: the idle timeout between requests
+    (--transaction.streaming-idle-timeout), the transaction lifetime, and the size of the writes
+    that the transaction holds in memory (--rocksdb.max-transaction-size).  A plan that is too large
+    for those limits can be run with atomic=False.  Each bulk query is then committed on its
+    own.  If the run fails part way, the changes already made are kept, and building and running
+    a new plan for the same desired state completes the remaining changes.
+
+    Parameters
+    ----------
+    client : IMNetDB
+        The database client
+
+    plan : Plan
+        The plan returned by :func:`build_plan`
+
+    chunk_size : int (optional)
+        The number of items written per server request
+
+    atomic : bool (optional)
+        When True, make all of the changes in one transaction
+
+    Returns
+    -------
+    dict
+        cabling: the result of the cabling ensure_many() for the new cables, or None
+    """
+    if not atomic:
+        return _Executor(client, plan, chunk_size).run()
+
+    with client.transaction():
+        return _Executor(client, plan, chunk_size).run()
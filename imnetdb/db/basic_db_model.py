@@ -31,9 +31,11 @@ database_model = dict(
         # Basic network construct relationships
 
         ('Device',          'device_member',        'DeviceGroup'),
+        ('DeviceGroup',     'device_member',        'DeviceGroup'),
         ('Device',          'equip_interface',      'Interface'),
         ('Interface',       'lag_member',           'LAG'),
         ('Interface',       'cabled',               'Cable'),
+        ('Interface',       'pass_through',         'Interface'),
         ('VLAN',            "vlan_member",          'VLANGroup'),
         ('LAG',             "lacp_member",          "LACP"),
 
@@ -61,5 +63,21 @@ database_model = dict(
         ('VLANGroup',       'vlan_assigned',        'Interface'),
         ('VLAN',            'vlan_assigned',        'LAG'),
         ('VLANGroup',       'vlan_assigned',        'LAG'),
+    ],
+
+    # persistent indexes (collection, fields) for lookups that are not done by _key
+    # or by the edge _from/_to indexes.
+
+    indexes=[
+        ('Interface',       ('device', 'name')),
+        ('LAG',             ('device', 'name')),
+        ('IPAddress',       ('rt', 'name')),
+        ('IPInterface',     ('rt', 'name')),
+        ('IPNetwork',       ('rt', 'name')),
+        ('IPAddress',       ('rt', 'version', 'ip_start', 'ip_end')),
+        ('IPInterface',     ('rt', 'version', 'ip_start', 'ip_end')),
+        ('IPNetwork',       ('rt', 'version', 'ip_start', 'ip_end')),
+        ('IPAddress',       ('version', 'ip_host', 'rt')),
+        ('IPInterface',     ('version', 'ip_host', 'rt')),
     ]
 )
@@ -15,6 +15,7 @@
 from string import Template
 from first import first
 from imnetdb.db.collection import CommonCollection
+from imnetdb.db.common_client import chunked, DEFAULT_CHUNK_SIZE
 
 
 class CableNodes(CommonCollection):
@@ -131,6 +132,134 @@ class CableNodes(CommonCollection):
                     interface_nodes=[if_col.get(edge['_from'])
                                      for edge in found_edges])
 
+    # -------------------------------------------------------------------------
+    # ensure_many
+    # -------------------------------------------------------------------------
+
+    _query_resolve_cabling = """
+    FOR row IN @rows
+        LET if_a = FIRST(FOR if_node IN Interface
+            FILTER if_node.device == row[0] AND if_node.name == row[1]
+            LIMIT 1
+            RETURN if_node._id
+        )
+        LET if_b = FIRST(FOR if_node IN Interface
+            FILTER if_node.device == row[2] AND if_node.name == row[3]
+            LIMIT 1
+            RETURN if_node._id
+        )
+        RETURN {
+            if_a: if_a,
+            if_b: if_b,
+            cable_a: FIRST(FOR rel IN cabled FILTER rel._from == if_a RETURN rel._to),
+            cable_b: FIRST(FOR rel IN cabled FILTER rel._from == if_b RETURN rel._to)
+        }
+    """
+
+    _query_insert_cables = """
+    FOR fields IN @cables
+        INSERT fields INTO Cable
+        RETURN NEW._id
+    """
+
+    _query_insert_cabled = """
+    FOR rel IN @rels
+        INSERT rel INTO cabled
+    """
+
+    def ensure_many(self, rows, chunk_size=DEFAULT_CHUNK_SIZE, **fields):
+        """
+        Ensure that Cables exist for a cabling plan.  The plan rows are processed in chunks; for each
+        chunk the Interface nodes and any existing Cables are resolved in one query, and then the
+        missing Cable nodes and 'cabled' edges are created in bulk.  Rows that cannot be cabled are
+        reported back to the caller rather than aborting the import.
+
+        Parameters
+        ----------
+        rows : Iterable[tuple]
+            Each row is (device_a, if_name_a, device_b, if_name_b), with an optional fifth item dict of
+            fields to store in that Cable node.  This can be a generator, for example a csv reader.
+
+        chunk_size : int (optional)
+            The number of rows processed per server request.
+
+        fields : kwargs
+            Extra fields to be stored within every new Cable node.  Row fields take precedence.
+
+        Returns
+        -------
+        dict
+            Dictionary of results, structured:
+                'created': the number of Cable nodes created
+                'existing': the number of rows where the Cable already existed
+                'conflicts': list of dict(row, reason, cables) for rows where an interface is already
+                             cabled elsewhere
+                'missing': list of dict(row, reason) for rows where an interface does not exist
+        """
+        result = dict(created=0, existing=0, conflicts=[], missing=[])
+
+        # interfaces that have been cabled by a prior chunk of this import, so that
+        # duplicate use of an interface within the plan is also reported.
+
+        cabled_if_ids = set()
+
+        for chunk in chunked(rows, chunk_size):
+            resolved = self.query(self._query_resolve_cabling, bind_vars={
+                'rows': [row[0:4] for row in chunk]
+            })
+
+            new_cables = list()
+            new_if_ids = list()
+
+            for row, found in zip(chunk, resolved):
+                if_a, if_b = found['if_a'], found['if_b']
+                cable_a, cable_b = found['cable_a'], found['cable_b']
+
+                if not (if_a and if_b):
+                    result['missing'].append(dict(row=row, reason='interface does not exist'))
+                    continue
+
+                if if_a == if_b:
+                    result['conflicts'].append(dict(row=row, reason='interface cabled to itself',
+                                                    cables=[]))
+                    continue
+
+                if cable_a and cable_a == cable_b:
+                    result['existing'] += 1
+                    continue
+
+                if cable_a or cable_b:
+                    result['conflicts'].append(dict(row=row, reason='interface already cabled',
+                                                    cables=[c for c in (cable_a, cable_b) if c]))
+                    continue
+
+                if if_a in cabled_if_ids or if_b in cabled_if_ids:
+                    result['conflicts'].append(dict(row=row, reason='interface cabled earlier in plan',
+                                                    cables=[]))
+                    continue
+
+                cabled_if_ids.update((if_a, if_b))
+                _dev_a, _if_a, _dev_b, _if_b, *row_fields = row
+                new_cables.append(dict(fields, **(first(row_fields) or {})))
+                new_if_ids.append((if_a, if_b))
+
+            if not new_cables:
+                continue
+
+            cable_ids = list(self.query(self._query_insert_cables, bind_vars={
+                'cables': new_cables
+            }))
+
+            self.query(self._query_insert_cabled, bind_vars={
+                'rels': [dict(_from=if_id, _to=cable_id)
+                         for cable_id, if_ids in zip(cable_ids, new_if_ids)
+                         for if_id in if_ids]
+            })
+
+            result['created'] += len(cable_ids)
+
+        return result
+
     # -------------------------------------------------------------------------
     # get_cabling
     # -------------------------------------------------------------------------
@@ -209,3 +338,119 @@ class CableNodes(CommonCollection):
             'cable_id': cable_id,
             'known_device': known_device
         }))
+
+    # -------------------------------------------------------------------------
+    # trace_path()
+    # -------------------------------------------------------------------------
+
+    def ensure_pass_through(self, interface_nodes, present=True):
+        """
+        Ensure that a pass-through relationship exists (present=True) or does not (present=False)
+        between two Interface nodes of the same device, for example the front and rear ports of
+        a patch panel.  Pass-through interfaces are followed by :meth:`trace_path`.
+
+        Parameters
+        ----------
+        interface_nodes : tuple[dict]
+            A tuple (or list) of two Interface document dict
+
+        present : bool
+            If True ensure the relationship exists.
+            If False ensure the relationship does not exist.
+        """
+        if len(interface_nodes) != 2:
+            raise ValueError('interface_nodes requires two interface nodes')
+
+        self.client.ensure_edge((interface_nodes[0], 'pass_through', interface_nodes[1]), present=present)
+
+    # the path is the longest walk that starts out of the interface cable, alternating between cabled
+    # edges and pass_through edges, and that ends on an Interface.  Each cable hop is two edges
+    # (interface -> cable -> interface) and each pass through is one edge.
+
+    _query_path = """
+        FIRST(
+            FOR vertex, edge, path IN 1..@max_depth ANY if_node cabled, pass_through
+                OPTIONS {uniqueVertices: 'path'}
+                FILTER IS_SAME_COLLECTION('cabled', path.edges[0])
+                FILTER IS_SAME_COLLECTION('Interface', vertex)
+                SORT LENGTH(path.edges) DESC
+                LIMIT 1
+                RETURN path.vertices
+        ) || [if_node]
+    """
+
+    _query_trace_path = Template("""
+    LET if_node = DOCUMENT(@if_id)
+    RETURN ${path}
+    """)
+
+    _query_trace_group_paths = Template("""
+    FOR device IN INBOUND DOCUMENT('DeviceGroup', @group_name) device_member
+        FILTER IS_SAME_COLLECTION('Device', device)
+        FOR if_node IN OUTBOUND device equip_interface
+            FILTER FIRST(FOR rel IN cabled FILTER rel._from == if_node._id LIMIT 1 RETURN true)
+            FILTER NOT FIRST(FOR rel IN pass_through FILTER rel._from == if_node._id LIMIT 1 RETURN true)
+            FILTER NOT FIRST(FOR rel IN pass_through FILTER rel._to == if_node._id LIMIT 1 RETURN true)
+            RETURN {
+                interface: if_node,
+                path: ${path}
+            }
+    """)
+
+    @staticmethod
+    def _max_depth(max_hops):
+        return 3 * max_hops - 1
+
+    def trace_path(self, interface_node, max_hops=8):
+        """
+        Trace the physical path that starts at the given Interface, following the cable out of the
+        interface and any pass-through interfaces (patch panels) along the way, in one query.
+
+        Parameters
+        ----------
+        interface_node : dict
+            The Interface node dict where the trace starts
+
+        max_hops : int (optional)
+            The maximum number of cables to follow
+
+        Returns
+        -------
+        list[dict]
+            The ordered path of node dicts, starting with `interface_node` and alternating between
+            Interface and Cable nodes, for example:
+                [server-if, cable, panel1-front-if, panel1-rear-if, cable, leaf-if]
+            If the interface is not cabled, the list contains only the interface node.
+        """
+        query = self._query_trace_path.substitute(path=self._query_path)
+        return first(self.query(query, bind_vars={
+            'if_id': interface_node['_id'],
+            'max_depth': self._max_depth(max_hops)
+        }))
+
+    def trace_group_paths(self, group_node, max_hops=8):
+        """
+        Trace the physical path of every cabled endpoint Interface, that is not a pass-through
+        interface, of every Device in the given DeviceGroup.  The results are streamed from the
+        server.
+
+        Parameters
+        ----------
+        group_node : dict
+            The DeviceGroup node dict
+
+        max_hops : int (optional)
+            The maximum number of cables to follow
+
+        Returns
+        -------
+        Iterator[dict]
+            Each item is a dictionary, structured:
+                'interface': the endpoint Interface node dict
+                'path': the ordered path, as described in :meth:`trace_path`
+        """
+        query = self._query_trace_group_paths.substitute(path=self._query_path)
+        return self.query(query, stream=True, bind_vars={
+            'group_name': group_node['name'],
+            'max_depth': self._max_depth(max_hops)
+        })
@@ -18,6 +18,9 @@ from pkg_resources import iter_entry_points
 from first import first
 
 from imnetdb.rpools import RPoolsDB
+from imnetdb.db.snapshot import GraphSnapshot
+from imnetdb.db.dump import export_database, import_database
+from imnetdb.db.apply import build_plan, execute_plan
 
 __all__ = ['IMNetDB']
 
@@ -65,7 +68,7 @@ class IMNetDB(RPoolsDB):
 
         self.db_model_name = db_model_name
         self.db_model = None
-        self.graph = None
+        self._graph = None
 
         super(IMNetDB, self).__init__(password=password, user=user, db_name=db_name,
                                       host=host, port=port, connect_timeout=connect_timeout)
@@ -104,26 +107,172 @@ class IMNetDB(RPoolsDB):
             if not self.db.has_collection(edge_col):
                 self.db.create_collection(edge_col, edge=True)
 
+        self.ensure_model_indexes()
+
         # finally, ensure that a master graph exists that includes all of the nodes/edge defined
         # in the model.
 
         self.ensure_master_graph()
         self._init_collection_handlers()
 
+    def ensure_model_indexes(self):
+        """
+        Ensure the persistent indexes defined by the database model exist.
+        """
+        for col_name, fields in self.db_model.get('indexes', []):
+            self.db.collection(col_name).add_persistent_index(fields=list(fields))
+
+    @property
+    def graph(self):
+        """
+        The master graph, of the transaction database within a transaction() block of the
+        calling thread.
+        """
+        if self._graph is not None and self.transaction_db is not None:
+            return self.transaction_db.graph(self._graph.name)
+        return self._graph
+
     def ensure_master_graph(self, graph_name='master'):
+        build = defaultdict(lambda: dict(from_vertex_collections=set(), to_vertex_collections=set()))
+
+        for from_vc, edge_name, to_vc in self.db_model['edges']:
+            build[edge_name]['from_vertex_collections'].add(from_vc)
+            build[edge_name]['to_vertex_collections'].add(to_vc)
+
+        edge_definitions = [dict(edge_collection=edge_name,
+                                 from_vertex_collections=list(vc['from_vertex_collections']),
+                                 to_vertex_collections=list(vc['to_vertex_collections']))
+                            for edge_name, vc in build.items()]
 
         if not self.db.has_graph(graph_name):
-            build = defaultdict(lambda: dict(from_vertex_collections=set(), to_vertex_collections=set()))
+            self.db.create_graph(graph_name, edge_definitions=edge_definitions)
 
-            for from_vc, edge_name, to_vc in self.db_model['edges']:
-                build[edge_name]['from_vertex_collections'].add(from_vc)
-                build[edge_name]['to_vertex_collections'].add(to_vc)
+        self._graph = self.db.graph(graph_name)
 
-            edge_definitions = [dict(edge_collection=edge_name,
-                                     from_vertex_collections=list(vc['from_vertex_collections']),
-                                     to_vertex_collections=list(vc['to_vertex_collections']))
-                                for edge_name, vc in build.items()]
+        # an existing graph may have been created by an earlier version of the database model,
+        # so add any edge definitions that are missing, or that have gained vertex collections.
 
-            self.db.create_graph(graph_name, edge_definitions=edge_definitions)
+        existing = {edge_def['edge_collection']: edge_def for edge_def in self.graph.edge_definitions()}
+
+        for edge_def in edge_definitions:
+            have = existing.get(edge_def['edge_collection'])
+            if not have:
+                self.graph.create_edge_definition(**edge_def)
+
+            elif (set(have['from_vertex_collections']) != set(edge_def['from_vertex_collections']) or
+                  set(have['to_vertex_collections']) != set(edge_def['to_vertex_collections'])):
+                self.graph.replace_edge_definition(**edge_def)
+
+    def snapshot(self, attributes=('name', 'device'), batch_size=10000):
+        """
+        Create an in-memory snapshot of the vertex and edge collections of the database model,
+        for local topology analysis (reachability, paths, degree checks) without per-query
+        round trips to the server.
+
+        Parameters
+        ----------
+        attributes : Iterable[str] (optional)
+            The names of the vertex attributes to keep in the snapshot
+
+        batch_size : int (optional)
+            The number of documents fetched from the server per request
+
+        Returns
+        -------
+        GraphSnapshot
+        """
+        return GraphSnapshot.load(self, attributes=attributes, batch_size=batch_size)
+
+    def export(self, path, max_workers=4, batch_size=10000):
+        """
+        Export the entire database, the model collections, the resource pool collections, and
+        the edge collections, to compressed JSONL files in the `path` directory.  See
+        :func:`imnetdb.db.dump.export_database` for details.
+
+        Parameters
+        ----------
+        path : str
+            The export directory; created if it does not exist
+
+        max_workers : int (optional)
+            The number of collections exported concurrently
+
+        batch_size : int (optional)
+            The number of documents fetched from the server per request
+
+        Returns
+        -------
+        dict
+            The export manifest
+        """
+        return export_database(self, path, max_workers=max_workers, batch_size=batch_size)
+
+    def import_(self, path, max_workers=4, chunk_size=10000, truncate=False):
+        """
+        Import an export directory, created by :meth:`export`, into this database using bulk
+        imports.  See :func:`imnetdb.db.dump.import_database` for details.
+
+        Parameters
+        ----------
+        path : str
+            The export directory
+
+        max_workers : int (optional)
+            The number of collections imported concurrently
+
+        chunk_size : int (optional)
+            The number of documents sent to the server per bulk import request
+
+        truncate : bool (optional)
+            When True, existing collections are emptied before they are loaded
+
+        Returns
+        -------
+        dict
+            collection name -> number of documents imported
+        """
+        counts = import_database(self, path, max_workers=max_workers, chunk_size=chunk_size, truncate=truncate)
+        self.ensure_model_indexes()
+        self.ensure_master_graph()
+        return counts
+
+    def apply(self, desired_state, dry_run=False, prune=False, chunk_size=1000, atomic=True):
+        """
+        Make the database match a declarative desired state of devices (from stencils), interfaces,
+        cables, LAGs, VLANs, and IP interfaces.  The current state is read in bulk, the minimal set
+        of creates, updates, and deletes is computed, and only those changes are written, in bulk
+        queries, by default within a single transaction.  See :func:`imnetdb.db.apply.build_plan`
+        for the structure of the desired state, and :func:`imnetdb.db.apply.execute_plan` for the
+        server limits on the size of the transaction.
+
+        Parameters
+        ----------
+        desired_state : dict
+            The desired state
+
+        dry_run : bool (optional)
+            When True, print the plan and do not make any changes
+
+        prune : bool (optional)
+            When True, delete the documents that are not described by the desired state
+
+        chunk_size : int (optional)
+            The number of items written per server request
+
+        atomic : bool (optional)
+            When True, make all of the changes in one transaction; when False, each bulk query
+            is committed on its own, for plans too large for a stream transaction
+
+        Returns
+        -------
+        dict
+            plan: the Plan of changes
+            cabling: the result of the cabling ensure_many() for the new cables, or None
+        """
+        plan = build_plan(self, desired_state, prune=prune)
+
+        if dry_run:
+            print(plan.format())
+            return dict(plan=plan, cabling=None)
 
-        self.graph = self.db.graph(graph_name)
+        return dict(plan=plan, **execute_plan(self, plan, chunk_size=chunk_size, atomic=atomic))
@@ -16,6 +16,44 @@ from string import Template
 from first import first
 from copy import deepcopy
 
+from imnetdb.db.common_client import chunked, DEFAULT_CHUNK_SIZE
+
+
+# Ensure a node: the stored node is read first, and the write is skipped when the stored node
+# already matches the fields, so that re-ensuring an unchanged node does not create a new revision
+# (and the WAL, replication, and cache invalidation that goes with it).  The op value is one of
+# 'created', 'updated', 'unchanged'.
+#
+# The fields are compared one by one rather than with MATCHES: the write removes the fields of null
+# value (keepNull: False), so a null field matches a stored node that does not have it.
+
+_aql_ensure_node = Template("""
+LET existing = FIRST(FOR doc IN @@col_name FILTER ${key_filter} LIMIT 1 RETURN doc)
+LET unchanged = existing != null AND LENGTH(
+    FOR attr IN ATTRIBUTES(@fields) FILTER existing[attr] != @fields[attr] LIMIT 1 RETURN attr
+) == 0
+LET written = (
+    FOR fields IN (unchanged ? [] : [@fields])
+        UPSERT ${upsert_key}
+        INSERT fields
+        UPDATE fields
+        IN @@col_name OPTIONS {keepNull: False}
+        RETURN NEW
+)
+RETURN {
+    doc: unchanged ? existing : FIRST(written),
+    op: unchanged ? 'unchanged' : (existing ? 'updated' : 'created')
+}
+""")
+
+
+def _key_filter(key, doc_var='doc', key_var='@key'):
+    """
+    Return the AQL filter expression that matches the `key` dict fields, one equality per field,
+    so that the persistent indexes on those fields can be used (MATCHES cannot use an index).
+    """
+    return ' AND '.join(f'{doc_var}.`{field}` == {key_var}.`{field}`' for field in sorted(key))
+
 
 class CommonCollection(object):
 
@@ -23,9 +61,30 @@ class CommonCollection(object):
 
     def __init__(self, client):
         self.client = client
-        self.db = client.db
-        self.col = client.db.collection(self.COLLECTION_NAME)
-        self.query = client.db.aql.execute
+
+    # the database, collection and query are looked up from the client on each use, rather than
+    # bound once, so that a client transaction (see CommonDBClient.transaction) routes every
+    # handler call through the transaction.
+
+    @property
+    def db(self):
+        return self.client.db
+
+    @property
+    def col(self):
+        return self.client.db.collection(self.COLLECTION_NAME)
+
+    @property
+    def query(self):
+        return self.client.query
+
+    def _ensured(self, result):
+        """
+        Count the ensure op of the result, see _aql_ensure_node, when the calling thread is within a
+        client ensure_stats() block, and return the node dict.
+        """
+        self.client.count_ensure(result['op'])
+        return result['doc']
 
     def __iter__(self):
         return self.col.all()
@@ -43,13 +102,8 @@ class NameKeyCollection(CommonCollection):
     The document collection _key is the field.name value.  This value must be globally unique within
     the collection.
     """
-    __aql_ensure_node = """
-    UPSERT {_key: @fields.name}
-    INSERT @fields
-    UPDATE @fields
-    IN @@col_name OPTIONS {keepNull: False}
-    RETURN {doc: NEW, old: OLD}
-    """
+    __aql_ensure_node = _aql_ensure_node.substitute(key_filter='doc._key == @fields.name',
+                                                    upsert_key='{_key: @fields.name}')
 
     def ensure(self, name, **fields):
         _fields = deepcopy(fields)
@@ -60,7 +114,57 @@ class NameKeyCollection(CommonCollection):
             '@col_name': self.COLLECTION_NAME
         }))
 
-        return result['doc']
+        return self._ensured(result)
+
+    __aql_ensure_many_nodes = """
+    FOR item IN @items
+        LET existing = FIRST(FOR doc IN @@col_name FILTER doc._key == item.name LIMIT 1 RETURN doc)
+        LET unchanged = existing != null AND LENGTH(
+            FOR attr IN ATTRIBUTES(item) FILTER existing[attr] != item[attr] LIMIT 1 RETURN attr
+        ) == 0
+        LET written = (
+            FOR fields IN (unchanged ? [] : [item])
+                UPSERT {_key: fields.name}
+                INSERT fields
+                UPDATE fields
+                IN @@col_name OPTIONS {keepNull: False}
+                RETURN NEW
+        )
+        RETURN {
+            doc: unchanged ? existing : FIRST(written),
+            op: unchanged ? 'unchanged' : (existing ? 'updated' : 'created')
+        }
+    """
+
+    def ensure_many(self, names, chunk_size=DEFAULT_CHUNK_SIZE, **fields):
+        """
+        Ensure many nodes exist, all with the same fields, one query per chunk of names.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The node names
+
+        chunk_size : int (optional)
+            The number of nodes written per server request.
+
+        fields : kwargs
+            The fields stored into every node
+
+        Returns
+        -------
+        list[dict]
+            The node dicts, in the same order as `names`
+        """
+        nodes = list()
+
+        for chunk in chunked(names, chunk_size):
+            nodes.extend(self._ensured(result) for result in self.query(self.__aql_ensure_many_nodes, bind_vars={
+                'items': [dict(deepcopy(fields), _key=name, name=name) for name in chunk],
+                '@col_name': self.COLLECTION_NAME
+            }))
+
+        return nodes
 
     def __getitem__(self, name):
         """
@@ -115,6 +219,79 @@ class CommonNodeGroup(CommonCollection):
         """
         self.client.ensure_edge((member_node, self.EDGE_NAME, group_node), present=False)
 
+    def add_members(self, group_node, member_nodes):
+        """
+        Ensure the edge relationships from each of the member_nodes to group_node exist, written
+        as one edge batch.
+
+        Parameters
+        ----------
+        group_node : dict
+            The group node dict
+
+        member_nodes : Iterable[dict]
+            The member node dicts
+        """
+        self.client.ensure_edges((member_node, self.EDGE_NAME, group_node) for member_node in member_nodes)
+
+    def del_members(self, group_node, member_nodes):
+        """
+        Ensure the edge relationships from each of the member_nodes to group_node do not exist,
+        removed as one edge batch.
+
+        Parameters
+        ----------
+        group_node : dict
+            The group node dict
+
+        member_nodes : Iterable[dict]
+            The member node dicts
+        """
+        self.client.ensure_edges(((member_node, self.EDGE_NAME, group_node) for member_node in member_nodes),
+                                 present=False)
+
+    _query_member_ids = """
+    FOR rel IN @@edge_name
+        FILTER rel._to == @group_id
+        RETURN rel._from
+    """
+
+    def set_members(self, group_node, member_nodes):
+        """
+        Reconcile the members of the group to be exactly the member_nodes; only the missing
+        edge relationships are added and only the extra ones are removed.
+
+        Parameters
+        ----------
+        group_node : dict
+            The group node dict
+
+        member_nodes : Iterable[dict]
+            The member node dicts
+
+        Returns
+        -------
+        dict
+            added: the number of members added
+            removed: the number of members removed
+        """
+        desired = {member_node['_id']: member_node for member_node in member_nodes}
+        existing = set(self.query(self._query_member_ids, bind_vars={
+            '@edge_name': self.EDGE_NAME,
+            'group_id': group_node['_id']
+        }))
+
+        to_add = [desired[member_id] for member_id in desired.keys() - existing]
+        to_del = [dict(_id=member_id) for member_id in existing - desired.keys()]
+
+        if to_add:
+            self.add_members(group_node, to_add)
+
+        if to_del:
+            self.del_members(group_node, to_del)
+
+        return dict(added=len(to_add), removed=len(to_del))
+
     _query_all_members = """
     RETURN MERGE(
         FOR member IN INBOUND DOCUMENT(@group_col, @group_name) @@edge_name
@@ -143,28 +320,101 @@ class CommonNodeGroup(CommonCollection):
             '@edge_name': self.EDGE_NAME
         }))
 
+    _query_members_many = """
+    FOR group_id IN @group_ids
+        RETURN {
+            group_id: group_id,
+            members: MERGE(
+                FOR member IN 1..@depth INBOUND group_id @@edge_name
+                    OPTIONS {bfs: true, uniqueVertices: 'global'}
+                    RETURN {[member.name]: member}
+            )
+        }
+    """
 
-class DictKeyCollection(CommonCollection):
+    def get_members_many(self, group_nodes, depth=1):
+        """
+        Return the members of each of the groups, as :meth:`get_members`, using a single
+        traversal query.  When depth is more than 1, the members of nested groups are included
+        transitively, along with the nested groups themselves.
+
+        Parameters
+        ----------
+        group_nodes : list[dict]
+            The group node dicts
+
+        depth : int (optional)
+            The maximum depth of nested groups to include
 
-    __aql_ensure_node = """
-    UPSERT @key
-    INSERT @fields
-    UPDATE @fields
-    IN @@col_name OPTIONS {keepNull: False}
-    RETURN {doc: NEW, old: OLD}
+        Returns
+        -------
+        dict
+            key: group node _id
+            value: dict
+                key: name of member
+                value: member node dict
+        """
+        return {item['group_id']: item['members'] for item in self.query(self._query_members_many, bind_vars={
+            'group_ids': [group_node['_id'] for group_node in group_nodes],
+            '@edge_name': self.EDGE_NAME,
+            'depth': depth
+        })}
+
+    _query_groups_of = """
+    FOR member_id IN @member_ids
+        RETURN {
+            member_id: member_id,
+            groups: (
+                FOR group IN 1..@depth OUTBOUND member_id @@edge_name
+                    OPTIONS {bfs: true, uniqueVertices: 'global'}
+                    FILTER IS_SAME_COLLECTION(@group_col, group)
+                    RETURN group
+            )
+        }
     """
 
+    def groups_of(self, member_nodes, depth=1):
+        """
+        Return the groups that each of the member nodes belongs to, using a single traversal
+        query.  When depth is more than 1, the groups that contain those groups are included
+        transitively.
+
+        Parameters
+        ----------
+        member_nodes : list[dict]
+            The member node dicts
+
+        depth : int (optional)
+            The maximum depth of nested groups to include
+
+        Returns
+        -------
+        dict
+            key: member node _id
+            value: list of group node dicts, an empty list if the node is not in any group
+        """
+        return {item['member_id']: item['groups'] for item in self.query(self._query_groups_of, bind_vars={
+            'member_ids': [member_node['_id'] for member_node in member_nodes],
+            '@edge_name': self.EDGE_NAME,
+            'group_col': self.COLLECTION_NAME,
+            'depth': depth
+        })}
+
+
+class DictKeyCollection(CommonCollection):
+
     def ensure(self, key, **fields):
         _fields = deepcopy(fields)
         _fields.update(key)
 
-        result = first(self.query(self.__aql_ensure_node, bind_vars={
+        query = _aql_ensure_node.substitute(key_filter=_key_filter(key), upsert_key='@key')
+        result = first(self.query(query, bind_vars={
             'key': key,
             'fields': _fields,
             '@col_name': self.COLLECTION_NAME
         }))
 
-        return result['doc']
+        return self._ensured(result)
 
     def __getitem__(self, key_dict):
         """
@@ -188,14 +438,6 @@ class DictKeyCollection(CommonCollection):
 
 class TupleKeyCollection(CommonCollection):
 
-    __aql_ensure_node = """
-    UPSERT @key
-    INSERT @fields
-    UPDATE @fields
-    IN @@col_name OPTIONS {keepNull: False}
-    RETURN {doc: NEW, old: OLD}
-    """
-
     def _key(self, key_tuple):
         raise NotImplementedError()
 
@@ -204,13 +446,14 @@ class TupleKeyCollection(CommonCollection):
         _fields = deepcopy(fields)
         _fields.update(key)
 
-        result = first(self.query(self.__aql_ensure_node, bind_vars={
+        query = _aql_ensure_node.substitute(key_filter=_key_filter(key), upsert_key='@key')
+        result = first(self.query(query, bind_vars={
             'key': key,
             'fields': _fields,
             '@col_name': self.COLLECTION_NAME
         }))
 
-        return result['doc']
+        return self._ensured(result)
 
     def __getitem__(self, key_tuple):
         """
@@ -263,17 +506,115 @@ class PeeringCollection(CommonCollection):
         if found:
             return found['peering_node']
 
-        peering_node = self.col.insert(fields or {}, return_new=True)['new']
+        return first(self._create_peerings([[peer_node['_id'] for peer_node in peer_nodes]], fields))
 
-        edge_col = self.db.collection(self.EDGE_NAME)
-        edge_col.insert(dict(_from=peer_nodes[0]['_id'], _to=peering_node['_id']))
-        edge_col.insert(dict(_from=peer_nodes[1]['_id'], _to=peering_node['_id']))
+    _query_insert_peering_nodes = """
+    FOR fields IN @nodes
+        INSERT fields INTO @@col_name
+        RETURN NEW
+    """
+
+    _query_insert_peering_edges = """
+    FOR rel IN @rels
+        INSERT rel INTO @@edge_name
+    """
 
-        return peering_node
+    def _create_peerings(self, peer_ids_list, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Create new peering nodes, and the edges from each of their peer nodes, in bulk.  The caller
+        is responsible for ensuring the peerings do not already exist.
+
+        Parameters
+        ----------
+        peer_ids_list : Iterable[tuple[str]]
+            Each item is the tuple of peer node IDs for one new peering node.
+
+        fields : dict
+            Extra fields to be stored within each new peering node.
+
+        chunk_size : int (optional)
+            The number of peering nodes created per server request.
+
+        Returns
+        -------
+        list[dict]
+            The new peering node dicts, in the same order as `peer_ids_list`.
+        """
+        created = list()
+
+        for chunk in chunked(peer_ids_list, chunk_size):
+            peering_nodes = list(self.query(self._query_insert_peering_nodes, bind_vars={
+                '@col_name': self.COLLECTION_NAME,
+                'nodes': [fields or {}] * len(chunk)
+            }))
+
+            self.query(self._query_insert_peering_edges, bind_vars={
+                '@edge_name': self.EDGE_NAME,
+                'rels': [dict(_from=peer_id, _to=peering_node['_id'])
+                         for peering_node, peer_ids in zip(peering_nodes, chunk)
+                         for peer_id in peer_ids]
+            })
+
+            created.extend(peering_nodes)
+
+        return created
+
+    _query_find_peerings = """
+    FOR peer_ids IN @peer_ids_list
+        LET found = (
+            FOR peer_id IN peer_ids
+                RETURN FIRST(FOR rel IN @@edge_name FILTER rel._from == peer_id RETURN rel._to)
+        )
+        LET peering_id = FIRST(found)
+        LET peering_peer_ids = (FOR rel IN @@edge_name FILTER rel._to == peering_id RETURN rel._from)
+        RETURN {
+            found: found,
+            peering_node: DOCUMENT(peering_id),
+            peer_ids: peering_peer_ids,
+            peer_nodes: LENGTH(peer_ids) == 1 ? DOCUMENT(peering_peer_ids) : null
+        }
+    """
+
+    @staticmethod
+    def _check_found(peer_nodes, found):
+        """
+        Check the result of the find query for one set of peer nodes.
+
+        Returns
+        -------
+        tuple
+            (result, error) where result is the find() dictionary of information or None, and
+            error is None or the (message, info) tuple describing an inconsistent peering.
+        """
+        found_ids = found['found']
+
+        if not found_ids or not all(found_ids):
+            return None, None
+
+        peering_node = found['peering_node']
+
+        if len(found_ids) == 2:
+
+            if found_ids[0] == found_ids[1]:
+                return dict(peering_node=peering_node, peer_nodes=peer_nodes), None
+
+            return None, ('peers not connected to same peering node',
+                          dict(peer_nodes=peer_nodes, peering_nodes=found_ids))
+
+        # if we are here, then we were given only one peer node, and we have found
+        # one peering node.  We need both ends to return the "other side".
+
+        if len(found['peer_ids']) != 2:
+            return None, ("one peer give, but did not find both ends",
+                          dict(peer_nodes=peer_nodes, found_peering_node=peering_node,
+                               found_peer_ids=found['peer_ids']))
+
+        return dict(peering_node=peering_node, peer_nodes=found['peer_nodes']), None
 
     def find(self, peer_nodes):
         """
-        Find the peering node that exists between the peer nodes.
+        Find the peering node that exists between the peer nodes.  The peering node and the peer
+        nodes are resolved in a single query.
 
         Parameters
         ----------
@@ -302,52 +643,117 @@ class PeeringCollection(CommonCollection):
         if len(peer_nodes) > 2:
             raise ValueError("peer_nodes must be list length <= 2")
 
-        edge_col = self.db.collection(self.EDGE_NAME)
+        found = first(self.query(self._query_find_peerings, bind_vars={
+            '@edge_name': self.EDGE_NAME,
+            'peer_ids_list': [[peer_node['_id'] for peer_node in peer_nodes]]
+        }))
+
+        result, error = self._check_found(peer_nodes, found)
+        if error:
+            raise RuntimeError(*error)
 
-        found_peering_nodes = [first(edge_col.find(dict(_from=peer_node['_id'])))
-                               for peer_node in peer_nodes]
+        return result
 
-        if not all(found_peering_nodes):
-            return None
+    def find_many(self, peer_nodes_list, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Find the peering nodes for many sets of peer nodes, see :meth:`find`.  Each chunk of peer
+        nodes is resolved in a single query.  Rather than raising an exception, inconsistent peerings
+        are returned with an 'error' key so that an audit can report on all of them at once.
+
+        Parameters
+        ----------
+        peer_nodes_list : Iterable[tuple[dict]]
+            Each item is a tuple (or list) of either 1 or 2 peer node document dict.
 
-        peering_node = self.db.collection(self.COLLECTION_NAME).get(found_peering_nodes[0]['_to'])
+        chunk_size : int (optional)
+            The number of items resolved per server request.
 
-        if len(found_peering_nodes) == 2:
+        Returns
+        -------
+        list
+            The list items are in the same order as `peer_nodes_list`.  Each item is either the
+            :meth:`find` dictionary of information, None if there is no peering node, or for an
+            inconsistent peering, a dictionary structured:
+                'peering_node': None
+                'peer_nodes': the given peer nodes
+                'error': the error message
+                'info': dictionary of the found information
+        """
+        results = list()
 
-            if found_peering_nodes[0]['_to'] == found_peering_nodes[1]['_to']:
-                return dict(peering_node=peering_node, peer_nodes=peer_nodes)
+        for chunk in chunked(peer_nodes_list, chunk_size):
+            if any(len(peer_nodes) > 2 for peer_nodes in chunk):
+                raise ValueError("peer_nodes must be list length <= 2")
 
-            raise RuntimeError('peers not connected to same peering node',
-                               dict(peer_nodes=peer_nodes,
-                                    peering_nodes=found_peering_nodes))
+            found_list = self.query(self._query_find_peerings, bind_vars={
+                '@edge_name': self.EDGE_NAME,
+                'peer_ids_list': [[peer_node['_id'] for peer_node in peer_nodes] for peer_nodes in chunk]
+            })
 
-        # if we were give two peers, but only found one, then we might have
-        # an issue here
+            for peer_nodes, found in zip(chunk, found_list):
+                result, error = self._check_found(peer_nodes, found)
+                if error:
+                    message, info = error
+                    result = dict(peering_node=None, peer_nodes=peer_nodes, error=message, info=info)
 
-        if len(peer_nodes) == 2:
-            raise RuntimeError("two peers given, but only one connected",
-                               dict(peer_nodes=peer_nodes,
-                                    found_peering_nodes=found_peering_nodes))
+                results.append(result)
 
-        # if we are here, then we were given only one peer node, and we have found
-        # one peering node.  We need to find the "other side" of the edge.from
+        return results
+
+    def ensure_many(self, peer_nodes_list, chunk_size=DEFAULT_CHUNK_SIZE, **fields):
+        """
+        Ensure that a peering node exists between each of the pairs of peer nodes.  The existing
+        peerings are found with :meth:`find_many`, and the missing ones are created in bulk.
+
+        Parameters
+        ----------
+        peer_nodes_list : Iterable[tuple[dict]]
+            Each item is a tuple (or list) of two peer node dict
+
+        chunk_size : int (optional)
+            The number of items handled per server request.
+
+        fields : kwargs
+            Extra fields to be stored within each new peering node.
+
+        Returns
+        -------
+        list[dict]
+            The peering node dicts, in the same order as `peer_nodes_list`.
+
+        Raises
+        ------
+        ValueError
+            When an item does not have two peer nodes
+
+        RuntimeError
+            When any of the peer nodes are not connected to the same peering node.  No peering
+            nodes are created in this case.
+        """
+        peer_nodes_list = list(peer_nodes_list)
+        if any(len(peer_nodes) != 2 for peer_nodes in peer_nodes_list):
+            raise ValueError('peer_nodes requires two nodes')
+
+        found_list = self.find_many(peer_nodes_list, chunk_size=chunk_size)
 
-        found_edges = list(edge_col.find(dict(_to=peering_node['_id'])))
+        errors = [found for found in found_list if found and 'error' in found]
+        if errors:
+            raise RuntimeError('peers not connected to same peering node', errors)
 
-        if len(found_edges) != 2:
-            raise RuntimeError("one peer give, but did not find both ends",
-                               dict(peer_nodes=peer_nodes,
-                                    found_peering_node=peering_node,
-                                    found_edges=found_edges))
+        # create each missing peering once, even if the same peers are given more than once.
 
-        # if we are here, then we've found everything AOK, and need to return
-        # the dictionary of information
+        to_create = dict()
+        for peer_nodes, found in zip(peer_nodes_list, found_list):
+            if not found:
+                peer_ids = tuple(peer_node['_id'] for peer_node in peer_nodes)
+                to_create.setdefault(frozenset(peer_ids), peer_ids)
 
-        member_col = self.db.collection(self.MEMBER_COLLECTION_NAME)
+        created = dict(zip(to_create, self._create_peerings(to_create.values(), fields,
+                                                            chunk_size=chunk_size)))
 
-        return dict(peering_node=peering_node,
-                    peer_nodes=[member_col.get(edge['_from'])
-                                for edge in found_edges])
+        return [found['peering_node'] if found
+                else created[frozenset(peer_node['_id'] for peer_node in peer_nodes)]
+                for peer_nodes, found in zip(peer_nodes_list, found_list)]
 
     _query_get_peering = Template("""
     FOR peering_node in @@col_name
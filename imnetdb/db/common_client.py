@@ -12,13 +12,53 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+from itertools import islice
+from collections import defaultdict, Counter
+from contextlib import contextmanager
+
 import retrying
 
 from arango import ArangoClient
+from arango.http import DefaultHTTPClient
 from arango.exceptions import ServerConnectionError
 
+from imnetdb.db.instrument import Instrumentation, InstrumentedDatabase, MeteredHTTPClient
+from imnetdb.db.slowlog import SlowQueryLog
+
+
+__all__ = ['CommonDBClient', 'chunked', 'DEFAULT_CHUNK_SIZE']
+
 
-__all__ = ['CommonDBClient']
+# default number of items sent to the server in a single bulk operation.
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def chunked(iterable, size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield successive lists of at most `size` items from `iterable`.  The iterable is consumed
+    lazily so that callers can stream very large inputs (generators, csv readers) into bulk
+    operations without first loading everything into memory.
+
+    Parameters
+    ----------
+    iterable : Iterable
+        The items to chunk
+
+    size : int (optional)
+        The maximum number of items in each chunk
+
+    Yields
+    ------
+    list
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class CommonDBClient(object):
@@ -55,14 +95,19 @@ class CommonDBClient(object):
         self._user = user
         self._password = password
 
-        self._arango = ArangoClient(host=host, port=port)
+        self._arango = ArangoClient(host=host, port=port, http_client=MeteredHTTPClient(DefaultHTTPClient()))
         self._sysdb = self._arango.db('_system', username=self._user, password=self._password)
 
         self.db_name = db_name
         self.db_model = None
 
-        self.db = None
-        self.query = None
+        self.instrumentation = None
+
+        # the standard database shared by all threads, and the per thread transaction binding,
+        # see transaction().
+
+        self._db = None
+        self._thread = threading.local()
 
         @retrying.retry(retry_on_exception=lambda e:  isinstance(e, ServerConnectionError),
                         stop_max_delay=connect_timeout * 1000)
@@ -82,8 +127,232 @@ class CommonDBClient(object):
             self._sysdb.create_database(self.db_name, users=[
                 dict(username=self._user, password=self._password, active=True)])
 
-        self.db = self._arango.db(self.db_name, username=self._user, password=self._password)
-        self.query = self.db.aql.execute
+        self._bind_db(self._arango.db(self.db_name, username=self._user, password=self._password))
+
+    @property
+    def db(self):
+        """
+        The database used by the client, and therefore all of the collection handlers; the
+        transaction database within a transaction() block of the calling thread, otherwise the
+        standard database.
+        """
+        return getattr(self._thread, 'db', None) or self._db
+
+    @property
+    def query(self):
+        return self.db.aql.execute
+
+    @property
+    def transaction_db(self):
+        """
+        The transaction database of the calling thread, or None when the thread is not within a
+        transaction() block.
+        """
+        return getattr(self._thread, 'transaction_db', None)
+
+    def _wrap_db(self, db):
+        if isinstance(db, InstrumentedDatabase):
+            db = db.wrapped
+
+        if self.instrumentation is not None:
+            db = self.instrumentation.wrap(db)
+
+        return db
+
+    def _bind_db(self, db):
+        """
+        Bind the client, and therefore all of the collection handlers, to the given standard
+        database object.
+        """
+        self._db = self._wrap_db(db)
+
+    def _rebind(self):
+        self._bind_db(self._db)
+        if self.transaction_db is not None:
+            self._thread.db = self._wrap_db(self.transaction_db)
+
+    def instrument(self, instrumentation=None, **options):
+        """
+        Enable the instrumentation of every AQL execution and collection method call made through
+        this client, including those of the collection handlers.  Each call is recorded with the
+        handler method that made it, the imnetdb method called by the application, the wall time,
+        the server execution time, the bind vars size, the rows returned and the bytes received.
+
+        Examples
+        --------
+        instr = db.instrument(slow_threshold=0.5, capture_profile=True)
+        db.devices.ensure('leaf1')
+        print(instr.stats.report())
+
+        Parameters
+        ----------
+        instrumentation : Instrumentation (optional)
+            The instrumentation to use; by default a new one is created using `options`
+
+        Other Parameters
+        ----------------
+        options are passed to the Instrumentation, for example hooks, slow_threshold, capture_profile
+
+        Returns
+        -------
+        Instrumentation
+        """
+        self.instrumentation = instrumentation or Instrumentation(**options)
+        self._rebind()
+        return self.instrumentation
+
+    def enable_slow_query_log(self, threshold=1.0, logger=None):
+        """
+        Log each AQL query that runs slower than `threshold`, with its bind vars and the full
+        collection scans of its EXPLAIN plan, and aggregate the slow queries by query template.
+        The client is instrumented if it is not already.
+
+        Parameters
+        ----------
+        threshold : float (optional)
+            The wall time, in seconds, over which a query is logged
+
+        logger : logging.Logger (optional)
+            The logger; by default the "imnetdb.slowquery" logger
+
+        Returns
+        -------
+        SlowQueryLog
+        """
+        slow_log = SlowQueryLog(self, threshold=threshold, logger=logger)
+        instrumentation = self.instrumentation or self.instrument()
+        instrumentation.add_hook(slow_log)
+        return slow_log
+
+    def disable_slow_query_log(self, slow_log):
+        """
+        Stop logging the slow queries with `slow_log`, as returned by :meth:`enable_slow_query_log`.
+        The client remains instrumented, and `slow_log` keeps the slow queries recorded so far.
+        """
+        if self.instrumentation is not None and slow_log in self.instrumentation.hooks:
+            self.instrumentation.remove_hook(slow_log)
+
+    def uninstrument(self):
+        """
+        Disable the instrumentation enabled by :meth:`instrument`.  The hooks of the
+        instrumentation, including any slow query log enabled by :meth:`enable_slow_query_log`,
+        no longer receive calls; a later :meth:`instrument` creates a new instrumentation, without
+        them.
+        """
+        self.instrumentation = None
+        self._rebind()
+
+    @contextmanager
+    def transaction(self, write=None, read=None, exclusive=None, **options):
+        """
+        Context manager that runs all of the client database operations, including those made by
+        the collection handlers, within a single ArangoDB stream transaction.  The transaction is
+        committed when the block completes, or aborted if the block raises an exception.  Reads
+        within the block see the writes made within the block.
+
+        A transaction started within the block of another transaction joins the outer transaction.
+
+        The transaction is bound to the calling thread only: other threads that use the same
+        client, for example the export worker threads, do not take part in it and continue to use
+        the standard database.
+
+        Examples
+        --------
+        with db.transaction():
+            device = db.devices.ensure('leaf1')
+            db.interfaces.ensure((device, 'Ethernet1'))
+
+        Parameters
+        ----------
+        write : list[str] (optional)
+            The names of the collections written in the transaction.  By default every
+            collection in the database.
+
+        read : list[str] (optional)
+            The names of the collections read in the transaction
+
+        exclusive : list[str] (optional)
+            The names of the collections written exclusively in the transaction
+
+        Other Parameters
+        ----------------
+        options are passed to the python-arango begin_transaction(), for example lock_timeout
+
+        Yields
+        ------
+        TransactionDatabase
+        """
+        if self.transaction_db is not None:
+            yield self.transaction_db
+            return
+
+        standard_db = self._db.wrapped if isinstance(self._db, InstrumentedDatabase) else self._db
+
+        if write is None:
+            write = [col_prop['name'] for col_prop in standard_db.collections() if not col_prop['system']]
+
+        txn_db = standard_db.begin_transaction(read=read, write=write, exclusive=exclusive, **options)
+
+        self._thread.transaction_db = txn_db
+        self._thread.db = self._wrap_db(txn_db)
+
+        try:
+            yield txn_db
+
+        except BaseException:
+            # an abort failure, for example when the server has already aborted the transaction
+            # on timeout, must not hide the original error.
+
+            try:
+                txn_db.abort_transaction()
+            except Exception:
+                pass
+            raise
+
+        else:
+            txn_db.commit_transaction()
+
+        finally:
+            self._thread.transaction_db = None
+            self._thread.db = None
+
+    @contextmanager
+    def ensure_stats(self):
+        """
+        Context manager that counts the ensure ops, of the nodes and edges, made by the calling
+        thread within the block.  Each op is one of 'created', 'updated' (the stored node did not
+        match and was rewritten), or 'unchanged' (the write was skipped).  Blocks may be nested;
+        the counts of an inner block are added to the outer block.
+
+        Examples
+        --------
+        with db.ensure_stats() as stats:
+            db.devices.ensure_many(['leaf1', 'leaf2'], role='leaf')
+        print(stats['created'], stats['updated'], stats['unchanged'])
+
+        Yields
+        ------
+        Counter
+            The counts by op
+        """
+        outer = getattr(self._thread, 'ensure_stats', None)
+        stats = self._thread.ensure_stats = Counter()
+
+        try:
+            yield stats
+
+        finally:
+            self._thread.ensure_stats = outer
+            if outer is not None:
+                outer.update(stats)
+
+    def count_ensure(self, op, count=1):
+        """
+        Count an ensure op in the ensure_stats() block of the calling thread, if any.
+        """
+        stats = getattr(self._thread, 'ensure_stats', None)
+        if stats is not None and count:
+            stats[op] += count
 
     def reset_database(self):
         self.wipe_database()
@@ -92,12 +361,18 @@ class CommonDBClient(object):
     def wipe_database(self):
         self._sysdb.delete_database(self.db_name, ignore_missing=True)
 
+    # an edge is only written when it does not exist; an existing edge is left unchanged rather
+    # than rewritten with a new revision.
+
     _query_ensure_edge = """
-    UPSERT { _from: @rel._from, _to: @rel._to }
-    INSERT @rel
-    UPDATE @rel
-    IN @@edge_name
-    RETURN { doc: NEW, old: OLD }
+    LET existing = FIRST(
+        FOR rel IN @@edge_name
+            FILTER rel._from == @rel._from AND rel._to == @rel._to
+            LIMIT 1
+            RETURN rel
+    )
+    LET written = (FOR rel IN (existing ? [] : [@rel]) INSERT rel IN @@edge_name RETURN NEW)
+    RETURN { doc: existing || FIRST(written), op: existing ? 'unchanged' : 'created' }
     """
 
     def ensure_edge(self, edge, present=True):
@@ -117,12 +392,73 @@ class CommonDBClient(object):
         from_node, edge_col, to_node = edge
 
         if present is True:
-            self.query(self._query_ensure_edge, bind_vars={
+            for result in self.query(self._query_ensure_edge, bind_vars={
                 'rel': dict(_from=from_node['_id'], _to=to_node['_id']),
                 '@edge_name': edge_col
-            })
+            }):
+                self.count_ensure(result['op'])
         else:
             self.db.collection(edge_col).delete_match(filters={
                 '_from': from_node['_id'],
                 '_to': to_node['_id']
             })
+
+    _query_ensure_edges = """
+    FOR rel IN @rels
+        LET existing = FIRST(
+            FOR edge IN @@edge_name
+                FILTER edge._from == rel._from AND edge._to == rel._to
+                LIMIT 1
+                RETURN edge._id
+        )
+        FILTER existing == null
+        INSERT rel IN @@edge_name
+        RETURN 'created'
+    """
+
+    _query_remove_edges = """
+    FOR rel IN @rels
+        FOR edge IN @@edge_name
+            FILTER edge._from == rel._from AND edge._to == rel._to
+            REMOVE edge IN @@edge_name
+    """
+
+    def ensure_edges(self, edges, present=True, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Ensure that many edge relationships either exist (present=True) or do not
+        (present=False).  The edges are written in chunks, one query per edge collection
+        per chunk.
+
+        Parameters
+        ----------
+        edges : Iterable[tuple]
+            Each item is (from_node_dict, edge_col_name, to_node_dict)
+
+        present : bool
+            If True ensure the edges exist.
+            If False ensure the edges do not exist.
+
+        chunk_size : int (optional)
+            The number of edges written per server request.
+        """
+        query = self._query_ensure_edges if present is True else self._query_remove_edges
+
+        for chunk in chunked(edges, chunk_size):
+            # duplicate edges within a chunk are written once, since the existence check of the
+            # query does not see the edges inserted by the same query.
+
+            by_edge_col = defaultdict(dict)
+            for from_node, edge_col, to_node in chunk:
+                by_edge_col[edge_col][(from_node['_id'], to_node['_id'])] = dict(_from=from_node['_id'],
+                                                                                 _to=to_node['_id'])
+
+            for edge_col, rels in by_edge_col.items():
+                rels = list(rels.values())
+                created = len(list(self.query(query, bind_vars={
+                    'rels': rels,
+                    '@edge_name': edge_col
+                })))
+
+                if present is True:
+                    self.count_ensure('created', created)
+                    self.count_ensure('unchanged', len(rels) - created)
@@ -0,0 +1,211 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from hashlib import sha1
+from itertools import zip_longest
+from collections import Counter
+
+from imnetdb.db.dump import read_manifest, iter_export_docs
+
+__all__ = [
+    'doc_hash', 'diff_docs', 'diff_collection', 'iter_diff', 'diff_summary',
+    'ExportSource', 'LiveSource'
+]
+
+
+# document fields that are not part of the document content
+
+_META_FIELDS = ('_id', '_rev')
+
+
+def doc_hash(doc):
+    """
+    Return the content hash of a document, ignoring the _id and _rev fields.
+    """
+    content = {field: value for field, value in doc.items() if field not in _META_FIELDS}
+    return sha1(json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def diff_docs(old_doc, new_doc):
+    """
+    Return the sorted list of the top-level fields that are added, removed, or changed between two
+    versions of a document, ignoring the _id and _rev fields.
+    """
+    fields = (old_doc.keys() | new_doc.keys()) - set(_META_FIELDS)
+    return sorted(field for field in fields if old_doc.get(field, ...) != new_doc.get(field, ...))
+
+
+class ExportSource(object):
+    """
+    The documents of an export directory created by :meth:`IMNetDB.export`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        manifest = read_manifest(path)
+        self._col_names = [col_info['name'] for col_info in manifest['collections']]
+
+    def collections(self):
+        return list(self._col_names)
+
+    def iter_docs(self, col_name):
+        if col_name not in self._col_names:
+            return iter(())
+        return iter_export_docs(self.path, col_name)
+
+
+class LiveSource(object):
+    """
+    The documents of a live database, read in the same order as an export.
+    """
+
+    _query_docs = """
+    FOR doc IN @@col_name
+        SORT doc._key
+        RETURN UNSET(doc, '_id', '_rev')
+    """
+
+    def __init__(self, client, batch_size=10000):
+        self.client = client
+        self.batch_size = batch_size
+
+    def collections(self):
+        return [col_prop['name'] for col_prop in self.client.db.collections() if not col_prop['system']]
+
+    def iter_docs(self, col_name):
+        if not self.client.db.has_collection(col_name):
+            return iter(())
+        return self.client.query(self._query_docs, batch_size=self.batch_size, stream=True,
+                                 bind_vars={'@col_name': col_name})
+
+
+def _as_source(source):
+    if isinstance(source, (ExportSource, LiveSource)):
+        return source
+    if isinstance(source, str):
+        return ExportSource(source)
+    return LiveSource(source)
+
+
+def _compare(old_doc, new_doc):
+    if doc_hash(old_doc) != doc_hash(new_doc):
+        return dict(change='changed', key=new_doc['_key'], fields=diff_docs(old_doc, new_doc))
+    return None
+
+
+def diff_collection(old_docs, new_docs):
+    """
+    Join two document streams on _key, and yield the differences.
+
+    The streams are read in step, and a document is held in memory only until the document of the
+    same _key is read from the other stream.  Streams in the same order, such as an export and the
+    live database both ordered by _key on the server, therefore hold only the documents that
+    differ.  The join does not depend on the order, since the server orders the _key values by its
+    string collation, which is not the Python string order; streams in a different order only use
+    more memory.
+
+    Parameters
+    ----------
+    old_docs : Iterable[dict]
+        The documents of the "before" state
+
+    new_docs : Iterable[dict]
+        The documents of the "after" state
+
+    Yields
+    ------
+    dict
+        change: one of 'added', 'removed', 'changed'
+        key: the document _key
+        fields: for 'changed', the list of changed fields
+    """
+    pending_old, pending_new = dict(), dict()
+
+    for old_doc, new_doc in zip_longest(old_docs, new_docs):
+        if old_doc is not None:
+            key = old_doc['_key']
+            if key in pending_new:
+                change = _compare(old_doc, pending_new.pop(key))
+                if change:
+                    yield change
+            else:
+                pending_old[key] = old_doc
+
+        if new_doc is not None:
+            key = new_doc['_key']
+            if key in pending_old:
+                change = _compare(pending_old.pop(key), new_doc)
+                if change:
+                    yield change
+            else:
+                pending_new[key] = new_doc
+
+    for key in sorted(pending_old):
+        yield dict(change='removed', key=key)
+
+    for key in sorted(pending_new):
+        yield dict(change='added', key=key)
+
+
+def iter_diff(old, new, collections=None):
+    """
+    Yield the differences between two database states.  Each state is either the path of an
+    export directory, or a database client for the live database.
+
+    Parameters
+    ----------
+    old : str|CommonDBClient
+        The "before" state
+
+    new : str|CommonDBClient
+        The "after" state
+
+    collections : Iterable[str] (optional)
+        The collection names to compare, by default every collection of either state
+
+    Yields
+    ------
+    tuple
+        (collection name, change dict); see :func:`diff_collection`
+    """
+    old, new = _as_source(old), _as_source(new)
+
+    if collections is None:
+        collections = sorted(set(old.collections()) | set(new.collections()))
+
+    for col_name in collections:
+        for change in diff_collection(old.iter_docs(col_name), new.iter_docs(col_name)):
+            yield col_name, change
+
+
+def diff_summary(old, new, collections=None):
+    """
+    Return the summary of the differences between two database states; see :func:`iter_diff`.
+
+    Returns
+    -------
+    dict
+        collection name -> dict(added, removed, changed, fields) where added, removed, and changed
+        are the counts of documents, and fields is a Counter of the changed field names.  Only the
+        collections with differences are included.
+    """
+    summary = dict()
+
+    for col_name, change in iter_diff(old, new, collections=collections):
+        col_summary = summary.setdefault(col_name, dict(added=0, removed=0, changed=0, fields=Counter()))
+        col_summary[change['change']] += 1
+        col_summary['fields'].update(change.get('fields', ()))
+
+    return summary
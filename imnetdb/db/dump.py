@@ -0,0 +1,244 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from imnetdb.db.common_client import chunked
+
+__all__ = [
+    'export_database', 'import_database',
+    'read_manifest', 'iter_export_docs',
+    'MANIFEST_NAME', 'EXPORT_FORMAT', 'EXPORT_ORDER'
+]
+
+
+MANIFEST_NAME = 'manifest.json'
+EXPORT_FORMAT = 1
+
+# the documents of each collection are exported ordered by _key.  The sort is served by the
+# primary index, so the server streams the documents without first sorting the collection.  The
+# order is that of the server string collation, not the Python string order, so readers must not
+# rely on the Python order of the _key values.
+
+EXPORT_ORDER = 'key'
+
+# index types that are recreated on import; other index types (geo, inverted, ...) are not used
+# by the database model and are not exported.
+
+_PERSISTENT_INDEX_TYPES = ('persistent', 'hash', 'skiplist')
+
+
+def _collection_file(col_name):
+    return f'{col_name}.jsonl.gz'
+
+
+def read_manifest(path):
+    """
+    Return the manifest dict of an export directory.
+    """
+    with open(os.path.join(path, MANIFEST_NAME)) as ifile:
+        return json.load(ifile)
+
+
+def iter_export_docs(path, col_name):
+    """
+    Yield the documents of one collection of an export directory, in file order; see
+    EXPORT_ORDER.
+    """
+    with gzip.open(os.path.join(path, _collection_file(col_name)), 'rt') as ifile:
+        for line in ifile:
+            yield json.loads(line)
+
+
+def _export_indexes(col):
+    indexes = list()
+    for index in col.indexes():
+        if index['type'] in _PERSISTENT_INDEX_TYPES:
+            indexes.append(dict(type='persistent', fields=index['fields'], name=index.get('name'),
+                                unique=index.get('unique', False), sparse=index.get('sparse', False)))
+        elif index['type'] == 'ttl':
+            indexes.append(dict(type='ttl', fields=index['fields'], name=index.get('name'),
+                                expiry_time=index['expiry_time']))
+    return indexes
+
+
+_query_export_docs = """
+FOR doc IN @@col_name
+    SORT doc._key
+    RETURN UNSET(doc, '_id', '_rev')
+"""
+
+
+def _export_collection(client, path, col_info, batch_size, compresslevel):
+    count = 0
+    with gzip.open(os.path.join(path, _collection_file(col_info['name'])), 'wt',
+                   compresslevel=compresslevel) as ofile:
+        for doc in client.query(_query_export_docs, batch_size=batch_size, stream=True,
+                                bind_vars={'@col_name': col_info['name']}):
+            ofile.write(json.dumps(doc, separators=(',', ':')))
+            ofile.write('\n')
+            count += 1
+
+    return count
+
+
+def export_database(client, path, max_workers=4, batch_size=10000, compresslevel=6):
+    """
+    Export every (non-system) collection of the client database, including the resource pool
+    collections and the edge collections, to gzip compressed JSONL files, one per collection, in
+    the `path` directory.  The collections are exported in parallel.  A manifest.json file records
+    the collections, their indexes, and the graph definitions.
+
+    Parameters
+    ----------
+    client : CommonDBClient
+        The database client
+
+    path : str
+        The export directory; created if it does not exist
+
+    max_workers : int (optional)
+        The number of collections exported concurrently
+
+    batch_size : int (optional)
+        The number of documents fetched from the server per request
+
+    compresslevel : int (optional)
+        The gzip compression level
+
+    Returns
+    -------
+    dict
+        The manifest
+    """
+    os.makedirs(path, exist_ok=True)
+
+    collections = list()
+    for col_prop in client.db.collections():
+        if col_prop['system']:
+            continue
+
+        col = client.db.collection(col_prop['name'])
+        collections.append(dict(name=col_prop['name'], edge=col_prop['type'] == 'edge',
+                                file=_collection_file(col_prop['name']), indexes=_export_indexes(col)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = executor.map(lambda col_info: _export_collection(client, path, col_info, batch_size,
+                                                                  compresslevel), collections)
+        for col_info, count in zip(collections, counts):
+            col_info['count'] = count
+
+    graphs = [dict(name=graph['name'], edge_definitions=client.db.graph(graph['name']).edge_definitions())
+              for graph in client.db.graphs()]
+
+    manifest = dict(format=EXPORT_FORMAT, order=EXPORT_ORDER, db_name=client.db_name,
+                    collections=collections, graphs=graphs)
+
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as ofile:
+        json.dump(manifest, ofile, indent=2)
+
+    return manifest
+
+
+def _drop_indexes(col):
+    for index in col.indexes():
+        if index['type'] in _PERSISTENT_INDEX_TYPES or index['type'] == 'ttl':
+            col.delete_index(index['id'].rpartition('/')[2])
+
+
+def _import_collection(client, path, col_info, chunk_size, truncate):
+    col_name = col_info['name']
+    if client.db.has_collection(col_name):
+        col = client.db.collection(col_name)
+        if truncate:
+            col.truncate()
+
+        # the indexes of an empty collection are created after the load, rather than updated for
+        # each document loaded; a populated collection keeps its indexes.
+
+        if col.count() == 0:
+            _drop_indexes(col)
+    else:
+        col = client.db.create_collection(col_name, edge=col_info['edge'])
+
+    count = 0
+    for docs in chunked(iter_export_docs(path, col_name), chunk_size):
+        col.import_bulk(docs, on_duplicate='replace', halt_on_error=True, details=False)
+        count += len(docs)
+
+    return count
+
+
+def _import_indexes(client, col_info):
+    col = client.db.collection(col_info['name'])
+    for index in col_info['indexes']:
+        if index['type'] == 'ttl':
+            col.add_ttl_index(fields=index['fields'], expiry_time=index['expiry_time'], name=index['name'])
+        else:
+            col.add_persistent_index(fields=index['fields'], unique=index['unique'], sparse=index['sparse'],
+                                     name=index['name'])
+
+
+def import_database(client, path, max_workers=4, chunk_size=10000, truncate=False):
+    """
+    Import an export directory, created by :func:`export_database`, into the client database.
+    Each collection is loaded, in parallel, using the ArangoDB bulk import API; documents keep
+    their _key (and edges their _from/_to) values, and replace any existing document of the same
+    _key.  The persistent and ttl indexes of the collections that are empty before the load are
+    dropped, and the exported indexes are created after the documents are loaded.  Then any
+    missing graphs are created.
+
+    Parameters
+    ----------
+    client : CommonDBClient
+        The database client
+
+    path : str
+        The export directory
+
+    max_workers : int (optional)
+        The number of collections imported concurrently
+
+    chunk_size : int (optional)
+        The number of documents sent to the server per bulk import request
+
+    truncate : bool (optional)
+        When True, existing collections are emptied before they are loaded
+
+    Returns
+    -------
+    dict
+        collection name -> number of documents imported
+    """
+    manifest = read_manifest(path)
+    if manifest.get('format') != EXPORT_FORMAT:
+        raise ValueError(f'unsupported export format: {manifest.get("format")}')
+
+    collections = manifest['collections']
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = list(executor.map(lambda col_info: _import_collection(client, path, col_info, chunk_size,
+                                                                       truncate), collections))
+
+    for col_info in collections:
+        _import_indexes(client, col_info)
+
+    for graph in manifest['graphs']:
+        if not client.db.has_graph(graph['name']):
+            client.db.create_graph(graph['name'], edge_definitions=graph['edge_definitions'])
+
+    return {col_info['name']: count for col_info, count in zip(collections, counts)}
@@ -0,0 +1,274 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from imnetdb.db.snapshot import GraphSnapshot
+
+__all__ = ['FabricTopology']
+
+
+# the adjacency and endpoint flags of the topology being analyzed by a worker process; set once
+# per process by _init_worker so that they are not pickled for each chunk of sources.
+
+_worker_topology = None
+
+
+def _init_worker(adjacency, is_endpoint):
+    global _worker_topology
+    _worker_topology = (adjacency, is_endpoint)
+
+
+def _run_worker(sources):
+    return _analyze_sources(*_worker_topology, sources)
+
+
+def _analyze_sources(adjacency, is_endpoint, sources):
+    """
+    Run a breadth-first search from each source device, counting the shortest paths to every other
+    device, and then accumulate (as Brandes' betweenness algorithm does) the shortest paths to the
+    endpoint devices that pass through each device and each link.  Only the endpoint targets with a
+    higher index than the source are counted, so that each endpoint pair is counted once.
+
+    Returns
+    -------
+    tuple
+        pairs: dict of (source, target) -> (hops, path count)
+        device_paths, device_share: per-device lists of the paths, and the sum of the per-pair
+            fraction of paths, passing through the device
+        link_paths, link_share: same as above, per-link dicts
+    """
+    device_count = len(adjacency)
+    pairs = dict()
+    device_paths, device_share = [0] * device_count, [0.0] * device_count
+    link_paths, link_share = defaultdict(int), defaultdict(float)
+
+    for source in sources:
+        dist, sigma = [-1] * device_count, [0] * device_count
+        dist[source], sigma[source] = 0, 1
+        order, queue = list(), deque([source])
+
+        while queue:
+            dev = queue.popleft()
+            order.append(dev)
+            next_dist, dev_sigma = dist[dev] + 1, sigma[dev]
+
+            for peer, _link in adjacency[dev]:
+                if dist[peer] < 0:
+                    dist[peer] = next_dist
+                    queue.append(peer)
+                if dist[peer] == next_dist:
+                    sigma[peer] += dev_sigma
+
+        # count[dev]: shortest paths from dev onward to the targets; delta[dev]: the sum over the
+        # targets of the fraction of their shortest paths from the source that pass through dev.
+
+        count, delta = [0] * device_count, [0.0] * device_count
+
+        for dev in reversed(order[1:]):
+            is_target = 1 if is_endpoint[dev] and dev > source else 0
+            if is_target:
+                pairs[(source, dev)] = (dist[dev], sigma[dev])
+
+            device_paths[dev] += sigma[dev] * count[dev]
+            device_share[dev] += delta[dev]
+
+            onward_paths, onward_share = is_target + count[dev], (is_target + delta[dev]) / sigma[dev]
+            prev_dist = dist[dev] - 1
+
+            for peer, link in adjacency[dev]:
+                if dist[peer] == prev_dist:
+                    share = sigma[peer] * onward_share
+                    count[peer] += onward_paths
+                    delta[peer] += share
+                    link_paths[link] += sigma[peer] * onward_paths
+                    link_share[link] += share
+
+    return pairs, device_paths, device_share, link_paths, link_share
+
+
+class FabricTopology(object):
+    """
+    The physical device topology of the fabric, built from the cabled Device/Interface/Cable/LAG
+    model, for shortest-path (ECMP) and single-failure analysis.
+
+    Each cable between two devices is a link.  The cables between two LAGs are bundled into a
+    single link, since a LAG is one logical (and one ECMP) next-hop; cables where either interface
+    is not a LAG member remain separate (parallel) links.
+    """
+
+    SNAPSHOT_ATTRIBUTES = ('name',)
+
+    def __init__(self, snapshot):
+        """
+        Build the topology from a graph snapshot.
+
+        Parameters
+        ----------
+        snapshot : GraphSnapshot
+            A snapshot with the Device, Interface, Cable, and LAG vertices and the equip_interface,
+            cabled, and lag_member edges.  The 'name' attribute is used as the device name.
+        """
+        self.device_names = list()
+        self.links = list()
+
+        # device index -> list of (peer device index, link index); a pair of devices connected
+        # by N parallel links has N entries.
+        self.adjacency = list()
+
+        self._build(snapshot)
+        self._device_index = {name: dev for dev, name in enumerate(self.device_names)}
+
+    @classmethod
+    def load(cls, db, batch_size=10000):
+        """
+        Build the topology from the database, using a snapshot of the database graph.
+
+        Parameters
+        ----------
+        db : IMNetDB
+            The instance of the database
+
+        batch_size : int (optional)
+            The number of documents fetched from the server per request
+
+        Returns
+        -------
+        FabricTopology
+        """
+        return cls(GraphSnapshot.load(db, attributes=cls.SNAPSHOT_ATTRIBUTES, batch_size=batch_size))
+
+    def _build(self, snapshot):
+        dev_of_vid = dict()
+        for dev, vid in enumerate(snapshot.vertices('Device')):
+            dev_of_vid[vid] = dev
+            self.device_names.append(snapshot.vertex(vid)['name'])
+            self.adjacency.append(list())
+
+        bundles = defaultdict(list)
+
+        for cable_vid in snapshot.vertices('Cable'):
+            if_vids = snapshot.neighbors(cable_vid, 'cabled', direction='inbound')
+            if len(if_vids) != 2:
+                continue
+
+            ends = list()
+            for if_vid in if_vids:
+                dev_vid = next(iter(snapshot.neighbors(if_vid, 'equip_interface', direction='inbound')), None)
+                lag_vid = next(iter(snapshot.neighbors(if_vid, 'lag_member', direction='outbound')), None)
+                ends.append((dev_of_vid.get(dev_vid), lag_vid))
+
+            (dev_a, lag_a), (dev_b, lag_b) = ends
+            if dev_a is None or dev_b is None or dev_a == dev_b:
+                continue
+
+            cable_id = snapshot.doc_id(cable_vid)
+
+            if lag_a is None or lag_b is None:
+                self._add_link(dev_a, dev_b, cable_id, [cable_id])
+                continue
+
+            if dev_a > dev_b:
+                (dev_a, lag_a), (dev_b, lag_b) = (dev_b, lag_b), (dev_a, lag_a)
+
+            bundles[(dev_a, dev_b, lag_a, lag_b)].append(cable_id)
+
+        for (dev_a, dev_b, lag_a, lag_b), cable_ids in bundles.items():
+            self._add_link(dev_a, dev_b, (snapshot.doc_id(lag_a), snapshot.doc_id(lag_b)), cable_ids)
+
+    def _add_link(self, dev_a, dev_b, link_id, cable_ids):
+        link = len(self.links)
+        self.links.append(dict(link_id=link_id, devices=(self.device_names[dev_a], self.device_names[dev_b]),
+                               cables=cable_ids))
+        self.adjacency[dev_a].append((dev_b, link))
+        self.adjacency[dev_b].append((dev_a, link))
+
+    def analyze(self, endpoints=None, processes=None):
+        """
+        Compute, for every pair of endpoint devices, the number of equal-cost (shortest) paths, and
+        for each device and link the number of those paths that a single failure would remove.
+
+        Parameters
+        ----------
+        endpoints : Iterable[str] (optional)
+            The names of the endpoint devices, for example the leaf switches.  By default all of
+            the devices are endpoints.
+
+        processes : int (optional)
+            The number of worker processes used to run the per-source searches.  By default the
+            searches are run in this process.
+
+        Returns
+        -------
+        dict
+            pairs: dict of (device_name, device_name) -> dict(hops, paths); hops is None, and paths
+                is 0, when the devices are not connected.
+            devices: list of dict(device, paths, share) sorted by paths removed, most first
+            links: list of dict(link_id, devices, cables, paths, share) sorted by paths removed,
+                most first
+
+            where `paths` is the number of endpoint shortest paths that pass through the device,
+            or link, and `share` is the sum over the endpoint pairs of the fraction of the pair's
+            shortest paths that are removed.  A device is not counted as a failure of the pairs
+            where it is an endpoint.
+        """
+        if endpoints is None:
+            sources = list(range(len(self.device_names)))
+        else:
+            sources = sorted(self._device_index[name] for name in endpoints)
+
+        is_endpoint = [False] * len(self.device_names)
+        for dev in sources:
+            is_endpoint[dev] = True
+
+        if processes:
+            chunks = [sources[offset::processes * 4] for offset in range(processes * 4)]
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                     initargs=(self.adjacency, is_endpoint)) as executor:
+                results = list(executor.map(_run_worker, chunks))
+        else:
+            results = [_analyze_sources(self.adjacency, is_endpoint, sources)]
+
+        pairs = dict()
+        device_paths, device_share = [0] * len(self.device_names), [0.0] * len(self.device_names)
+        link_paths, link_share = [0] * len(self.links), [0.0] * len(self.links)
+
+        for r_pairs, r_device_paths, r_device_share, r_link_paths, r_link_share in results:
+            pairs.update(r_pairs)
+            for dev, paths in enumerate(r_device_paths):
+                device_paths[dev] += paths
+                device_share[dev] += r_device_share[dev]
+            for link, paths in r_link_paths.items():
+                link_paths[link] += paths
+                link_share[link] += r_link_share[link]
+
+        names = self.device_names
+        pair_paths = dict()
+        for source, target in combinations(sources, 2):
+            hops, paths = pairs.get((source, target), (None, 0))
+            pair_paths[(names[source], names[target])] = dict(hops=hops, paths=paths)
+
+        devices = [dict(device=names[dev], paths=device_paths[dev], share=device_share[dev])
+                   for dev in range(len(names))]
+
+        links = [dict(self.links[link], paths=link_paths[link], share=link_share[link])
+                 for link in range(len(self.links))]
+
+        return dict(
+            pairs=pair_paths,
+            devices=sorted(devices, key=lambda item: item['paths'], reverse=True),
+            links=sorted(links, key=lambda item: item['paths'], reverse=True)
+        )
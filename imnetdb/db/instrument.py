@@ -0,0 +1,373 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from time import perf_counter
+
+__all__ = [
+    'CallRecord', 'QueryStats', 'Instrumentation', 'InstrumentedDatabase',
+    'MeteredHTTPClient'
+]
+
+
+CallRecord = namedtuple('CallRecord', [
+    'handler',          # the handler method that made the call, e.g. "InterfaceNodes.ensure"
+    'entry',            # the imnetdb method called by the application, e.g. "IMNetDB.apply"
+    'op',               # "aql", or the collection method, e.g. "collection.insert"
+    'target',           # the AQL query text, or the collection name
+    'bind_vars',        # the AQL bind vars, or None
+    'wall_time',        # seconds, measured in the client
+    'server_time',      # seconds, the server execution time reported for AQL, or None
+    'bind_size',        # bytes of the JSON encoded bind vars
+    'rows',             # the number of rows of the (first batch of the) result
+    'has_more',         # True when a cursor has more batches to fetch
+    'bytes',            # bytes of the HTTP response bodies received
+    'profile',          # the AQL profile, for slow calls when profile capture is enabled
+])
+
+
+# -----------------------------------------------------------------------------
+# response byte metering
+# -----------------------------------------------------------------------------
+
+_meter = threading.local()
+
+
+def _received_bytes():
+    return getattr(_meter, 'bytes', 0)
+
+
+def _body_size(response):
+    # the raw_body is the decoded text of the body, so prefer the Content-Length of the response,
+    # that is the bytes received, and otherwise count the bytes of the UTF-8 encoded text.
+
+    length = response.headers.get('Content-Length') if response.headers else None
+    if length is not None:
+        return int(length)
+
+    body = response.raw_body or ''
+    return len(body.encode('utf-8')) if isinstance(body, str) else len(body)
+
+
+class MeteredHTTPClient(object):
+    """
+    A python-arango HTTP client that delegates to another HTTP client, and counts the bytes of the
+    response bodies received by each thread, so that instrumentation can report the bytes
+    transferred by each call.  Responses are only counted during an instrumented call.
+
+    python-arango binds the HTTP client into each database connection when the database object is
+    created, so the client is installed when the client connects rather than by instrument();
+    when the client is not instrumented it only delegates.
+    """
+
+    def __init__(self, http_client):
+        self.http_client = http_client
+
+    def __getattr__(self, name):
+        return getattr(self.http_client, name)
+
+    @property
+    def request_timeout(self):
+        return self.http_client.request_timeout
+
+    @request_timeout.setter
+    def request_timeout(self, value):
+        self.http_client.request_timeout = value
+
+    def send_request(self, *args, **kwargs):
+        response = self.http_client.send_request(*args, **kwargs)
+        if getattr(_meter, 'active', 0):
+            _meter.bytes = _received_bytes() + _body_size(response)
+        return response
+
+
+# -----------------------------------------------------------------------------
+# aggregated statistics
+# -----------------------------------------------------------------------------
+
+class QueryStats(object):
+    """
+    An instrumentation hook that aggregates the call records by (handler, op), with a histogram of
+    the wall times.
+    """
+
+    # histogram bucket upper bounds, in milliseconds; the last bucket is everything slower.
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self._stats = dict()
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            stats = self._stats.get((record.handler, record.op))
+            if stats is None:
+                stats = self._stats[(record.handler, record.op)] = dict(
+                    count=0, wall_total=0.0, wall_max=0.0, server_total=0.0,
+                    rows=0, bytes=0, bind_size=0, histogram=[0] * (len(self.BUCKETS_MS) + 1))
+
+            stats['count'] += 1
+            stats['wall_total'] += record.wall_time
+            stats['wall_max'] = max(stats['wall_max'], record.wall_time)
+            stats['server_total'] += record.server_time or 0.0
+            stats['rows'] += record.rows
+            stats['bytes'] += record.bytes
+            stats['bind_size'] += record.bind_size
+            stats['histogram'][bisect_left(self.BUCKETS_MS, record.wall_time * 1000)] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+    def as_dict(self):
+        """
+        Return a dict of (handler, op) -> dict of the aggregated values: count, wall_total,
+        wall_max, server_total (seconds), rows, bytes, bind_size, and histogram (the counts per
+        BUCKETS_MS bucket, plus the count slower than the last bucket).
+        """
+        with self._lock:
+            return {key: dict(stats, histogram=list(stats['histogram'])) for key, stats in self._stats.items()}
+
+    def report(self, limit=None):
+        """
+        Return the aggregated statistics as a text table, slowest total wall time first.
+
+        Parameters
+        ----------
+        limit : int (optional)
+            The maximum number of (handler, op) rows to include
+
+        Returns
+        -------
+        str
+        """
+        items = sorted(self.as_dict().items(), key=lambda item: item[1]['wall_total'], reverse=True)[:limit]
+        bounds = [f'<={bound}ms' for bound in self.BUCKETS_MS] + [f'>{self.BUCKETS_MS[-1]}ms']
+
+        lines = [f'{"handler":40} {"op":24} {"count":>7} {"total ms":>10} {"mean ms":>9} {"max ms":>9} '
+                 f'{"server ms":>10} {"rows":>9} {"KB":>9}']
+
+        for (handler, op), stats in items:
+            lines.append(
+                f'{handler:40} {op:24} {stats["count"]:7d} {stats["wall_total"] * 1000:10.1f} '
+                f'{stats["wall_total"] * 1000 / stats["count"]:9.2f} {stats["wall_max"] * 1000:9.2f} '
+                f'{stats["server_total"] * 1000:10.1f} {stats["rows"]:9d} {stats["bytes"] / 1024:9.1f}')
+            counts = zip(bounds, stats['histogram'])
+            lines.append('    ' + ' '.join(f'{bound}:{count}' for bound, count in counts if count))
+
+        return '\n'.join(lines)
+
+
+# -----------------------------------------------------------------------------
+# instrumentation
+# -----------------------------------------------------------------------------
+
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _frame_name(frame):
+    self_obj = frame.f_locals.get('self')
+    owner = type(self_obj).__name__ if self_obj is not None else frame.f_globals.get('__name__')
+    return f'{owner}.{frame.f_code.co_name}'
+
+
+def _caller_handler():
+    """
+    Return the names of the innermost and the outermost imnetdb functions on the call stack.  The
+    innermost is the handler method that made the call, for example "InterfaceNodes.ensure"; the
+    outermost is the entry point called by the application, for example "IMNetDB.apply", that may
+    have called many handlers.
+
+    Returns
+    -------
+    tuple
+        (handler, entry)
+    """
+    handler, entry = None, None
+    frame = sys._getframe(2)
+
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PACKAGE_DIR) and filename != _THIS_FILE:
+            entry = frame
+            if handler is None:
+                handler = frame
+        elif entry is not None:
+            break
+        frame = frame.f_back
+
+    if handler is None:
+        return '<application>', '<application>'
+
+    return _frame_name(handler), _frame_name(entry)
+
+
+def _result_rows(result):
+    # a cursor: the rows of the batch fetched by the call
+    batch = getattr(result, 'batch', None)
+    if callable(batch):
+        return len(batch()), bool(result.has_more())
+    if isinstance(result, (list, tuple)):
+        return len(result), False
+    return (0 if result is None or isinstance(result, bool) else 1), False
+
+
+class Instrumentation(object):
+    """
+    Records each AQL execution, and each collection method call, made through an instrumented
+    client database (see :meth:`CommonDBClient.instrument`), and passes a :class:`CallRecord` to
+    each of the hooks.  The :attr:`stats` hook, a :class:`QueryStats`, is always installed.
+    """
+
+    def __init__(self, hooks=None, slow_threshold=None, capture_profile=False, profile_level=1):
+        """
+        Parameters
+        ----------
+        hooks : list[callable] (optional)
+            Callables that are each called with the CallRecord of every call
+
+        slow_threshold : float (optional)
+            The wall time, in seconds, over which a call is slow
+
+        capture_profile : bool (optional)
+            When True, AQL queries are run with profiling enabled, and the profile of the slow
+            queries is included in their CallRecord.  Requires a slow_threshold.
+
+        profile_level : int (optional)
+            The ArangoDB profile level; 1 for the query phase timings, 2 to include the
+            per-execution-node statistics
+        """
+        self.stats = QueryStats()
+        self.hooks = [self.stats] + list(hooks or [])
+        self.slow_threshold = slow_threshold
+        self.capture_profile = capture_profile and slow_threshold is not None
+        self.profile_level = profile_level
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def wrap(self, db):
+        return InstrumentedDatabase(db, self)
+
+    def is_slow(self, wall_time):
+        return self.slow_threshold is not None and wall_time >= self.slow_threshold
+
+    def call(self, op, target, func, args, kwargs, bind_vars=None):
+        handler, entry = _caller_handler()
+        start_bytes = _received_bytes()
+        _meter.active = getattr(_meter, 'active', 0) + 1
+        start = perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            wall_time = perf_counter() - start
+            _meter.active -= 1
+
+        rows, has_more = _result_rows(result)
+        server_time, profile = None, None
+
+        if op == 'aql':
+            statistics = result.statistics() or dict()
+            server_time = statistics.get('execution_time')
+            if self.capture_profile and self.is_slow(wall_time):
+                profile = result.profile()
+
+        record = CallRecord(
+            handler=handler, entry=entry, op=op, target=target, bind_vars=bind_vars, wall_time=wall_time,
+            server_time=server_time,
+            bind_size=len(json.dumps(bind_vars, default=str)) if bind_vars else 0,
+            rows=rows, has_more=has_more, bytes=_received_bytes() - start_bytes, profile=profile)
+
+        for hook in self.hooks:
+            hook(record)
+
+        return result
+
+
+class _InstrumentedAQL(object):
+
+    def __init__(self, aql, instrumentation):
+        self.wrapped = aql
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def execute(self, query, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation.capture_profile and 'profile' not in kwargs:
+            kwargs['profile'] = instrumentation.profile_level
+
+        return instrumentation.call('aql', query, self.wrapped.execute, (query,), kwargs,
+                                    bind_vars=kwargs.get('bind_vars'))
+
+
+class _InstrumentedCollection(object):
+
+    def __init__(self, col, instrumentation):
+        self.wrapped = col
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def instrumented(*args, **kwargs):
+            return self.instrumentation.call(f'collection.{name}', self.wrapped.name, attr, args, kwargs)
+
+        return instrumented
+
+    def __iter__(self):
+        return iter(self.wrapped)
+
+    def __len__(self):
+        return len(self.wrapped)
+
+    def __contains__(self, document):
+        return document in self.wrapped
+
+
+class InstrumentedDatabase(object):
+    """
+    A proxy of a python-arango database whose AQL executions and collection method calls are
+    recorded by the instrumentation.  All other attributes are those of the wrapped database.
+    """
+
+    def __init__(self, db, instrumentation):
+        self.wrapped = db
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    @property
+    def aql(self):
+        return _InstrumentedAQL(self.wrapped.aql, self.instrumentation)
+
+    def collection(self, name):
+        return _InstrumentedCollection(self.wrapped.collection(name), self.instrumentation)
+
+    def begin_transaction(self, *args, **kwargs):
+        return InstrumentedDatabase(self.wrapped.begin_transaction(*args, **kwargs), self.instrumentation)
@@ -12,9 +12,134 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import heapq
+from copy import deepcopy
+from string import Template
+from itertools import groupby
+from collections import Counter, OrderedDict
+from operator import itemgetter
 from ipaddress import ip_address, ip_interface, ip_network
 from first import first
 from imnetdb.db.collection import NameKeyCollection, TupleKeyCollection, CommonNodeGroup
+from imnetdb.db.common_client import chunked, DEFAULT_CHUNK_SIZE
+from imnetdb.db.lpm import RoutingTableLPM
+
+
+# IP range values are stored as fixed width hex strings so that they sort, and compare, the same
+# as the numeric values for both IPv4 and IPv6; the IPv6 values do not fit into a JSON number.
+
+_IP_HEX_WIDTH = {4: 8, 6: 32}
+
+IP_NODE_COLLECTIONS = ('IPAddress', 'IPInterface', 'IPNetwork')
+
+
+def ip_value_fields(ip_value):
+    """
+    Return the indexed fields stored in IP nodes for the given IP value.  An IP address is a range
+    of itself, an IP interface is the range of its network, and an IP network is its own range.
+    IP address and IP interface values also store the host address.
+
+    Parameters
+    ----------
+    ip_value : IPv4Address|IPv6Address|IPv4Interface|IPv6Interface|IPv4Network|IPv6Network
+        The IP value
+
+    Returns
+    -------
+    dict
+        ip_start: str - fixed width hex value of the first address in the range
+        ip_end: str - fixed width hex value of the last address in the range
+        ip_host: str - fixed width hex value of the host address, not for IP networks
+    """
+    width = _IP_HEX_WIDTH[ip_value.version]
+    net = getattr(ip_value, 'network', ip_value)
+
+    if hasattr(net, 'network_address'):
+        start, end = int(net.network_address), int(net.broadcast_address)
+    else:
+        start = end = int(net)
+
+    fields = dict(ip_start=format(start, f'0{width}x'), ip_end=format(end, f'0{width}x'))
+
+    if not hasattr(ip_value, 'network_address'):
+        fields['ip_host'] = format(int(ip_value), f'0{width}x')
+
+    return fields
+
+
+# when IP nodes have the same range, a network is ordered before an interface before an address.
+
+_SWEEP_COLLECTION_ORDER = {'IPNetwork': 0, 'IPInterface': 1, 'IPAddress': 2}
+
+
+def _sweep_group_key(ip_node):
+    return (ip_node['ip_end'], -_SWEEP_COLLECTION_ORDER[ip_node['_id'].partition('/')[0]])
+
+
+def sweep_ip_conflicts(ip_nodes):
+    """
+    Find the conflicts between IP nodes, of the same routing table, in a single sweep-line pass.
+    The conflicts found are:
+        'duplicate': the same IP value more than once in a collection
+        'overlap': IPInterface networks that overlap but are not the same network
+        'outside': an IPInterface that is not within any IPNetwork
+
+    Parameters
+    ----------
+    ip_nodes : Iterable[dict]
+        The IP nodes, with at least the fields _id, name, version, ip_start and ip_end, sorted
+        by (version, ip_start, ip_end).
+
+    Yields
+    ------
+    dict
+        conflict: str - the conflict type, as described
+        nodes: list[dict] - the IP nodes in conflict
+    """
+    version = None
+    net_stack, if_stack = list(), list()
+
+    for (ip_version, ip_start), group in groupby(ip_nodes, key=itemgetter('version', 'ip_start')):
+
+        if ip_version != version:
+            version = ip_version
+            net_stack, if_stack = list(), list()
+
+        group = list(group)
+
+        names = Counter((ip_node['_id'].partition('/')[0], ip_node['name']) for ip_node in group)
+        for (col_name, name), count in names.items():
+            if count > 1:
+                yield dict(conflict='duplicate',
+                           nodes=[ip_node for ip_node in group
+                                  if ip_node['name'] == name and ip_node['_id'].startswith(col_name + '/')])
+
+        # the larger ranges, which may contain the smaller ranges, are processed first.
+
+        for ip_node in sorted(group, key=_sweep_group_key, reverse=True):
+            col_name = ip_node['_id'].partition('/')[0]
+
+            while net_stack and net_stack[-1]['ip_end'] < ip_start:
+                net_stack.pop()
+
+            while if_stack and if_stack[-1]['ip_end'] < ip_start:
+                if_stack.pop()
+
+            if col_name == 'IPNetwork':
+                net_stack.append(ip_node)
+
+            elif col_name == 'IPInterface':
+                if not (net_stack and net_stack[-1]['ip_end'] >= ip_node['ip_end']):
+                    yield dict(conflict='outside', nodes=[ip_node])
+
+                # prefixes either nest or are disjoint, so any remaining stacked interface overlaps
+                # this one; it is the same network only if both ends are the same.
+
+                if if_stack and (if_stack[-1]['ip_start'], if_stack[-1]['ip_end']) != (ip_start, ip_node['ip_end']):
+                    yield dict(conflict='overlap', nodes=[if_stack[-1], ip_node])
+
+                if_stack.append(ip_node)
 
 
 class RoutingTableNodes(NameKeyCollection, CommonNodeGroup):
@@ -27,20 +152,20 @@ class RoutingTableNodes(NameKeyCollection, CommonNodeGroup):
 
     _query_members = """
     LET rt = DOCUMENT('RoutingTable', @rt_name)
-    
+
     for entry in inbound rt ip_member
         FILTER IS_SAME_COLLECTION(@col_name, entry)
-        return entry    
+        return entry
     """
 
     _query_members_assigned = """
     LET rt = DOCUMENT('RoutingTable', @rt_name)
-    
+
     for ip in inbound rt ip_member
         FILTER IS_SAME_COLLECTION(@col_name, ip)
         LET assigned = FIRST(for $assigned in outbound ip ip_assigned return $assigned)
         return {
-            ip: ip, 
+            ip: ip,
             assigned: assigned,
             collection: PARSE_IDENTIFIER(assigned)['collection']
         }
@@ -64,12 +189,215 @@ class RoutingTableNodes(NameKeyCollection, CommonNodeGroup):
             'col_name': 'IPNetwork'
         }))
 
+    # -------------------------------------------------------------------------
+    # IP range queries
+    # -------------------------------------------------------------------------
+
+    _query_ip_range = Template("""
+    FOR ip IN @@col_name
+        FILTER ip.rt == @rt_name AND ip.version == @version
+        FILTER ${range_filter}
+        SORT ip.ip_start
+        RETURN ip
+    """)
+
+    _range_filters = {
+        'contained_in': 'ip.ip_start >= @ip_start AND ip.ip_start <= @ip_end AND ip.ip_end <= @ip_end',
+        'containing': 'ip.ip_start <= @ip_start AND ip.ip_end >= @ip_end',
+        'overlapping': 'ip.ip_start <= @ip_end AND ip.ip_end >= @ip_start'
+    }
+
+    def _query_range(self, range_filter, rt_node, ip_value, collections):
+        ip_net = ip_network(ip_value, strict=False)
+        query = self._query_ip_range.substitute(range_filter=self._range_filters[range_filter])
+
+        bind_vars = dict(rt_name=rt_node['name'], version=ip_net.version, **ip_value_fields(ip_net))
+
+        return [ip_node
+                for col_name in (collections or IP_NODE_COLLECTIONS)
+                for ip_node in self.query(query, bind_vars=dict(bind_vars, **{'@col_name': col_name}))]
+
+    def get_contained_in(self, rt_node, ip_value, collections=None):
+        """
+        Return the IP nodes in the routing table whose range is within the given IP value, for
+        example all of the addresses in "10.20.0.0/16".  The query is a range scan of the
+        (rt, version, ip_start, ip_end) index.
+
+        Parameters
+        ----------
+        rt_node : dict
+            The routing table node dict
+
+        ip_value : str
+            The IP network or address value
+
+        collections : list[str] (optional)
+            The IP node collection names to query, by default all of them.
+
+        Returns
+        -------
+        list[dict]
+            The IP nodes, by collection, sorted by start address
+        """
+        return self._query_range('contained_in', rt_node, ip_value, collections)
+
+    def get_containing(self, rt_node, ip_value, collections=None):
+        """
+        Return the IP nodes in the routing table whose range contains the given IP value, for
+        example the IPNetwork and IPInterface nodes that include the address "10.20.1.1".
+
+        Parameters
+        ----------
+        rt_node : dict
+            The routing table node dict
+
+        ip_value : str
+            The IP network or address value
+
+        collections : list[str] (optional)
+            The IP node collection names to query, by default all of them.
+
+        Returns
+        -------
+        list[dict]
+            The IP nodes, by collection, sorted by start address
+        """
+        return self._query_range('containing', rt_node, ip_value, collections)
+
+    def get_overlapping(self, rt_node, ip_value, collections=None):
+        """
+        Return the IP nodes in the routing table whose range overlaps with the given IP value; that
+        is the nodes that either contain, or are contained in, the IP value.
+
+        Parameters
+        ----------
+        rt_node : dict
+            The routing table node dict
+
+        ip_value : str
+            The IP network or address value
+
+        collections : list[str] (optional)
+            The IP node collection names to query, by default all of them.
+
+        Returns
+        -------
+        list[dict]
+            The IP nodes, by collection, sorted by start address
+        """
+        return self._query_range('overlapping', rt_node, ip_value, collections)
+
+    def lpm(self, rt_node):
+        """
+        Return a longest-prefix-match lookup table of the IPNetwork and IPInterface members of the
+        routing table.  The members are loaded once, and the table can then be incrementally
+        refreshed; see :class:`RoutingTableLPM`.
+
+        Parameters
+        ----------
+        rt_node : dict
+            The routing table node dict
+
+        Returns
+        -------
+        RoutingTableLPM
+        """
+        return RoutingTableLPM(self.client, rt_node)
+
+    _query_sorted_members = """
+    FOR ip IN @@col_name
+        FILTER ip.rt == @rt_name
+        SORT ip.rt, ip.version, ip.ip_start, ip.ip_end
+        RETURN KEEP(ip, '_id', 'name', 'version', 'ip_start', 'ip_end')
+    """
+
+    def find_conflicts(self, rt_node, batch_size=10000):
+        """
+        Find the duplicate and overlapping IP nodes in the routing table, and the IPInterface nodes
+        that are outside of any IPNetwork; see :func:`sweep_ip_conflicts`.  The members of each IP
+        collection are streamed in index order, merged, and checked in a single pass so that memory
+        use is bounded by the nesting depth of the prefixes rather than the size of the table.
+
+        IP nodes stored without the range fields, by versions before they were added, cannot be
+        checked; they are reported last as an 'unindexed' item.  Use
+        :func:`backfill_ip_value_fields` to add the fields.
+
+        Parameters
+        ----------
+        rt_node : dict
+            The routing table node dict
+
+        batch_size : int (optional)
+            The number of nodes streamed from the server per request
+
+        Yields
+        ------
+        dict
+            conflict: str - 'duplicate', 'overlap', 'outside', or 'unindexed'
+            nodes: list[dict] - the IP nodes in conflict, with only their _id, name, version and
+                   range fields
+        """
+        unindexed = list()
+
+        def indexed_only(ip_nodes):
+            for ip_node in ip_nodes:
+                if 'ip_start' in ip_node and 'ip_end' in ip_node:
+                    yield ip_node
+                else:
+                    unindexed.append(ip_node)
+
+        streams = [indexed_only(self.query(self._query_sorted_members, batch_size=batch_size, stream=True, bind_vars={
+            '@col_name': col_name,
+            'rt_name': rt_node['name']
+        })) for col_name in IP_NODE_COLLECTIONS]
+
+        ip_nodes = heapq.merge(*streams, key=itemgetter('version', 'ip_start', 'ip_end'))
+        yield from sweep_ip_conflicts(ip_nodes)
+
+        if unindexed:
+            yield dict(conflict='unindexed', nodes=unindexed)
+
 
 class CommonIPNode(TupleKeyCollection):
     IP_FUNC = None
 
+    def _ip_value(self, key_tuple):
+        """
+        Return the (rt_node, ip_value, other_key_fields) of the key_tuple, where ip_value is the
+        parsed IP value; its str() is the normalized name stored in the node, so that the same IP
+        given in different text forms, for example IPv6 with and without zero compression, is the
+        same node.
+
+        Raises
+        ------
+        ValueError
+            When the IP string value is not valid
+        """
+        rt_node, name, *other_key_fields = key_tuple
+        return rt_node, self.IP_FUNC(name), first(other_key_fields) or {}
+
     def _key(self, key_tuple):
-        return dict(rt=key_tuple[0]['name'], name=key_tuple[1])
+        rt_node, ip_value, other_key_fields = self._ip_value(key_tuple)
+        return dict(other_key_fields, rt=rt_node['name'], name=str(ip_value))
+
+    def __getitem__(self, key_tuple):
+        """
+        Return the node dict of the key_tuple, see :meth:`ensure`.
+
+        Returns
+        -------
+        dict
+            The document node dict
+
+        None
+            If there is no document matching the key_tuple, or the IP string value is not valid.
+        """
+        try:
+            key = self._key(key_tuple)
+        except ValueError:
+            return None
+
+        return first(self.col.find(key, limit=1))
 
     def ensure(self, key_tuple, **fields):
         """
@@ -117,13 +445,113 @@ class CommonIPNode(TupleKeyCollection):
         dict
             The collection node that was created/updated.
         """
-        rt_node, name, *other_key_fields = key_tuple
-        other_key_fields = first(other_key_fields) or {}
-        ip_addr = self.IP_FUNC(name)
-        ip_node = super().ensure(key_tuple, version=ip_addr.version, **fields, **other_key_fields)
+        rt_node, ip_addr, other_key_fields = self._ip_value(key_tuple)
+        ip_node = super().ensure((rt_node, str(ip_addr), other_key_fields), version=ip_addr.version,
+                                 **ip_value_fields(ip_addr), **fields)
         self.client.routing_tables.add_member(rt_node, ip_node)
         return ip_node
 
+    _query_ensure_many = """
+    FOR item IN @items
+        LET existing = FIRST(
+            FOR doc IN @@col_name
+                FILTER doc.rt == item.key.rt AND doc.name == item.key.name AND MATCHES(doc, item.key)
+                LIMIT 1
+                RETURN doc
+        )
+        LET unchanged = existing != null AND LENGTH(
+            FOR attr IN ATTRIBUTES(item.fields) FILTER existing[attr] != item.fields[attr] LIMIT 1 RETURN attr
+        ) == 0
+        LET written = (
+            FOR fields IN (unchanged ? [] : [item.fields])
+                UPSERT item.key
+                INSERT fields
+                UPDATE fields
+                IN @@col_name OPTIONS {keepNull: False}
+                RETURN NEW
+        )
+        RETURN {
+            doc: unchanged ? existing : FIRST(written),
+            op: unchanged ? 'unchanged' : (existing ? 'updated' : 'created')
+        }
+    """
+
+    def ensure_many(self, key_tuples, chunk_size=DEFAULT_CHUNK_SIZE, **fields):
+        """
+        Ensure many nodes exist in the database collection, each bound to its routing table.  All of
+        the IP values are validated and normalized locally first, and then the nodes and their
+        'ip_member' edges are written in chunks, one query each per chunk.
+
+        Parameters
+        ----------
+        key_tuples : Iterable[tuple]
+            Each item is a key_tuple as described in :meth:`ensure`, that is
+            (rt_node, ip_str) or (rt_node, ip_str, extra_key_dict).
+
+        chunk_size : int (optional)
+            The number of nodes written per server request.
+
+        Other Parameters
+        ----------------
+        The `fields` are additional key-values that will be added to every node
+        when it is created or updated (ensured).
+
+        Returns
+        -------
+        list[dict]
+            The collection nodes that were created/updated; one per unique key, in the order
+            first given.
+
+        Raises
+        ------
+        ValueError
+            When any of the IP values are not valid.  No nodes are written in that case.
+        """
+        items = dict()
+        rt_nodes = dict()
+        invalid = list()
+
+        for key_tuple in key_tuples:
+            try:
+                rt_node, ip_addr, other_key_fields = self._ip_value(key_tuple)
+            except ValueError as exc:
+                invalid.append((key_tuple[1], str(exc)))
+                continue
+
+            key = self._key((rt_node, str(ip_addr), other_key_fields))
+            _fields = deepcopy(fields)
+            _fields.update(key)
+            _fields['version'] = ip_addr.version
+            _fields.update(ip_value_fields(ip_addr))
+
+            rt_nodes[rt_node['_id']] = rt_node
+
+            # the same IP with different extra key fields, for example a "group", is a different node.
+
+            item_key = json.dumps(key, sort_keys=True, default=str)
+            if item_key not in items:
+                items[item_key] = dict(key=key, fields=_fields, rt_id=rt_node['_id'])
+
+        if invalid:
+            raise ValueError('invalid IP values', invalid)
+
+        ip_nodes = list()
+
+        for chunk in chunked(items.values(), chunk_size):
+            chunk_nodes = list(map(self._ensured, self.query(self._query_ensure_many, bind_vars={
+                'items': [dict(key=item['key'], fields=item['fields']) for item in chunk],
+                '@col_name': self.COLLECTION_NAME
+            })))
+
+            self.client.ensure_edges(
+                ((ip_node, self.client.routing_tables.EDGE_NAME, rt_nodes[item['rt_id']])
+                 for ip_node, item in zip(chunk_nodes, chunk)),
+                chunk_size=chunk_size)
+
+            ip_nodes.extend(chunk_nodes)
+
+        return ip_nodes
+
     def assign(self, ip_node, other_node):
         self.client.ensure_edge((ip_node, 'ip_assigned', other_node))
 
@@ -155,6 +583,69 @@ class IPNetworkNodes(CommonIPNode):
     IP_FUNC = staticmethod(ip_network)
 
 
+# -----------------------------------------------------------------------------
+# migrate IP nodes stored before the range fields were added
+# -----------------------------------------------------------------------------
+
+_query_missing_value_fields = """
+FOR ip IN @@col_name
+    FILTER ip.ip_start == null OR ip.ip_end == null OR (@has_host AND ip.ip_host == null)
+    RETURN KEEP(ip, '_key', 'name')
+"""
+
+_query_update_value_fields = """
+FOR item IN @items
+    UPDATE item IN @@col_name
+"""
+
+
+def backfill_ip_value_fields(db, batch_size=DEFAULT_CHUNK_SIZE):
+    """
+    Add the ip_start, ip_end, and ip_host fields, see :func:`ip_value_fields`, to the IP nodes that
+    were stored without them, so that the range queries, :meth:`RoutingTableNodes.find_conflicts`
+    and :func:`resolve_ips` include those nodes.  Nodes whose name is not a valid IP value are
+    left as they are.
+
+    Parameters
+    ----------
+    db : IMNetDB
+        The instance of the database
+
+    batch_size : int (optional)
+        The number of nodes updated per server request
+
+    Returns
+    -------
+    dict
+        key: the IP node collection name
+        value: the number of nodes updated
+    """
+    ip_funcs = dict(IPAddress=ip_address, IPInterface=ip_interface, IPNetwork=ip_network)
+    updated = dict()
+
+    for col_name in IP_NODE_COLLECTIONS:
+        ip_func = ip_funcs[col_name]
+        missing = list(db.query(_query_missing_value_fields, bind_vars={
+            '@col_name': col_name,
+            'has_host': col_name != 'IPNetwork'
+        }))
+
+        items = list()
+        for ip_node in missing:
+            try:
+                ip_value = ip_func(ip_node['name'])
+            except ValueError:
+                continue
+            items.append(dict(_key=ip_node['_key'], version=ip_value.version, **ip_value_fields(ip_value)))
+
+        for chunk in chunked(items, batch_size):
+            db.query(_query_update_value_fields, bind_vars={'items': chunk, '@col_name': col_name})
+
+        updated[col_name] = len(items)
+
+    return updated
+
+
 _query_all_assignments = """
 LET $ipif_assignments = (FOR ipif_node in IPInterface
     FOR asgn_node IN OUTBOUND ipif_node ip_assigned
@@ -190,3 +681,232 @@ RETURN {
 
 def query_all_assignments(db):
     return first(db.query(_query_all_assignments))
+
+
+# the per node type queries used by iter_all_assignments; each item has the same structure as
+# the query_all_assignments items.
+
+_query_type_assignments = [
+    ('interface', Template("""
+FOR ipif_node IN IPInterface
+    ${rt_filter}
+    FOR asgn_node IN OUTBOUND ipif_node ip_assigned
+        RETURN {
+            ip: ipif_node,
+            assigned: asgn_node
+        }
+""")),
+    ('address', Template("""
+FOR ipif_node IN IPAddress
+    ${rt_filter}
+    RETURN {
+        ip: ipif_node,
+        assigned: FIRST(FOR asgn_node IN OUTBOUND ipif_node ip_assigned RETURN asgn_node)
+    }
+""")),
+    ('network', Template("""
+FOR ipif_node IN IPNetwork
+    ${rt_filter}
+    RETURN {
+        ip: ipif_node,
+        assigned: FIRST(FOR asgn_node IN OUTBOUND ipif_node ip_assigned RETURN asgn_node)
+    }
+"""))
+]
+
+
+def iter_all_assignments(db, rt=None, batch_size=1000):
+    """
+    Iterate over the IPInterface, IPAddress, and IPNetwork assignments; this is the streamed form
+    of :func:`query_all_assignments`.  Each node type is streamed from the server in cursor batches
+    so that neither the server nor the client holds all of the assignments at once.
+
+    Parameters
+    ----------
+    db : IMNetDB
+        The instance of the database
+
+    rt : dict (optional)
+        Only include the IP nodes within this routing table node
+
+    batch_size : int (optional)
+        The number of items fetched from the server per request
+
+    Yields
+    ------
+    tuple
+        (node_type, item) where node_type is one of 'interface', 'address', 'network', and
+        item is a dict with keys 'ip' and 'assigned' as in :func:`query_all_assignments`.
+    """
+    bind_vars = dict()
+    rt_filter = ''
+
+    if rt:
+        rt_filter = 'FILTER ipif_node.rt == @rt_name'
+        bind_vars['rt_name'] = rt['name']
+
+    for node_type, query in _query_type_assignments:
+        for item in db.query(query.substitute(rt_filter=rt_filter), bind_vars=bind_vars,
+                             batch_size=batch_size, stream=True):
+            yield node_type, item
+
+
+# -----------------------------------------------------------------------------
+# resolve IP address to the owning nodes
+# -----------------------------------------------------------------------------
+
+# UNION does not define the order of its result, so the IPInterface priority over the IPAddress
+# is explicit.
+
+_query_resolve_ips = Template("""
+FOR host IN @hosts
+    LET ip_node = FIRST(
+        FOR found IN UNION(
+            (FOR ip IN IPInterface
+                FILTER ip.version == host.version AND ip.ip_host == host.ip_host ${rt_filter}
+                RETURN {priority: 0, ip: ip}),
+            (FOR ip IN IPAddress
+                FILTER ip.version == host.version AND ip.ip_host == host.ip_host ${rt_filter}
+                RETURN {priority: 1, ip: ip})
+        )
+            SORT found.priority
+            LIMIT 1
+            RETURN found.ip
+    )
+    FILTER ip_node != null
+    LET assigned = FIRST(FOR asgn_node IN OUTBOUND ip_node ip_assigned RETURN asgn_node)
+    LET device = (
+        assigned == null ? null
+        : IS_SAME_COLLECTION('Interface', assigned)
+        ? FIRST(FOR rel IN equip_interface FILTER rel._to == assigned._id RETURN DOCUMENT(rel._from))
+        : IS_SAME_COLLECTION('LAG', assigned) ? DOCUMENT('Device', assigned.device) : null
+    )
+    RETURN {
+        ip: host.ip,
+        ip_node: ip_node,
+        assigned: assigned,
+        device: device
+    }
+""")
+
+
+def resolve_ips(db, ips, rt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Resolve IP address values to the IPInterface or IPAddress node that has the address, the node
+    the IP is assigned to, and the device that owns that node.  Each chunk of addresses is resolved
+    in one indexed query.  IP nodes stored without the ip_host field, by versions before it was
+    added, are not found until :func:`backfill_ip_value_fields` is run.
+
+    Parameters
+    ----------
+    db : IMNetDB
+        The instance of the database
+
+    ips : Iterable[str]
+        The IP address values, for example "10.1.2.3"
+
+    rt : dict (optional)
+        Only resolve the addresses within this routing table node
+
+    chunk_size : int (optional)
+        The number of addresses resolved per server request
+
+    Returns
+    -------
+    dict
+        key: the IP address value, as given
+        value: None if the address is not found, or is not a valid address, otherwise a dict:
+            ip_node: the IPInterface, or if none the IPAddress, node dict
+            assigned: the node dict the IP node is assigned to, or None
+            device: the Device node dict of the assigned Interface or LAG, or None
+    """
+    resolved = dict()
+    bind_vars = dict()
+    rt_filter = ''
+
+    if rt:
+        rt_filter = 'AND ip.rt == @rt_name'
+        bind_vars['rt_name'] = rt['name']
+
+    query = _query_resolve_ips.substitute(rt_filter=rt_filter)
+
+    for chunk in chunked(ips, chunk_size):
+        hosts = list()
+        for ip in chunk:
+            resolved[ip] = None
+            try:
+                ip_addr = ip_address(ip)
+            except ValueError:
+                continue
+            hosts.append(dict(ip=ip, version=ip_addr.version, **ip_value_fields(ip_addr)))
+
+        if not hosts:
+            continue
+
+        for item in db.query(query, bind_vars=dict(bind_vars, hosts=hosts)):
+            resolved[item.pop('ip')] = item
+
+    return resolved
+
+
+class IPResolver(object):
+    """
+    Resolve IP address values with :func:`resolve_ips`, serving repeated addresses from a bounded
+    least-recently-used cache.  Cached results are not invalidated when the database changes; use
+    :meth:`clear` or a new resolver as needed.
+    """
+
+    def __init__(self, db, rt=None, cache_size=10000):
+        """
+        Parameters
+        ----------
+        db : IMNetDB
+            The instance of the database
+
+        rt : dict (optional)
+            Only resolve the addresses within this routing table node
+
+        cache_size : int (optional)
+            The maximum number of addresses kept in the cache
+        """
+        self.db = db
+        self.rt = rt
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def clear(self):
+        self._cache.clear()
+
+    def resolve(self, ips):
+        """
+        Resolve the IP address values, see :func:`resolve_ips`.
+
+        Parameters
+        ----------
+        ips : Iterable[str]
+            The IP address values
+
+        Returns
+        -------
+        dict
+            As described in :func:`resolve_ips`
+        """
+        resolved = dict()
+        missing = list()
+
+        for ip in ips:
+            if ip in self._cache:
+                self._cache.move_to_end(ip)
+                resolved[ip] = self._cache[ip]
+            else:
+                missing.append(ip)
+
+        if missing:
+            found = resolve_ips(self.db, missing, rt=self.rt)
+            resolved.update(found)
+            self._cache.update(found)
+
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return resolved
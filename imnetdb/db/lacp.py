@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from string import Template
+from collections import Counter
+
 from imnetdb.db.collection import PeeringCollection
 
 
@@ -22,3 +25,115 @@ class LACPNodes(PeeringCollection):
     COLLECTION_NAME = 'LACP'
     MEMBER_COLLECTION_NAME = 'LAG'
     EDGE_NAME = 'lacp_member'
+
+    _query_lacp_of_lags = """
+    FOR lag_ids IN @lag_ids_list
+        RETURN (
+            FOR lag_id IN lag_ids
+                RETURN FIRST(FOR rel IN lacp_member FILTER rel._from == lag_id RETURN rel._to)
+        )
+    """
+
+    _query_lacp_in_scope = Template("""
+    ${scope_lags}
+        FOR rel IN lacp_member
+            FILTER rel._from == lag_node._id
+            COLLECT lacp_id = rel._to
+            RETURN {
+                lacp_id: lacp_id,
+                lag_peers: (
+                    FOR peer_rel IN lacp_member
+                        FILTER peer_rel._to == lacp_id
+                        RETURN [DOCUMENT(peer_rel._from).device, peer_rel._from]
+                )
+            }
+    """)
+
+    def sync_from_cabling(self, scope=None, dry_run=False, **fields):
+        """
+        Ensure that an LACP node exists for every pair of LAGs that are cabled together, as found
+        by :meth:`LAGNodes.iter_cabling`.  The LAG peerings, their existing LACP nodes, and any missing
+        LACP nodes and edges are each handled in bulk, so the whole fabric is synchronized in a
+        handful of queries.
+
+        Parameters
+        ----------
+        scope : dict (optional)
+            Limit the LAGs to those of a Device node or of the devices in a DeviceGroup node.
+            When not provided, all LAGs are used.
+
+        dry_run : bool (optional)
+            When True, report what would be done but do not create any LACP nodes.
+
+        fields : kwargs
+            Extra fields to be stored within each new LACP node.
+
+        Returns
+        -------
+        dict
+            Dictionary of results, structured:
+                'created': list of new LACP node dicts, or the LAG peers to be created when dry_run
+                'existing': the number of LAG peers that already have their LACP node
+                'inconsistent': list of dict(lag_peers, reason, lacp_ids) that need attention
+        """
+        result = dict(created=[], existing=0, inconsistent=[])
+
+        lag_peerings = list(self.client.lags.iter_cabling(scope=scope))
+        lag_use = Counter(lag_id for lag_peers, _cables in lag_peerings for _device, lag_id in lag_peers)
+
+        lacp_ids_list = self.query(self._query_lacp_of_lags, bind_vars={
+            'lag_ids_list': [[lag_id for _device, lag_id in lag_peers] for lag_peers, _cables in lag_peerings]
+        })
+
+        to_create = list()
+        confirmed_lacp_ids = set()
+
+        for (lag_peers, _cables), lacp_ids in zip(lag_peerings, lacp_ids_list):
+            reason = None
+
+            if len(lag_peers) != 2:
+                reason = 'LAG cabled to an interface that is not a LAG member'
+
+            elif any(lag_use[lag_id] > 1 for _device, lag_id in lag_peers):
+                reason = 'LAG cabled to more than one LAG'
+
+            elif not any(lacp_ids):
+                to_create.append(lag_peers)
+                continue
+
+            elif lacp_ids[0] == lacp_ids[1]:
+                confirmed_lacp_ids.add(lacp_ids[0])
+                result['existing'] += 1
+                continue
+
+            elif not all(lacp_ids):
+                reason = 'one of the LAGs is not a member of an LACP'
+
+            else:
+                reason = 'LAGs are not members of the same LACP'
+
+            result['inconsistent'].append(dict(lag_peers=lag_peers, reason=reason,
+                                               lacp_ids=[lacp_id for lacp_id in lacp_ids if lacp_id]))
+
+        # any other LACP nodes in scope are between LAGs that are no longer cabled together.
+
+        scope_lags, bind_vars = self.client.lags._scope_lags(scope)
+        query = self._query_lacp_in_scope.substitute(scope_lags=scope_lags)
+        reported = {lacp_id for item in result['inconsistent'] for lacp_id in item['lacp_ids']}
+
+        for item in self.query(query, bind_vars=bind_vars):
+            if item['lacp_id'] in confirmed_lacp_ids or item['lacp_id'] in reported:
+                continue
+
+            result['inconsistent'].append(dict(lag_peers=tuple(map(tuple, item['lag_peers'])),
+                                               reason='LAGs are not cabled together',
+                                               lacp_ids=[item['lacp_id']]))
+
+        if dry_run:
+            result['created'] = to_create
+            return result
+
+        result['created'] = self._create_peerings(
+            [[lag_id for _device, lag_id in lag_peers] for lag_peers in to_create], fields)
+
+        return result
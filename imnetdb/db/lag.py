@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict
+from string import Template
 from first import first
 
 from imnetdb.db.collection import TupleKeyCollection, CommonNodeGroup
@@ -52,21 +52,100 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
             'lag_name': lag_node['name']
         }))
 
-    _query_lags_in_device = """
-    return MERGE(
-        FOR lag in LAG
-            FILTER lag.device == @device_name
-            LET if_nodes = MERGE(
-                for interface in inbound lag lag_member
-                    return {[interface.name]: interface}
-            )
-            return {[lag.name]: {lag: lag, interfaces: if_nodes}}
-    )              
-    """
+    # -------------------------------------------------------------------------
+    # catalog
+    # -------------------------------------------------------------------------
+
+    _query_lag_catalog = Template("""
+    ${devices}
+        LET lags = MERGE(
+            FOR lag IN LAG
+                FILTER lag.device == device_name
+                SORT lag.name
+                LET if_nodes = MERGE(
+                    FOR interface IN INBOUND lag lag_member
+                        RETURN {[interface.name]: ${if_expr}}
+                )
+                RETURN {[lag.name]: {lag: ${lag_expr}, interfaces: if_nodes}}
+        )
+        RETURN {device: device_name, lags: lags}
+    """)
+
+    _query_catalog_all_devices = """
+    FOR lag_device IN LAG
+        COLLECT device_name = lag_device.device"""
+
+    _query_catalog_devices = """
+    FOR device_name IN @device_names"""
+
+    def _catalog_query(self, devices, fields, ids_only):
+        bind_vars = dict()
+
+        if ids_only:
+            lag_expr, if_expr = 'lag._id', 'interface._id'
+
+        elif fields:
+            lag_expr, if_expr = 'KEEP(lag, @fields)', 'KEEP(interface, @fields)'
+            bind_vars['fields'] = list({'_id', *fields})
+
+        else:
+            lag_expr, if_expr = 'lag', 'interface'
+
+        query = self._query_lag_catalog.substitute(devices=devices, lag_expr=lag_expr, if_expr=if_expr)
+        return query, bind_vars
+
+    def iter_catalog(self, fields=None, ids_only=False, batch_size=100):
+        """
+        Iterate over the catalog of all known LAGs, one device at a time, streamed from the
+        server.  See :meth:`catalog` for the structure of each device catalog.
+
+        Parameters
+        ----------
+        fields : list[str] (optional)
+            Only include these fields, and the '_id', of the LAG and Interface nodes.
+
+        ids_only : bool (optional)
+            When True, the LAG and Interface node values are only their '_id' values.
+
+        batch_size : int (optional)
+            The number of devices fetched from the server per request
+
+        Yields
+        ------
+        tuple
+            (device_name, device_catalog)
+        """
+        query, bind_vars = self._catalog_query(self._query_catalog_all_devices, fields, ids_only)
+
+        for item in self.query(query, bind_vars=bind_vars, batch_size=batch_size, stream=True):
+            yield item['device'], item['lags']
 
-    def catalog_device(self, device_name):
+    def catalog_devices(self, device_names, fields=None, ids_only=False):
+        """
+        Return the catalog of LAGs for each of the given device names, in one query.  See
+        :meth:`catalog` for the structure of each device catalog, and :meth:`iter_catalog` for
+        the `fields` and `ids_only` options.
+
+        Parameters
+        ----------
+        device_names : list[str]
+            The device names
+
+        Returns
+        -------
+        dict
+            key: device name
+            value: the device catalog; an empty dict if the device has no LAGs.
+        """
+        query, bind_vars = self._catalog_query(self._query_catalog_devices, fields, ids_only)
+        bind_vars['device_names'] = list(device_names)
+
+        return {item['device']: item['lags'] or {} for item in self.query(query, bind_vars=bind_vars)}
+
+    def catalog_device(self, device_name, fields=None, ids_only=False):
         """
         Return a catalog of all LAGs and associated interfaces given the specific device name.
+        See :meth:`iter_catalog` for the `fields` and `ids_only` options.
 
         Parameters
         ----------
@@ -84,9 +163,7 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
         None
             If not LAG nodes found for the given device.
         """
-        return first(self.query(self._query_lags_in_device, bind_vars={
-            'device_name': device_name
-        }))
+        return self.catalog_devices([device_name], fields=fields, ids_only=ids_only)[device_name] or None
 
     def find(self, interface_node):
         """
@@ -107,28 +184,11 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
         found = first(self.db.collection('lag_member').find(dict(_from=interface_node['_id'])))
         return self.col.get(found['_to']) if found else None
 
-    _query_lag_catalog = """
-    return MERGE(
-        FOR lag in LAG
-            LET if_nodes = MERGE(
-                for interface in inbound lag lag_member
-                    return {[interface.name]: interface}
-            )
-            COLLECT device_name = lag.device into device_info = {
-                [lag.name]: {
-                    lag: lag,
-                    interfaces: if_nodes
-                }
-            }
-            return {
-                [device_name]: MERGE(device_info)
-            }        
-    )            
-    """
-
-    def catalog(self):
+    def catalog(self, fields=None, ids_only=False):
         """
         Return a catalog of all known LAGS, oriented by device, LAG name and collected interfaces.
+        For large fabrics use :meth:`iter_catalog` to stream the catalog one device at a time, and
+        the `fields` or `ids_only` options to reduce the size of the catalog.
 
         Returns
         -------
@@ -141,10 +201,53 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
                         key: interface name
                         value: Interface node dict
         """
-        return first(self.query(self._query_lag_catalog))
+        return dict(self.iter_catalog(fields=fields, ids_only=ids_only))
 
-    _query_cabled_lags = """
+    # -------------------------------------------------------------------------
+    # get_cabling
+    # -------------------------------------------------------------------------
+
+    # the LAG nodes to start from, based on the scope given by the caller.
+
+    _query_scope_lags = {
+        None: """
+    FOR lag_node IN LAG""",
+        'Device': """
     FOR lag_node IN LAG
+        FILTER lag_node.device == @scope_name""",
+        'DeviceGroup': """
+    FOR device IN INBOUND DOCUMENT('DeviceGroup', @scope_name) device_member
+        FILTER IS_SAME_COLLECTION('Device', device)
+        FOR lag_node IN LAG
+            FILTER lag_node.device == device.name"""
+    }
+
+    def _scope_lags(self, scope):
+        """
+        Return the AQL fragment that iterates `lag_node` over the LAGs within `scope`, and the
+        associated bind variables.
+
+        Parameters
+        ----------
+        scope : dict
+            None for all LAGs, or a Device node dict, or a DeviceGroup node dict.
+
+        Returns
+        -------
+        tuple
+            (str, dict)
+        """
+        if scope is None:
+            return self._query_scope_lags[None], {}
+
+        col_name = scope['_id'].partition('/')[0]
+        if col_name not in self._query_scope_lags:
+            raise ValueError(f'scope must be a Device or DeviceGroup node, not {col_name}')
+
+        return self._query_scope_lags[col_name], {'scope_name': scope['name']}
+
+    _query_cabled_lags = Template("""
+    ${scope_lags}
         FOR if_node IN INBOUND lag_node lag_member
             FOR cable_node IN OUTBOUND if_node cabled
                 RETURN {
@@ -153,10 +256,51 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
                     lag_role: lag_node.role,
                     device: if_node.device,
                     if_name: if_node.name
-                }    
-    """
+                }
+    """)
+
+    # group the cables by the set of LAGs on either end.  The peers of each cable are found from the
+    # cable itself so that LAGs outside of the scope are included in the peering.
 
-    def get_cabling(self, return_list=False):
+    _query_cabled_lag_peers = Template("""
+    ${scope_lags}
+        FOR if_node IN INBOUND lag_node lag_member
+            FOR cable_node IN OUTBOUND if_node cabled
+                COLLECT cable_id = cable_node._id
+                LET lag_peers = SORTED_UNIQUE(
+                    FOR peer_if_node IN INBOUND cable_id cabled
+                        FOR peer_lag_node IN OUTBOUND peer_if_node lag_member
+                            RETURN [peer_if_node.device, peer_lag_node._id]
+                )
+                COLLECT peers = lag_peers INTO cables = cable_id
+                RETURN {lag_peers: peers, cable_ids: cables}
+    """)
+
+    def iter_cabling(self, scope=None):
+        """
+        Iterate over the LAGs that have a cabled peering relationship.  The grouping of cables
+        by LAG peers is done by the server, and the results are streamed so that memory use is
+        proportional to the number of LAG peers rather than the number of member links.
+
+        Parameters
+        ----------
+        scope : dict (optional)
+            Limit the LAGs to those of a Device node or of the devices in a DeviceGroup node.
+            When not provided, all LAGs are used.
+
+        Yields
+        ------
+        tuple
+            (lag_peers, cable_ids), where lag_peers is a sorted tuple of the LAG peers
+            ((dev1, lag1_id), (dev2, lag2_id)) and cable_ids is the list of Cable IDs between them.
+        """
+        scope_lags, bind_vars = self._scope_lags(scope)
+        query = self._query_cabled_lag_peers.substitute(scope_lags=scope_lags)
+
+        for item in self.query(query, bind_vars=bind_vars, stream=True):
+            yield tuple(map(tuple, item['lag_peers'])), item['cable_ids']
+
+    def get_cabling(self, return_list=False, scope=None):
         """
         This function queries the database for all LAGs that have a cabled peering relationship.  That is
         to say - find all the cabled interfaces, and find the LAGs that share cables.  Return a
@@ -165,7 +309,16 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
             value = list of cable-IDs
 
         If the caller would prefer to have the raw list of data so that they can orient the information
-        in a different way, then set `return_list` to True
+        in a different way, then set `return_list` to True.  For large fabrics use :meth:`iter_cabling`
+        to stream the LAG peers instead.
+
+        Parameters
+        ----------
+        return_list : bool (optional)
+            See description
+
+        scope : dict (optional)
+            Limit the LAGs to those of a Device node or of the devices in a DeviceGroup node.
 
         Returns
         -------
@@ -183,19 +336,12 @@ class LAGNodes(TupleKeyCollection, CommonNodeGroup):
 
         # if the caller simply wants the raw list of data, return that now
 
-        cabled_lags = list(self.query(self._query_cabled_lags))
         if return_list is True:
-            return cabled_lags
+            scope_lags, bind_vars = self._scope_lags(scope)
+            query = self._query_cabled_lags.substitute(scope_lags=scope_lags)
+            return list(self.query(query, bind_vars=bind_vars))
 
         # otherwise, organize the data as a dictionary with keys = LAG peers (tuple) and the
         # values are the list of cables between the LAG peers.
 
-        by_cable_id = defaultdict(set)
-        for item in cabled_lags:
-            by_cable_id[item['cable_id']].add((item['device'], item['lag_id']))
-
-        by_lag_peers = defaultdict(list)
-        for cable_id, lag_peers in by_cable_id.items():
-            by_lag_peers[tuple(lag_peers)].append(cable_id)
-
-        return dict(by_lag_peers)
+        return dict(self.iter_cabling(scope=scope))
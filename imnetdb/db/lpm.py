@@ -0,0 +1,321 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from operator import itemgetter
+from ipaddress import ip_address, ip_interface, ip_network
+
+__all__ = ['LPMTable', 'RoutingTableLPM']
+
+
+_IP_BITS = {4: 32, 6: 128}
+
+
+class LPMTable(object):
+    """
+    An in-process longest-prefix-match table.  Prefixes are stored in one hash table per
+    prefix length, keyed by the network bits of the prefix.  A lookup probes each prefix length
+    in use, longest first, so a lookup costs at most one dict access per distinct prefix length
+    rather than a walk of every bit of the address.
+
+    More than one entry can be stored for the same prefix; the entry with the lowest priority
+    value is the one returned by a lookup.
+    """
+
+    def __init__(self):
+        # version -> prefixlen -> network bits -> sorted list of (priority, entry_id, entry)
+        self._tables = {4: dict(), 6: dict()}
+
+        # version -> prefix lengths in use, longest first
+        self._prefixlens = {4: [], 6: []}
+
+        # entry_id -> list of (version, prefixlen, network bits)
+        self._slots = dict()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._slots
+
+    def insert(self, ip_net, entry_id, entry, priority=0):
+        """
+        Insert an entry for the given prefix.
+
+        Parameters
+        ----------
+        ip_net : IPv4Network|IPv6Network
+            The prefix
+
+        entry_id : str
+            A unique identity for the entry, used to remove it.  An entry can be inserted for
+            more than one prefix using the same entry_id.
+
+        entry : any
+            The value returned by a lookup
+
+        priority : int (optional)
+            When more than one entry is stored for the same prefix, the lowest value is returned
+        """
+        version, plen = ip_net.version, ip_net.prefixlen
+        bits = int(ip_net.network_address) >> (_IP_BITS[version] - plen)
+
+        by_plen = self._tables[version]
+        if plen not in by_plen:
+            by_plen[plen] = dict()
+            self._prefixlens[version] = sorted(by_plen, reverse=True)
+
+        slot = by_plen[plen].setdefault(bits, [])
+        slot.append((priority, entry_id, entry))
+        slot.sort(key=itemgetter(0, 1))
+
+        # an entry inserted more than once for the same prefix is removed from its slot once.
+
+        entry_slots = self._slots.setdefault(entry_id, [])
+        if (version, plen, bits) not in entry_slots:
+            entry_slots.append((version, plen, bits))
+
+    def remove(self, entry_id):
+        """
+        Remove all of the prefixes inserted for the entry_id, if any.
+
+        Parameters
+        ----------
+        entry_id : str
+            The entry identity given to :meth:`insert`
+        """
+        for version, plen, bits in self._slots.pop(entry_id, []):
+            by_plen = self._tables[version]
+            by_bits = by_plen[plen]
+            slot = [item for item in by_bits[bits] if item[1] != entry_id]
+
+            if slot:
+                by_bits[bits] = slot
+                continue
+
+            del by_bits[bits]
+            if not by_bits:
+                del by_plen[plen]
+                self._prefixlens[version] = sorted(by_plen, reverse=True)
+
+    def lookup(self, ip):
+        """
+        Return the entry of the longest prefix that contains the given address.
+
+        Parameters
+        ----------
+        ip : str|IPv4Address|IPv6Address
+            The address to lookup
+
+        Returns
+        -------
+        any
+            The entry value
+
+        None
+            If no prefix contains the address
+        """
+        ip_addr = ip_address(ip)
+        version = ip_addr.version
+        addr_bits, width = int(ip_addr), _IP_BITS[version]
+        by_plen = self._tables[version]
+
+        for plen in self._prefixlens[version]:
+            slot = by_plen[plen].get(addr_bits >> (width - plen))
+            if slot:
+                return slot[0][2]
+
+        return None
+
+    def lookup_many(self, ips):
+        """
+        Return the entries of the longest prefixes that contain each of the given addresses.
+
+        Parameters
+        ----------
+        ips : Iterable[str]
+            The addresses to lookup
+
+        Returns
+        -------
+        list
+            The entry values, or None, in the same order as `ips`
+        """
+        lookup = self.lookup
+        return [lookup(ip) for ip in ips]
+
+
+class RoutingTableLPM(object):
+    """
+    Longest-prefix-match lookups of addresses to the IPNetwork and IPInterface members of one
+    routing table.  The members are loaded into an in-process :class:`LPMTable` so that lookups do
+    not require a database query.
+
+    An IPInterface is stored as a host prefix of its address, so that its own address resolves to
+    it, and as its connected network; an IPNetwork of the same prefix takes precedence over the
+    connected network of an IPInterface.
+    """
+
+    # lookup precedence for entries of the same prefix
+    _PRIORITY_NETWORK = 0
+    _PRIORITY_CONNECTED = 1
+
+    _query_members = """
+    FOR ip IN INBOUND DOCUMENT('RoutingTable', @rt_name) ip_member
+        FILTER IS_SAME_COLLECTION('IPNetwork', ip) OR IS_SAME_COLLECTION('IPInterface', ip)
+        LET assigned_rel = FIRST(FOR rel IN ip_assigned FILTER rel._from == ip._id RETURN rel)
+        RETURN {
+            ip: ip,
+            assigned: assigned_rel ? DOCUMENT(assigned_rel._to) : null,
+            rev: [ip._rev, assigned_rel._rev]
+        }
+    """
+
+    _query_member_revs = """
+    FOR ip IN INBOUND DOCUMENT('RoutingTable', @rt_name) ip_member
+        FILTER IS_SAME_COLLECTION('IPNetwork', ip) OR IS_SAME_COLLECTION('IPInterface', ip)
+        LET assigned_rel = FIRST(FOR rel IN ip_assigned FILTER rel._from == ip._id RETURN rel)
+        RETURN [ip._id, [ip._rev, assigned_rel._rev]]
+    """
+
+    _query_changed_members = """
+    FOR ip IN DOCUMENT(@ip_ids)
+        LET assigned_rel = FIRST(FOR rel IN ip_assigned FILTER rel._from == ip._id RETURN rel)
+        RETURN {
+            ip: ip,
+            assigned: assigned_rel ? DOCUMENT(assigned_rel._to) : null,
+            rev: [ip._rev, assigned_rel._rev]
+        }
+    """
+
+    def __init__(self, client, rt_node, batch_size=10000):
+        """
+        Create the lookup table for the routing table, and load its members.
+
+        Parameters
+        ----------
+        client : IMNetDB
+            The database client
+
+        rt_node : dict
+            The routing table node dict
+
+        batch_size : int (optional)
+            The number of members streamed from the server per request
+        """
+        self.client = client
+        self.rt_node = rt_node
+        self.batch_size = batch_size
+        self.table = LPMTable()
+        self._revs = dict()
+        self.load()
+
+    def _add(self, item):
+        ip_node = item['ip']
+        entry = dict(ip=ip_node, assigned=item['assigned'])
+        ip_id = ip_node['_id']
+
+        if ip_id.startswith('IPNetwork/'):
+            self.table.insert(ip_network(ip_node['name']), ip_id, entry, self._PRIORITY_NETWORK)
+        else:
+            ip_if = ip_interface(ip_node['name'])
+            self.table.insert(ip_network(ip_if.ip), ip_id, entry, self._PRIORITY_NETWORK)
+
+            # a host prefix, for example a loopback /32, has no connected network of its own.
+
+            if ip_if.network.prefixlen != ip_if.max_prefixlen:
+                self.table.insert(ip_if.network, ip_id, entry, self._PRIORITY_CONNECTED)
+
+        self._revs[ip_id] = item['rev']
+
+    def load(self):
+        """
+        (Re)load all of the routing table members using one streamed query.
+        """
+        self.table = LPMTable()
+        self._revs = dict()
+
+        for item in self.client.query(self._query_members, batch_size=self.batch_size, stream=True,
+                                      bind_vars={'rt_name': self.rt_node['name']}):
+            self._add(item)
+
+    def refresh(self):
+        """
+        Incrementally update the table with the routing table members that have been added, changed,
+        or removed since the last load or refresh.  Only the revisions of the members are read, and
+        then only the changed members are fetched.
+
+        Notes
+        -----
+        A member is changed when either the IP node, or its 'ip_assigned' edge, has changed.  Changes
+        to the assigned node itself are not detected; use :meth:`load` for those.
+
+        Returns
+        -------
+        tuple
+            (changed, removed) counts
+        """
+        current = dict()
+        for ip_id, rev in self.client.query(self._query_member_revs, batch_size=self.batch_size,
+                                            stream=True, bind_vars={'rt_name': self.rt_node['name']}):
+            current[ip_id] = rev
+
+        removed = self._revs.keys() - current.keys()
+        changed = [ip_id for ip_id, rev in current.items() if self._revs.get(ip_id) != rev]
+
+        for ip_id in removed:
+            self.table.remove(ip_id)
+            del self._revs[ip_id]
+
+        if changed:
+            for item in self.client.query(self._query_changed_members, batch_size=self.batch_size,
+                                          bind_vars={'ip_ids': changed}):
+                self.table.remove(item['ip']['_id'])
+                self._add(item)
+
+        return len(changed), len(removed)
+
+    def lookup(self, ip):
+        """
+        Return the longest prefix match of the address.
+
+        Parameters
+        ----------
+        ip : str
+            The address to lookup
+
+        Returns
+        -------
+        dict
+            ip: the IPNetwork or IPInterface node dict
+            assigned: the node dict the IP node is assigned to, or None
+        None
+            When no member of the routing table contains the address
+        """
+        return self.table.lookup(ip)
+
+    def lookup_many(self, ips):
+        """
+        Return the longest prefix match of each address, see :meth:`lookup`.
+
+        Parameters
+        ----------
+        ips : Iterable[str]
+            The addresses to lookup
+
+        Returns
+        -------
+        list
+            The lookup results in the same order as `ips`
+        """
+        return self.table.lookup_many(ips)
@@ -0,0 +1,243 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import json
+import logging
+import threading
+from hashlib import sha1
+from collections import Counter
+
+from first import first
+from arango.exceptions import AQLQueryExplainError
+
+from imnetdb.db.instrument import InstrumentedDatabase
+
+__all__ = ['SlowQueryLog', 'normalize_query', 'find_full_scans']
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+# the maximum length of the JSON bind vars written to the log
+
+_MAX_LOGGED_BIND_VARS = 1000
+
+
+def normalize_query(query):
+    """
+    Return the query template of an AQL query, the query text with the whitespace collapsed, so
+    that the executions of the same query (with different bind vars) are grouped together.
+    """
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+def _attribute_refs(ast, var_name):
+    found = set()
+    stack = [ast]
+
+    while stack:
+        node = stack.pop()
+        sub_nodes = node.get('subNodes') or []
+        if (node.get('type') == 'attribute access' and sub_nodes and sub_nodes[0].get('type') == 'reference'
+                and sub_nodes[0].get('name') == var_name):
+            found.add(node['name'])
+        stack.extend(sub_nodes)
+
+    return found
+
+
+def _plan_nodes(plan):
+    # the nodes of the plan, and of its subquery plans; servers before 3.8 run subqueries, for
+    # example the lookup of an UPSERT, as a separate plan within a SubqueryNode.
+
+    for node in plan.get('nodes', []):
+        yield node
+        if node['type'] == 'SubqueryNode' and node.get('subquery'):
+            yield from _plan_nodes(node['subquery'])
+
+
+def _is_full_scan(node):
+    if node['type'] == 'EnumerateCollectionNode':
+        return True
+
+    # an index enumeration without a lookup condition, for example one that only serves a SORT,
+    # reads every entry of the index.
+
+    if node['type'] == 'IndexNode':
+        condition = node.get('condition')
+        return not condition or not condition.get('subNodes')
+
+    return False
+
+
+def find_full_scans(plan):
+    """
+    Return the full collection scans of an ArangoDB EXPLAIN plan, including those of its subquery
+    plans, and for each the document attributes that the query filters the scanned documents on;
+    attributes that an index could serve.  An index enumeration without a lookup condition is a
+    full scan of the index.
+
+    Parameters
+    ----------
+    plan : dict
+        The execution plan, as returned by the python-arango aql.explain()
+
+    Returns
+    -------
+    list[dict]
+        collection: the name of the scanned collection
+        index: the name of the scanned index, or None for a scan of the collection documents
+        filter_attributes: the sorted list of the filtered attribute names, possibly empty
+    """
+    nodes = list(_plan_nodes(plan))
+    filter_vars = {node['inVariable']['name'] for node in nodes if node['type'] == 'FilterNode'}
+
+    filter_exprs = [node['expression'] for node in nodes
+                    if node['type'] == 'CalculationNode' and node['outVariable']['name'] in filter_vars]
+
+    full_scans = list()
+
+    for node in nodes:
+        if not _is_full_scan(node):
+            continue
+
+        var_name = node['outVariable']['name']
+
+        # filter conditions moved into the collection enumeration by the optimizer
+        exprs = filter_exprs + ([node['filter']] if node.get('filter') else [])
+
+        attributes = set()
+        for expr in exprs:
+            attributes |= _attribute_refs(expr, var_name)
+
+        index = None
+        if node['type'] == 'IndexNode':
+            index = first(index_info.get('name') for index_info in node.get('indexes') or []) or 'unknown'
+
+        full_scans.append(dict(collection=node['collection'], index=index, filter_attributes=sorted(attributes)))
+
+    return full_scans
+
+
+class SlowQueryLog(object):
+    """
+    An instrumentation hook (see :meth:`CommonDBClient.instrument`) that, for each AQL query slower
+    than a threshold, EXPLAINs the query, flags its full collection scans and the attributes they
+    are filtered on, logs it, and aggregates the slow queries by query template.
+
+    Each query template is explained once per distinct set of collection bind vars, since the
+    plan depends on the collection.
+
+    Examples
+    --------
+    slow_log = db.enable_slow_query_log(threshold=0.5)
+    ... run the application ...
+    print(slow_log.report())
+    """
+
+    def __init__(self, client, threshold=1.0, logger=None):
+        """
+        Parameters
+        ----------
+        client : CommonDBClient
+            The database client, used to EXPLAIN the slow queries
+
+        threshold : float (optional)
+            The wall time, in seconds, over which a query is logged
+
+        logger : logging.Logger (optional)
+            The logger; by default the "imnetdb.slowquery" logger
+        """
+        self.client = client
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger('imnetdb.slowquery')
+        self.templates = dict()
+        self._lock = threading.Lock()
+
+    def _explain(self, query, bind_vars):
+        db = self.client.db
+        if isinstance(db, InstrumentedDatabase):
+            db = db.wrapped
+
+        try:
+            return db.aql.explain(query, bind_vars=bind_vars), None
+        except AQLQueryExplainError as exc:
+            return None, str(exc)
+
+    def __call__(self, record):
+        if record.op != 'aql' or record.wall_time < self.threshold:
+            return
+
+        template = normalize_query(record.target)
+        template_id = sha1(template.encode('utf-8')).hexdigest()[:12]
+        bind_vars = record.bind_vars or dict()
+        collections = tuple(sorted((name, value) for name, value in bind_vars.items() if name.startswith('@')))
+
+        with self._lock:
+            entry = self.templates.get(template_id)
+            if entry is None:
+                entry = self.templates[template_id] = dict(
+                    template_id=template_id, query=template, count=0, total_time=0.0, max_time=0.0,
+                    handlers=Counter(), plans=dict())
+
+            entry['count'] += 1
+            entry['total_time'] += record.wall_time
+            entry['max_time'] = max(entry['max_time'], record.wall_time)
+            entry['handlers'][record.handler] += 1
+            plan_info = entry['plans'].get(collections)
+
+        if plan_info is None:
+            plan, error = self._explain(record.target, bind_vars)
+            plan_info = dict(plan=plan, error=error, full_scans=find_full_scans(plan) if plan else [])
+            with self._lock:
+                entry['plans'][collections] = plan_info
+
+        full_scans = ', '.join(f"{scan['collection']}{'/' + scan['index'] if scan['index'] else ''}"
+                               f"[{','.join(scan['filter_attributes'])}]"
+                               for scan in plan_info['full_scans'])
+
+        self.logger.warning(
+            'slow query %s: %.1f ms, handler=%s, full scans: %s, bind vars: %s\n%s',
+            template_id, record.wall_time * 1000, record.handler, full_scans or 'none',
+            json.dumps(bind_vars, default=str)[:_MAX_LOGGED_BIND_VARS], template)
+
+    def report(self):
+        """
+        Return the slow query templates as text, slowest total time first, with the handlers
+        that ran each, and the full collection scans and filtered attributes of their plans.
+        """
+        with self._lock:
+            entries = sorted(self.templates.values(), key=lambda entry: entry['total_time'], reverse=True)
+
+        lines = list()
+        for entry in entries:
+            lines.append(f"{entry['template_id']}: {entry['count']} slow, total {entry['total_time'] * 1000:.1f} ms, "
+                         f"max {entry['max_time'] * 1000:.1f} ms")
+            lines.append('  handlers: ' + ', '.join(f'{handler} ({count})'
+                                                    for handler, count in entry['handlers'].most_common()))
+
+            for collections, plan_info in entry['plans'].items():
+                binds = ', '.join(f'{name}={value}' for name, value in collections)
+                if plan_info['error']:
+                    lines.append(f'  explain failed{" for " + binds if binds else ""}: {plan_info["error"]}')
+                for scan in plan_info['full_scans']:
+                    attributes = ', '.join(scan['filter_attributes'])
+                    scanned = f"INDEX {scan['index']} OF " if scan['index'] else ''
+                    lines.append(f"  FULL SCAN {scanned}{scan['collection']}"
+                                 + (f' filtered on [{attributes}] (missing index?)' if attributes else '')
+                                 + (f' ({binds})' if binds else ''))
+
+            lines.append(f"  {entry['query']}")
+
+        return '\n'.join(lines)
@@ -0,0 +1,424 @@
+# Copyright 2019 Jeremy Schulman, nwkautomaniac@gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+__all__ = ['GraphSnapshot']
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _zeros(count):
+    return array('I', bytes(4 * count))
+
+
+def _csr(vertex_count, sources, targets):
+    """
+    Return the compressed sparse row (offsets, targets) arrays for the edges given by the
+    parallel sources and targets arrays of vertex ids.
+    """
+    offsets = _zeros(vertex_count + 1)
+    for source in sources:
+        offsets[source + 1] += 1
+
+    for vid in range(vertex_count):
+        offsets[vid + 1] += offsets[vid]
+
+    position = array('I', offsets[:-1])
+    csr_targets = _zeros(len(sources))
+
+    for source, target in zip(sources, targets):
+        csr_targets[position[source]] = target
+        position[source] += 1
+
+    return offsets, csr_targets
+
+
+class GraphSnapshot(object):
+    """
+    A compact, read-only, in-memory snapshot of the database graph for local analytics.
+
+    Each vertex is identified by an integer vertex id (vid).  The vertices of a collection have
+    consecutive vids, so only the document _key and the selected attribute values are stored per
+    vertex; string values are interned.  The edges of each edge collection are stored as compressed
+    sparse row (CSR) arrays in both the outbound and inbound directions.
+
+    Use :meth:`load` (or :meth:`IMNetDB.snapshot`) to create a snapshot from the database.  A
+    snapshot can also be built directly using :meth:`add_vertices` and then :meth:`add_edges`.
+    """
+
+    DIRECTIONS = ('outbound', 'inbound', 'any')
+
+    def __init__(self, attributes=()):
+        """
+        Parameters
+        ----------
+        attributes : Iterable[str] (optional)
+            The names of the vertex attributes to keep in the snapshot
+        """
+        self.attributes = tuple(attributes)
+
+        self._collections = list()
+        self._col_starts = list()
+        self._keys = list()
+        self._key_index = dict()
+        self._columns = {attr: list() for attr in self.attributes}
+
+        # edge_type -> (out_offsets, out_targets, in_offsets, in_targets)
+        self._edges = dict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def collections(self):
+        return list(self._collections)
+
+    @property
+    def edge_types(self):
+        return list(self._edges)
+
+    # -------------------------------------------------------------------------
+    # building
+    # -------------------------------------------------------------------------
+
+    def add_vertices(self, col_name, items):
+        """
+        Add the vertices of a collection.  All vertices must be added before any edges.
+
+        Parameters
+        ----------
+        col_name : str
+            The collection name
+
+        items : Iterable[Sequence]
+            Each item is the document _key followed by the values of the snapshot attributes
+        """
+        if self._edges:
+            raise RuntimeError('vertices must be added before edges')
+
+        if col_name in self._key_index:
+            raise ValueError(f'collection {col_name} already added')
+
+        self._collections.append(col_name)
+        self._col_starts.append(len(self._keys))
+        key_index = self._key_index[col_name] = dict()
+        columns = [self._columns[attr] for attr in self.attributes]
+
+        for key, *values in items:
+            key = sys.intern(key)
+            key_index[key] = len(self._keys)
+            self._keys.append(key)
+            for column, value in zip(columns, values):
+                column.append(_intern(value))
+
+    def add_edges(self, edge_type, items):
+        """
+        Add the edges of an edge collection.  Edges to, or from, a vertex that is not in the
+        snapshot are ignored.
+
+        Parameters
+        ----------
+        edge_type : str
+            The edge collection name
+
+        items : Iterable[tuple]
+            Each item is the (_from, _to) document ids of an edge
+        """
+        vertex_id = self.vertex_id
+        sources, targets = array('I'), array('I')
+
+        for from_id, to_id in items:
+            source, target = vertex_id(from_id), vertex_id(to_id)
+            if source is None or target is None:
+                continue
+            sources.append(source)
+            targets.append(target)
+
+        vertex_count = len(self._keys)
+        self._edges[edge_type] = _csr(vertex_count, sources, targets) + _csr(vertex_count, targets, sources)
+
+    _query_vertices = """
+    FOR doc IN @@col_name
+        RETURN APPEND([doc._key], (FOR attr IN @attributes RETURN doc[attr]))
+    """
+
+    _query_edges = """
+    FOR rel IN @@col_name
+        RETURN [rel._from, rel._to]
+    """
+
+    @classmethod
+    def load(cls, db, attributes=('name', 'device'), batch_size=10000):
+        """
+        Create a snapshot from the database, streaming each vertex and edge collection of the
+        database model once.
+
+        Parameters
+        ----------
+        db : IMNetDB
+            The instance of the database
+
+        attributes : Iterable[str] (optional)
+            The names of the vertex attributes to keep in the snapshot
+
+        batch_size : int (optional)
+            The number of documents fetched from the server per request
+
+        Returns
+        -------
+        GraphSnapshot
+        """
+        snapshot = cls(attributes=attributes)
+
+        for col_name in db.db_model['nodes']:
+            snapshot.add_vertices(col_name, db.query(
+                cls._query_vertices, batch_size=batch_size, stream=True, bind_vars={
+                    '@col_name': col_name,
+                    'attributes': list(snapshot.attributes)
+                }))
+
+        for edge_type in dict.fromkeys(edge_col for _from, edge_col, _to in db.db_model['edges']):
+            snapshot.add_edges(edge_type, db.query(
+                cls._query_edges, batch_size=batch_size, stream=True, bind_vars={
+                    '@col_name': edge_type
+                }))
+
+        return snapshot
+
+    # -------------------------------------------------------------------------
+    # vertices
+    # -------------------------------------------------------------------------
+
+    def vertex_id(self, doc_id):
+        """
+        Return the vertex id of the document id, for example "Device/spine1", or None if the
+        document is not in the snapshot.
+        """
+        col_name, _, key = doc_id.partition('/')
+        key_index = self._key_index.get(col_name)
+        return key_index.get(key) if key_index is not None else None
+
+    def collection_of(self, vid):
+        return self._collections[bisect_right(self._col_starts, vid) - 1]
+
+    def doc_id(self, vid):
+        """
+        Return the document id of the vertex id.
+        """
+        return f'{self.collection_of(vid)}/{self._keys[vid]}'
+
+    def vertex(self, vid):
+        """
+        Return the vertex as a dict of its _id and snapshot attributes.
+        """
+        node = {attr: self._columns[attr][vid] for attr in self.attributes}
+        node['_id'] = self.doc_id(vid)
+        return node
+
+    def vertices(self, col_name):
+        """
+        Return the range of vertex ids of the collection.
+        """
+        if col_name not in self._key_index:
+            return range(0)
+
+        start = self._col_starts[self._collections.index(col_name)]
+        return range(start, start + len(self._key_index[col_name]))
+
+    def find(self, col_name, **attrs):
+        """
+        Return the list of vertex ids of the collection whose snapshot attributes match `attrs`.
+        """
+        columns = [(self._columns[attr], value) for attr, value in attrs.items()]
+        return [vid for vid in self.vertices(col_name)
+                if all(column[vid] == value for column, value in columns)]
+
+    # -------------------------------------------------------------------------
+    # edges
+    # -------------------------------------------------------------------------
+
+    def _adjacency(self, edge_types, direction):
+        if direction not in self.DIRECTIONS:
+            raise ValueError(f'direction must be one of {self.DIRECTIONS}')
+
+        if edge_types is None:
+            edge_types = self._edges
+        elif isinstance(edge_types, str):
+            edge_types = [edge_types]
+
+        adjacency = list()
+        for edge_type in edge_types:
+            out_offsets, out_targets, in_offsets, in_targets = self._edges[edge_type]
+            if direction != 'inbound':
+                adjacency.append((out_offsets, out_targets))
+            if direction != 'outbound':
+                adjacency.append((in_offsets, in_targets))
+
+        return adjacency
+
+    @staticmethod
+    def _iter_neighbors(adjacency, vid):
+        for offsets, targets in adjacency:
+            yield from targets[offsets[vid]:offsets[vid + 1]]
+
+    def edge_count(self, edge_type):
+        return len(self._edges[edge_type][1])
+
+    def neighbors(self, vid, edge_types=None, direction='outbound'):
+        """
+        Return the list of vertex ids adjacent to the vertex.
+
+        Parameters
+        ----------
+        vid : int
+            The vertex id
+
+        edge_types : str|list[str] (optional)
+            The edge collections to follow, by default all of them
+
+        direction : str (optional)
+            One of 'outbound', 'inbound', 'any'
+
+        Returns
+        -------
+        list[int]
+        """
+        return list(self._iter_neighbors(self._adjacency(edge_types, direction), vid))
+
+    def degree(self, vid, edge_types=None, direction='outbound'):
+        return sum(offsets[vid + 1] - offsets[vid] for offsets, _targets in self._adjacency(edge_types, direction))
+
+    # -------------------------------------------------------------------------
+    # traversals
+    # -------------------------------------------------------------------------
+
+    def bfs(self, start, edge_types=None, direction='any', max_depth=None):
+        """
+        Breadth first traversal from the start vertex.
+
+        Parameters
+        ----------
+        start : int
+            The start vertex id
+
+        edge_types : str|list[str] (optional)
+            The edge collections to follow, by default all of them
+
+        direction : str (optional)
+            One of 'outbound', 'inbound', 'any'
+
+        max_depth : int (optional)
+            The maximum depth of the traversal
+
+        Yields
+        ------
+        tuple
+            (vid, depth) of each vertex reached, including the start vertex at depth 0
+        """
+        adjacency = self._adjacency(edge_types, direction)
+        visited = bytearray(len(self._keys))
+        visited[start] = 1
+        queue = deque([(start, 0)])
+
+        while queue:
+            vid, depth = queue.popleft()
+            yield vid, depth
+
+            if max_depth is not None and depth >= max_depth:
+                continue
+
+            for next_vid in self._iter_neighbors(adjacency, vid):
+                if not visited[next_vid]:
+                    visited[next_vid] = 1
+                    queue.append((next_vid, depth + 1))
+
+    def dfs(self, start, edge_types=None, direction='any', max_depth=None):
+        """
+        Depth first traversal from the start vertex; see :meth:`bfs` for the parameters.
+
+        Yields
+        ------
+        tuple
+            (vid, depth) of each vertex reached, in pre-order
+        """
+        adjacency = self._adjacency(edge_types, direction)
+        visited = bytearray(len(self._keys))
+        stack = [(start, 0)]
+
+        while stack:
+            vid, depth = stack.pop()
+            if visited[vid]:
+                continue
+
+            visited[vid] = 1
+            yield vid, depth
+
+            if max_depth is not None and depth >= max_depth:
+                continue
+
+            stack.extend((next_vid, depth + 1)
+                         for next_vid in reversed(list(self._iter_neighbors(adjacency, vid)))
+                         if not visited[next_vid])
+
+    def shortest_path(self, source, target, edge_types=None, direction='any'):
+        """
+        Return a shortest path between two vertices.
+
+        Parameters
+        ----------
+        source : int
+            The source vertex id
+
+        target : int
+            The target vertex id
+
+        edge_types : str|list[str] (optional)
+            The edge collections to follow, by default all of them
+
+        direction : str (optional)
+            One of 'outbound', 'inbound', 'any'
+
+        Returns
+        -------
+        list[int]
+            The vertex ids of the path, from source to target
+
+        None
+            If the target is not reachable from the source
+        """
+        adjacency = self._adjacency(edge_types, direction)
+        parent = {source: None}
+        queue = deque([source])
+
+        while queue:
+            vid = queue.popleft()
+            if vid == target:
+                path = list()
+                while vid is not None:
+                    path.append(vid)
+                    vid = parent[vid]
+                return path[::-1]
+
+            for next_vid in self._iter_neighbors(adjacency, vid):
+                if next_vid not in parent:
+                    parent[next_vid] = vid
+                    queue.append(next_vid)
+
+        return None
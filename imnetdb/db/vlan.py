@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from string import Template
+from itertools import product
+from bracket_expansion import expand
 from first import first
 from imnetdb.db.collection import NameKeyCollection, CommonNodeGroup
 
@@ -52,6 +55,196 @@ class VlanNodes(NameKeyCollection):
             'node': on_node
         }))
 
+    # each VLANGroup assigned to any of the nodes is expanded only once.
+
+    _query_attached_vlans_many = Template("""
+    LET assigned = (
+        FOR node_id IN ${node_ids}
+            FOR rel IN vlan_assigned
+                FILTER rel._to == node_id
+                RETURN {node_id: node_id, item_id: rel._from}
+    )
+
+    LET group_vlans = MERGE(
+        FOR group_id IN UNIQUE(
+            FOR item IN assigned
+                FILTER PARSE_IDENTIFIER(item.item_id).collection == 'VLANGroup'
+                RETURN item.item_id
+        )
+            RETURN {[group_id]: (FOR vlan IN INBOUND group_id vlan_member RETURN vlan)}
+    )
+
+    FOR item IN assigned
+        COLLECT node_id = item.node_id INTO item_ids = item.item_id
+        RETURN {
+            node_id: node_id,
+            vlans: FLATTEN(
+                FOR item_id IN item_ids
+                    RETURN PARSE_IDENTIFIER(item_id).collection == 'VLANGroup'
+                        ? group_vlans[item_id]
+                        : [DOCUMENT(item_id)]
+            )
+        }
+    """)
+
+    _query_device_node_ids = """UNION(
+        (FOR if_node IN OUTBOUND DOCUMENT('Device', @device_name) equip_interface RETURN if_node._id),
+        (FOR lag_node IN LAG FILTER lag_node.device == @device_name RETURN lag_node._id)
+    )"""
+
+    def get_attached_vlans_many(self, on_nodes):
+        """
+        Return the flat list of VLAN nodes assigned to each of the given nodes, as
+        :meth:`get_attached_vlans`, using a single query.
+
+        Parameters
+        ----------
+        on_nodes : list[dict]
+            The Interface or LAG node dicts
+
+        Returns
+        -------
+        dict
+            key: the node _id
+            value: the list of VLAN node items, an empty list if none.
+        """
+        node_ids = [node['_id'] for node in on_nodes]
+        attached = dict.fromkeys(node_ids)
+
+        query = self._query_attached_vlans_many.substitute(node_ids='@node_ids')
+        for item in self.query(query, bind_vars={'node_ids': node_ids}):
+            attached[item['node_id']] = item['vlans']
+
+        return {node_id: vlans or [] for node_id, vlans in attached.items()}
+
+    def get_device_attached_vlans(self, device_node):
+        """
+        Return the flat list of VLAN nodes assigned to each Interface and LAG of the device, using
+        a single query.
+
+        Parameters
+        ----------
+        device_node : dict
+            The Device node dict
+
+        Returns
+        -------
+        dict
+            key: the Interface or LAG node _id
+            value: the list of VLAN node items.  Only the nodes that have VLANs are included.
+        """
+        query = self._query_attached_vlans_many.substitute(node_ids=self._query_device_node_ids)
+        return {item['node_id']: item['vlans']
+                for item in self.query(query, bind_vars={'device_name': device_node['name']})}
+
+    # -------------------------------------------------------------------------
+    # VLAN ranges
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def expand_names(vlan_exprs):
+        """
+        Return the list of VLAN names given by bracket expressions, as used for interface names
+        in stencils.  For example "[100-3999]" is the names "100" through "3999", and
+        "vlan[100-110,2]" is the names "vlan100", "vlan102", ... "vlan110".
+
+        Parameters
+        ----------
+        vlan_exprs : str|list[str]
+            The bracket expression, or list of expressions.  A value without brackets is used
+            as a single name.
+
+        Returns
+        -------
+        list[str]
+        """
+        if isinstance(vlan_exprs, str):
+            vlan_exprs = [vlan_exprs]
+
+        return [name for expr in vlan_exprs for name in (expand(expr) if '[' in expr else [expr])]
+
+    def ensure_range(self, vlan_exprs, **fields):
+        """
+        Ensure the VLAN nodes given by bracket expressions exist, in a few bulk queries.
+
+        Parameters
+        ----------
+        vlan_exprs : str|list[str]
+            The VLAN name expressions, see :meth:`expand_names`
+
+        fields : kwargs
+            The fields stored into every VLAN node
+
+        Returns
+        -------
+        list[dict]
+            The VLAN node dicts
+        """
+        return self.ensure_many(self.expand_names(vlan_exprs), **fields)
+
+    _query_missing_names = """
+    FOR name IN @names
+        FILTER DOCUMENT(@col_name, name) == null
+        RETURN name
+    """
+
+    def assign_range(self, vlan_exprs, on_nodes, present=True):
+        """
+        Ensure that each of the VLANs given by bracket expressions is assigned (present=True),
+        or not (present=False), to each of the nodes.  The 'vlan_assigned' edges are written in
+        bulk.  The VLANs must already exist, see :meth:`ensure_range`.
+
+        Parameters
+        ----------
+        vlan_exprs : str|list[str]
+            The VLAN name expressions, see :meth:`expand_names`
+
+        on_nodes : list[dict]
+            The Interface or LAG node dicts
+
+        present : bool
+            If True ensure the assignments exist.
+            If False ensure the assignments do not exist.
+
+        Raises
+        ------
+        ValueError
+            When assigning VLANs that do not exist.  No assignments are written in this case.
+        """
+        names = self.expand_names(vlan_exprs)
+
+        if present is True:
+            missing = list(self.query(self._query_missing_names, bind_vars={
+                'names': names,
+                'col_name': self.COLLECTION_NAME
+            }))
+            if missing:
+                raise ValueError('VLANs do not exist', missing)
+
+        vlan_nodes = [dict(_id=f'{self.COLLECTION_NAME}/{name}') for name in names]
+        self.assign_many(vlan_nodes, on_nodes, present=present)
+
+    def assign_many(self, vlan_nodes, on_nodes, present=True):
+        """
+        Ensure that each of the VLAN, or VLANGroup, nodes is assigned (present=True), or not
+        (present=False), to each of the nodes.  The 'vlan_assigned' edges are written in bulk.
+
+        Parameters
+        ----------
+        vlan_nodes : list[dict]
+            The VLAN or VLANGroup node dicts
+
+        on_nodes : list[dict]
+            The Interface or LAG node dicts
+
+        present : bool
+            If True ensure the assignments exist.
+            If False ensure the assignments do not exist.
+        """
+        self.client.ensure_edges(((vlan_node, 'vlan_assigned', on_node)
+                                  for on_node, vlan_node in product(on_nodes, vlan_nodes)),
+                                 present=present)
+
 
 class VlanGroupNodes(NameKeyCollection, CommonNodeGroup):
     COLLECTION_NAME = 'VLANGroup'
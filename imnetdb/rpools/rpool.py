@@ -11,11 +11,21 @@ class ResourcePool(object):
 
     def __init__(self, client, collection_name, value_type=str):
         self.client = client
-        self.db = client.db
-        self.query = client.query
-        self.col = client.ensure_collection(collection_name)
+        self.col_name = client.ensure_collection(collection_name).name
         self.value_type = value_type
 
+    @property
+    def db(self):
+        return self.client.db
+
+    @property
+    def col(self):
+        return self.client.db.collection(self.col_name)
+
+    @property
+    def query(self):
+        return self.client.query
+
     def __iter__(self):
         return self.col.all()
 
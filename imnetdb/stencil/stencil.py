@@ -108,8 +108,24 @@ class Stencils(object):
                                 stencil_name=stencil_name,
                                 stencil_def=stencil_def)
 
-    def ensure_device(self, db, stencil_def, device_name, **device_fields):
-        nodes = dict(interfaces=dict())
+    def device_state(self, stencil_def, **device_fields):
+        """
+        Return the Device node fields and the Interface node fields that a device built from the
+        stencil has, without writing anything to the database.
+
+        Parameters
+        ----------
+        stencil_def : dict
+            The stencil definition, as returned by indexing the stencils by name
+
+        device_fields : kwargs
+            Additional device fields; these take precedence over the stencil fields
+
+        Returns
+        -------
+        tuple
+            (device fields dict, dict of interface name -> interface fields dict)
+        """
 
         # remove the stencil "meta" information so it is not stored into the
         # device DB node
@@ -123,6 +139,12 @@ class Stencils(object):
 
         udf_data['stencil'] = stencil_def['name']
 
+        return udf_data, deepcopy(dict(stencil_def['interfaces']))
+
+    def ensure_device(self, db, stencil_def, device_name, **device_fields):
+        nodes = dict(interfaces=dict())
+        udf_data, interfaces = self.device_state(stencil_def, **device_fields)
+
         # --------------------------------------------------------
         # now ensure the Device node and the associated interfaces
         # --------------------------------------------------------
@@ -130,7 +152,7 @@ class Stencils(object):
         device_node = db.devices.ensure(device_name, **udf_data)
         nodes['device'] = device_node
 
-        for if_name, if_fields in stencil_def['interfaces'].items():
+        for if_name, if_fields in interfaces.items():
             if_node = db.interfaces.ensure((device_node, if_name), **if_fields)
             nodes['interfaces'][if_name] = if_node
 
@@ -0,0 +1,66 @@
+"""
+Benchmark the fabric path and single-failure analysis on a generated Clos topology, without a
+database server:
+
+    python tests/benchmarks/bench_fabric_clos.py --spines 64 --leafs 512 --processes 8
+"""
+
+import argparse
+import time
+
+from imnetdb.db.snapshot import GraphSnapshot
+from imnetdb.db.fabric import FabricTopology
+
+
+def clos_snapshot(spines, leafs):
+    spine_names = [f'spine{index}' for index in range(1, spines + 1)]
+    leaf_names = [f'leaf{index}' for index in range(1, leafs + 1)]
+
+    interfaces, equip_interface, cabled, cables = list(), list(), list(), list()
+
+    for leaf in leaf_names:
+        for spine_index, spine in enumerate(spine_names, start=1):
+            leaf_if, spine_if = f'{leaf}-{spine}', f'{spine}-{leaf}'
+            interfaces.extend([(leaf_if, f'uplink{spine_index}'), (spine_if, leaf)])
+            equip_interface.extend([(f'Device/{leaf}', f'Interface/{leaf_if}'),
+                                    (f'Device/{spine}', f'Interface/{spine_if}')])
+            cable = f'{leaf}-{spine}'
+            cables.append((cable, None))
+            cabled.extend([(f'Interface/{leaf_if}', f'Cable/{cable}'),
+                           (f'Interface/{spine_if}', f'Cable/{cable}')])
+
+    snapshot = GraphSnapshot(attributes=FabricTopology.SNAPSHOT_ATTRIBUTES)
+    snapshot.add_vertices('Cable', cables)
+    snapshot.add_vertices('Device', [(name, name) for name in spine_names + leaf_names])
+    snapshot.add_vertices('Interface', interfaces)
+    snapshot.add_vertices('LAG', [])
+    snapshot.add_edges('equip_interface', equip_interface)
+    snapshot.add_edges('cabled', cabled)
+    snapshot.add_edges('lag_member', [])
+
+    return snapshot, leaf_names
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spines', type=int, default=64)
+    parser.add_argument('--leafs', type=int, default=512)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    snapshot, leaf_names = clos_snapshot(args.spines, args.leafs)
+    topology = FabricTopology(snapshot)
+    built = time.perf_counter()
+
+    result = topology.analyze(endpoints=leaf_names, processes=args.processes)
+    done = time.perf_counter()
+
+    print(f'devices={len(topology.device_names)} links={len(topology.links)} pairs={len(result["pairs"])}')
+    print(f'build: {built - start:.2f}s  analyze: {done - built:.2f}s')
+    print('most impactful device:', result['devices'][0])
+    print('most impactful link:', result['links'][0])
+
+
+if __name__ == '__main__':
+    main()
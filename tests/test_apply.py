@@ -0,0 +1,91 @@
+import pytest
+
+from imnetdb.db.apply import Plan, _desired
+
+
+STENCILS = {
+    'leaf': dict(role='leaf', interfaces={
+        'Ethernet[1-2]': dict(role='fabric'),
+        'Ethernet[3-4]': dict(role='server')
+    })
+}
+
+
+def desired(**changes):
+    state = dict(
+        stencils=STENCILS,
+        devices={'leaf1': dict(stencil='leaf'), 'leaf2': dict(stencil='leaf')},
+        lags={'leaf1': {'ae1': dict(interfaces=['Ethernet1', 'Ethernet2'])}},
+        cables=[('leaf1', 'Ethernet1', 'leaf2', 'Ethernet1'), ('leaf1', 'Ethernet2', 'leaf2', 'Ethernet2')],
+        vlans={'100': dict(assigned=[dict(device='leaf1', lag='ae1')])},
+        ip_interfaces={'default': {'10.0.0.0/31': dict(assigned=dict(device='leaf1', lag='ae1'))}}
+    )
+    state.update(changes)
+    return state
+
+
+def test_plan_format():
+    plan = Plan()
+    plan.add('create', 'device', 'leaf1', dict(name='leaf1'))
+    plan.add('update', 'interface', ('leaf1', 'Ethernet1'), dict(role='server'))
+    assert plan.format() == '+ device leaf1\n~ interface leaf1:Ethernet1 {"role": "server"}'
+    assert plan.summary()['device']['create'] == 1
+    assert Plan().format() == 'no changes'
+
+
+def test_apply(imnetdb, capsys):
+    imnetdb.reset_database()
+
+    result = imnetdb.apply(desired(), dry_run=True)
+    assert '+ device leaf1' in capsys.readouterr().out
+    assert imnetdb.devices.col.count() == 0
+
+    result = imnetdb.apply(desired())
+    summary = result['plan'].summary()
+    assert summary['interface']['create'] == 8
+    assert summary['cable']['create'] == 2
+    assert result['cabling']['created'] == 2
+
+    assert imnetdb.devices['leaf1']['stencil'] == 'leaf'
+    assert len(imnetdb.lags.get_members(imnetdb.lags[(imnetdb.devices['leaf1'], 'ae1')])) == 2
+    assert imnetdb.db.collection('ip_assigned').count() == 1
+
+    # re-applying the same state makes no changes.
+
+    assert len(imnetdb.apply(desired())['plan']) == 0
+
+
+def test_apply_update_and_prune(imnetdb):
+    result = imnetdb.apply(desired(
+        devices={'leaf1': dict(stencil='leaf', role='border')},
+        interfaces={'leaf1': {'Ethernet3': dict(role='uplink')}},
+        lags={'leaf1': {'ae1': dict(interfaces=['Ethernet1'])}},
+        cables=[('leaf1', 'Ethernet1', 'leaf1', 'Ethernet4')]
+    ), prune=True)
+
+    plan = result['plan']
+    assert plan.of('device', 'update')[0].fields == dict(role='border')
+    assert plan.of('interface', 'update')[0].fields == dict(role='uplink')
+    assert [action.key for action in plan.of('device', 'delete')] == ['leaf2']
+    assert [action.key for action in plan.of('lag_member', 'delete')] == [('leaf1', 'ae1', 'Ethernet2')]
+
+    assert 'leaf2' not in imnetdb.devices
+    assert imnetdb.db.collection('Interface').count() == 4
+    assert imnetdb.db.collection('Cable').count() == 1
+
+
+def test_apply_unknown_target(imnetdb):
+    with pytest.raises(ValueError):
+        imnetdb.apply(desired(vlans={'200': dict(assigned=[dict(device='leaf1', lag='ae9')])}))
+
+
+def test_desired_missing_stencils():
+    with pytest.raises(ValueError, match='does not include stencils'):
+        _desired(desired(stencils=None))
+
+
+def test_apply_not_atomic(imnetdb):
+    imnetdb.reset_database()
+
+    imnetdb.apply(desired(), atomic=False)
+    assert imnetdb.apply(desired(), atomic=False)['plan'].format() == 'no changes'
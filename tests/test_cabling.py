@@ -46,3 +46,43 @@ def test_cabling_remove(imnetdb):
 
     found_1 = imnetdb.cabling.find(interface_nodes=[if_0])
     assert found_1 is None
+
+
+def test_cabling_ensure_many(imnetdb):
+    plan = [
+        ('spine1', 'eth1', 'leaf1', 'eth0'),
+        ('spine1', 'eth2', 'leaf1', 'eth2', dict(mode='copper')),
+        ('spine1', 'eth1', 'leaf1', 'eth2'),
+        ('spine1', 'eth9', 'leaf1', 'eth0'),
+    ]
+
+    result = imnetdb.cabling.ensure_many(iter(plan), role='leaf-spine')
+
+    assert result['created'] == 2
+    assert len(result['conflicts']) == 1
+    assert len(result['missing']) == 1
+
+    # running the same plan again does not create any new cables
+
+    result = imnetdb.cabling.ensure_many(plan[0:2])
+    assert result['created'] == 0
+    assert result['existing'] == 2
+
+
+def test_cabling_trace_path(imnetdb):
+    server = imnetdb.devices.ensure('server1', role='server')
+    panel = imnetdb.devices.ensure('panel1', role='patch-panel')
+    leaf1 = imnetdb.devices['leaf1']
+
+    srv_if = imnetdb.interfaces.ensure((server, 'eth0'))
+    front_if = imnetdb.interfaces.ensure((panel, 'port1-front'))
+    rear_if = imnetdb.interfaces.ensure((panel, 'port1-rear'))
+    leaf_if = imnetdb.interfaces.ensure((leaf1, 'eth3'))
+
+    imnetdb.cabling.ensure_pass_through([front_if, rear_if])
+    imnetdb.cabling.ensure([srv_if, front_if])
+    imnetdb.cabling.ensure([rear_if, leaf_if])
+
+    path = imnetdb.cabling.trace_path(srv_if)
+    if_path = [node['_id'] for node in path if node['_id'].startswith('Interface/')]
+    assert if_path == [srv_if['_id'], front_if['_id'], rear_if['_id'], leaf_if['_id']]
@@ -34,3 +34,42 @@ def test_device_group(imnetdb):
         device_node = imnetdb.devices.ensure(device_name, **device_info)
         devices[device_name]['node'] = device_node
         imnetdb.device_groups.add_member(group_node, device_node)
+
+
+def test_device_group_set_members(imnetdb):
+    group_node = imnetdb.device_groups.ensure('bulkgroup')
+    device_nodes = [imnetdb.devices.ensure('bulk-{}'.format(num)) for num in range(10)]
+
+    imnetdb.device_groups.add_members(group_node, device_nodes[0:6])
+    assert len(imnetdb.device_groups.get_members(group_node)) == 6
+
+    imnetdb.device_groups.del_members(group_node, device_nodes[0:2])
+    assert len(imnetdb.device_groups.get_members(group_node)) == 4
+
+    changes = imnetdb.device_groups.set_members(group_node, device_nodes[4:10])
+    assert changes == dict(added=4, removed=2)
+    assert set(imnetdb.device_groups.get_members(group_node)) == {node['name'] for node in device_nodes[4:10]}
+
+
+def test_device_group_nested(imnetdb):
+    db_groups = imnetdb.device_groups
+
+    fabric = db_groups.ensure('fabric')
+    leafs, spines = db_groups['leafgroup-01'], db_groups['spinegroup-01']
+    db_groups.add_members(fabric, [leafs, spines])
+
+    members = db_groups.get_members_many([fabric, leafs])
+    assert set(members[fabric['_id']]) == {'leafgroup-01', 'spinegroup-01'}
+    assert set(members[leafs['_id']]) == {'leaf01-1', 'leaf01-2'}
+
+    members = db_groups.get_members_many([fabric], depth=2)
+    assert {'leaf01-1', 'spine01-2'} <= set(members[fabric['_id']])
+
+    leaf = imnetdb.devices['leaf01-1']
+    groups = db_groups.groups_of([leaf], depth=2)
+    assert {group['name'] for group in groups[leaf['_id']]} == {'leafgroup-01', 'fabric'}
+
+    # the nested groups are not devices of the fabric group
+
+    assert list(imnetdb.cabling.trace_group_paths(fabric)) == []
+    assert imnetdb.lags.get_cabling(return_list=True, scope=fabric) == []
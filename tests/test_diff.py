@@ -0,0 +1,53 @@
+from imnetdb.db.diff import diff_collection, doc_hash, diff_summary
+
+
+def export_order(docs):
+    return sorted(docs, key=lambda doc: doc['_key'])
+
+
+def test_doc_hash_ignores_meta():
+    assert doc_hash(dict(_key='a', _rev='1', x=1)) == doc_hash(dict(_key='a', _id='c/a', _rev='2', x=1))
+    assert doc_hash(dict(_key='a', x=1)) != doc_hash(dict(_key='a', x=2))
+
+
+def test_diff_collection():
+    old = export_order([dict(_key=f'd{index}', role='leaf', asn=index) for index in range(100)])
+    new = export_order([dict(_key=f'd{index}', role='leaf', asn=index) for index in range(1, 101)])
+    new = [dict(doc, role='spine', os='eos') if doc['_key'] == 'd50' else doc for doc in new]
+
+    changes = {change['key']: change for change in diff_collection(old, new)}
+    assert changes == {
+        'd0': dict(change='removed', key='d0'),
+        'd100': dict(change='added', key='d100'),
+        'd50': dict(change='changed', key='d50', fields=['os', 'role'])
+    }
+
+
+def test_diff_collection_collation_order():
+    # the server collation orders mixed case and punctuated keys differently from Python
+    keys = ['leaf1', 'Spine1', 'Ethernet1-1', 'Ethernet1/1', 'ethernet1_1', 'LEAF1']
+    old = [dict(_key=key, role='old' if key == 'Ethernet1/1' else 'same') for key in keys]
+    new = [dict(_key=key, role='same') for key in reversed(keys[1:])] + [dict(_key='Spine2', role='same')]
+
+    changes = list(diff_collection(old, new))
+    assert changes == [
+        dict(change='changed', key='Ethernet1/1', fields=['role']),
+        dict(change='removed', key='leaf1'),
+        dict(change='added', key='Spine2')
+    ]
+
+
+def test_diff_export_against_live(imnetdb, tmp_path):
+    imnetdb.reset_database()
+    imnetdb.devices.ensure('spine1', role='spine')
+    imnetdb.devices.ensure('leaf1', role='leaf')
+    imnetdb.export(str(tmp_path))
+
+    imnetdb.devices.ensure('leaf1', role='border')
+    imnetdb.devices.ensure('leaf2', role='leaf')
+
+    summary = diff_summary(str(tmp_path), imnetdb)
+    assert summary['Device']['added'] == 1
+    assert summary['Device']['changed'] == 1
+    assert summary['Device']['fields'] == {'role': 1}
+    assert list(summary) == ['Device']
@@ -0,0 +1,35 @@
+from imnetdb.db.dump import read_manifest, iter_export_docs
+
+
+def test_export_import(imnetdb, tmp_path):
+    imnetdb.reset_database()
+
+    spine = imnetdb.devices.ensure('spine1', role='spine')
+    leaf = imnetdb.devices.ensure('leaf1', role='leaf')
+    spine_if = imnetdb.interfaces.ensure((spine, 'Ethernet1'))
+    leaf_if = imnetdb.interfaces.ensure((leaf, 'Ethernet1'))
+    imnetdb.cabling.ensure((spine_if, leaf_if))
+
+    pool = imnetdb.resource_pool('asn_pool', value_type=int)
+    pool.add_batch(range(65000, 65010))
+
+    manifest = imnetdb.export(str(tmp_path))
+    by_name = {col_info['name']: col_info for col_info in manifest['collections']}
+    assert by_name['Device']['count'] == 2
+    assert by_name['cabled']['edge'] is True
+    assert by_name['asn_pool']['count'] == 10
+    assert read_manifest(str(tmp_path)) == manifest
+    assert {doc['_key'] for doc in iter_export_docs(str(tmp_path), 'Device')} == {'spine1', 'leaf1'}
+
+    imnetdb.reset_database()
+    counts = imnetdb.import_(str(tmp_path))
+    assert counts['Interface'] == 2
+
+    assert imnetdb.devices.col.get('spine1')['role'] == 'spine'
+    assert imnetdb.db.collection('asn_pool').count() == 10
+    assert imnetdb.db.collection('cabled').count() == 2
+
+    # the indexes dropped for the load are recreated
+
+    assert ['device', 'name'] in [index['fields'] for index in imnetdb.db.collection('Interface').indexes()]
+    assert [doc['_key'] for doc in iter_export_docs(str(tmp_path), 'Device')] == ['leaf1', 'spine1']
@@ -0,0 +1,56 @@
+def test_ensure_unchanged(imnetdb):
+    imnetdb.reset_database()
+
+    with imnetdb.ensure_stats() as stats:
+        device = imnetdb.devices.ensure('leaf1', role='leaf')
+    assert stats == {'created': 1}
+
+    with imnetdb.ensure_stats() as stats:
+        same = imnetdb.devices.ensure('leaf1', role='leaf')
+        assert same['_rev'] == device['_rev']
+        assert stats['unchanged'] == 1
+
+        changed = imnetdb.devices.ensure('leaf1', role='border')
+        assert changed['_rev'] != device['_rev']
+        assert changed['role'] == 'border'
+        assert stats['updated'] == 1
+
+
+def test_ensure_none_fields_unchanged(imnetdb):
+    imnetdb.reset_database()
+    device = imnetdb.devices.ensure('leaf1', role='leaf', serial=None)
+    assert 'serial' not in device
+
+    with imnetdb.ensure_stats() as stats:
+        same = imnetdb.devices.ensure('leaf1', role='leaf', serial=None)
+        assert same['_rev'] == device['_rev']
+        imnetdb.devices.ensure_many(['leaf1'], role='leaf', serial=None)
+    assert stats == {'unchanged': 2}
+
+    # a None field removes a stored field, so it is an update
+
+    with imnetdb.ensure_stats() as stats:
+        removed = imnetdb.devices.ensure('leaf1', role=None)
+    assert 'role' not in removed
+    assert stats == {'updated': 1}
+
+
+def test_ensure_tuple_key_and_edges_unchanged(imnetdb):
+    imnetdb.reset_database()
+    device = imnetdb.devices.ensure('leaf1')
+    if_node = imnetdb.interfaces.ensure((device, 'Ethernet1'), role='server')
+
+    with imnetdb.ensure_stats() as stats:
+        again = imnetdb.interfaces.ensure((device, 'Ethernet1'), role='server')
+        assert again['_rev'] == if_node['_rev']
+        assert stats['created'] == 0
+
+        imnetdb.ensure_edges([(device, 'equip_interface', if_node)] * 2)
+        assert imnetdb.db.collection('equip_interface').count() == 1
+
+        with imnetdb.ensure_stats() as inner:
+            nodes = imnetdb.devices.ensure_many(['leaf1', 'leaf2'])
+        assert [node['name'] for node in nodes] == ['leaf1', 'leaf2']
+        assert inner == {'created': 1, 'unchanged': 1}
+
+    assert stats == {'created': 1, 'unchanged': 4}
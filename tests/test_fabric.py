@@ -0,0 +1,67 @@
+from imnetdb.db.snapshot import GraphSnapshot
+from imnetdb.db.fabric import FabricTopology
+
+
+def make_topology():
+    # leaf1 -> spine1 by a LAG of two cables; leaf3 -> spine2 by two parallel cables; the other
+    # leaf/spine pairs by one cable each.
+
+    cables = [
+        ('leaf1', 'spine1', 'lag'), ('leaf1', 'spine1', 'lag'), ('leaf1', 'spine2', None),
+        ('leaf2', 'spine1', None), ('leaf2', 'spine2', None),
+        ('leaf3', 'spine1', None), ('leaf3', 'spine2', None), ('leaf3', 'spine2', None),
+    ]
+
+    interfaces, equip_interface, cabled, lag_member = list(), list(), list(), list()
+    for index, (leaf, spine, lag) in enumerate(cables):
+        for device in (leaf, spine):
+            if_name = f'{device}-{index}'
+            interfaces.append((if_name, if_name))
+            equip_interface.append((f'Device/{device}', f'Interface/{if_name}'))
+            cabled.append((f'Interface/{if_name}', f'Cable/{index}'))
+            if lag:
+                lag_member.append((f'Interface/{if_name}', f'LAG/{device}-{lag}'))
+
+    snapshot = GraphSnapshot(attributes=('name',))
+    snapshot.add_vertices('Cable', [(str(index), None) for index in range(len(cables))])
+    snapshot.add_vertices('Device', [(name, name) for name in ('leaf1', 'leaf2', 'leaf3', 'spine1', 'spine2')])
+    snapshot.add_vertices('Interface', interfaces)
+    snapshot.add_vertices('LAG', [('leaf1-lag', 'lag'), ('spine1-lag', 'lag')])
+    snapshot.add_edges('equip_interface', equip_interface)
+    snapshot.add_edges('cabled', cabled)
+    snapshot.add_edges('lag_member', lag_member)
+
+    return FabricTopology(snapshot)
+
+
+def test_fabric_links():
+    topology = make_topology()
+    assert len(topology.links) == 7
+
+    lag_link = next(link for link in topology.links if isinstance(link['link_id'], tuple))
+    assert lag_link['link_id'] == ('LAG/leaf1-lag', 'LAG/spine1-lag')
+    assert lag_link['cables'] == ['Cable/0', 'Cable/1']
+
+
+def test_fabric_analyze():
+    topology = make_topology()
+    result = topology.analyze(endpoints=['leaf1', 'leaf2', 'leaf3'])
+
+    assert result['pairs'][('leaf1', 'leaf2')] == dict(hops=2, paths=2)
+    assert result['pairs'][('leaf1', 'leaf3')] == dict(hops=2, paths=3)
+    assert result['pairs'][('leaf2', 'leaf3')] == dict(hops=2, paths=3)
+
+    devices = {item['device']: item for item in result['devices']}
+    assert devices['spine2']['paths'] == 5
+    assert devices['spine1']['paths'] == 3
+    assert devices['leaf1']['paths'] == 0
+    assert result['devices'][0]['device'] == 'spine2'
+
+    lag_link = next(link for link in result['links'] if isinstance(link['link_id'], tuple))
+    assert lag_link['paths'] == 2
+    assert abs(lag_link['share'] - (1 / 2 + 1 / 3)) < 1e-9
+
+
+def test_fabric_analyze_processes():
+    topology = make_topology()
+    assert topology.analyze(processes=2)['pairs'] == topology.analyze()['pairs']
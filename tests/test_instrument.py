@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+from imnetdb.db.instrument import CallRecord, QueryStats, MeteredHTTPClient, Instrumentation
+
+
+def make_record(handler, wall_time, rows=1):
+    return CallRecord(handler=handler, entry=handler, op='aql', target='RETURN 1', bind_vars=None, wall_time=wall_time,
+                      server_time=wall_time / 2, bind_size=0, rows=rows, has_more=False, bytes=100,
+                      profile=None)
+
+
+def test_query_stats():
+    stats = QueryStats()
+    stats(make_record('DeviceNodes.ensure', 0.0005))
+    stats(make_record('DeviceNodes.ensure', 0.003, rows=2))
+    stats(make_record('LAGNodes.catalog', 1.5, rows=100))
+
+    as_dict = stats.as_dict()
+    ensure = as_dict[('DeviceNodes.ensure', 'aql')]
+    assert ensure['count'] == 2
+    assert ensure['rows'] == 3
+    assert ensure['histogram'][0] == 1 and ensure['histogram'][2] == 1
+
+    report = stats.report()
+    assert report.splitlines()[1].startswith('LAGNodes.catalog')
+    assert '<=2000ms:1' in report
+
+
+class FakeHTTPClient(object):
+
+    def __init__(self, response):
+        self.response = response
+
+    def send_request(self, *args, **kwargs):
+        return self.response
+
+
+def test_metered_bytes():
+    response = SimpleNamespace(headers={}, raw_body='caf\u00e9')
+    http_client = MeteredHTTPClient(FakeHTTPClient(response))
+    records = list()
+    instr = Instrumentation(hooks=[records.append])
+
+    # only the responses of an instrumented call are counted, as UTF-8 bytes
+
+    http_client.send_request()
+    instr.call('collection.get', 'Device', http_client.send_request, (), {})
+    assert records[0].bytes == 5
+    assert records[0].handler == records[0].entry == '<application>'
+
+    response.headers = {'Content-Length': '42'}
+    instr.call('collection.get', 'Device', http_client.send_request, (), {})
+    assert records[1].bytes == 42
+
+
+def test_instrument_client(imnetdb):
+    imnetdb.reset_database()
+    records = list()
+    instr = imnetdb.instrument(hooks=[records.append])
+
+    try:
+        device = imnetdb.devices.ensure('leaf1')
+        imnetdb.interfaces.ensure((device, 'Ethernet1'))
+        assert 'leaf1' in imnetdb.devices
+    finally:
+        imnetdb.uninstrument()
+
+    handlers = {record.handler for record in records}
+    assert {'DeviceNodes.ensure', 'InterfaceNodes.ensure', 'DeviceNodes.__contains__'} <= handlers
+    assert 'IMNetDB.ensure_edge' in handlers
+    assert {record.entry for record in records if record.handler == 'IMNetDB.ensure_edge'} == {'InterfaceNodes.ensure'}
+    assert all(record.bytes > 0 for record in records)
+    assert ('DeviceNodes.__contains__', 'collection.has') in instr.stats.as_dict()
+
+    count = len(records)
+    imnetdb.devices.ensure('leaf2')
+    assert len(records) == count
@@ -1,5 +1,10 @@
+import pytest
 from itertools import islice
-from ipaddress import ip_network
+from ipaddress import ip_network, ip_interface
+
+from imnetdb.db.ipaddrs import sweep_ip_conflicts, ip_value_fields, resolve_ips, iter_all_assignments
+from imnetdb.db.ipaddrs import backfill_ip_value_fields
+from imnetdb.db.ipaddrs import IPAddressNodes, IPInterfaceNodes
 
 
 def test_basci_routing_table(imnetdb):
@@ -35,3 +40,152 @@ def test_basci_routing_table(imnetdb):
     members = db_rt.get_network_members(rt_global)
     assert [n['ip']['name'] for n in members] == [str(this_net)]
 
+
+def test_ip_ensure_many(imnetdb):
+    rt_global = imnetdb.routing_tables.ensure('global')
+    this_net = ip_network('192.168.20.0/24')
+
+    ip_nodes = imnetdb.ip_host_addrs.ensure_many(
+        ((rt_global, str(ip_host)) for ip_host in islice(this_net.hosts(), 0, 100)),
+        role='loopback')
+
+    assert len(ip_nodes) == 100
+    assert all(node['role'] == 'loopback' for node in ip_nodes)
+
+    members = {h['ip']['name'] for h in imnetdb.routing_tables.get_host_members(rt_global)}
+    assert {node['name'] for node in ip_nodes} <= members
+
+
+def test_ip_ensure_many_invalid(imnetdb):
+    rt_global = imnetdb.routing_tables['global']
+
+    with pytest.raises(ValueError):
+        imnetdb.ip_net_addrs.ensure_many([(rt_global, '10.1.1.1/24')])
+
+
+def test_ip_key_normalized():
+    rt_global = dict(_id='RoutingTable/global', name='global')
+    db_ip_if = IPInterfaceNodes(client=None)
+
+    assert db_ip_if._key((rt_global, '2001:0db8:0:0::0001/64')) == db_ip_if._key((rt_global, '2001:db8::1/64'))
+
+    assert IPAddressNodes(client=None)._key((rt_global, '2001:db8:0::1', dict(group='a'))) == dict(
+        rt='global', name='2001:db8::1', group='a')
+    assert db_ip_if[(rt_global, 'not-an-ip')] is None
+
+
+def test_ip_shared_groups(imnetdb):
+    rt_global = imnetdb.routing_tables.ensure('global')
+
+    node_a = imnetdb.ip_host_addrs.ensure((rt_global, '10.77.0.1', dict(group='a')))
+    node_b = imnetdb.ip_host_addrs.ensure((rt_global, '10.77.0.1', dict(group='b')))
+    assert node_a['_id'] != node_b['_id']
+    assert (node_a['group'], node_b['group']) == ('a', 'b')
+
+    nodes = imnetdb.ip_host_addrs.ensure_many([(rt_global, '2001:db8::1', dict(group='a')),
+                                               (rt_global, '2001:db8:0::1', dict(group='b')),
+                                               (rt_global, '10.77.0.1', dict(group='a'))])
+    assert len({node['_id'] for node in nodes}) == 3
+    assert nodes[2]['_id'] == node_a['_id']
+    assert imnetdb.ip_host_addrs[(rt_global, '2001:db8::1', dict(group='b'))]['_id'] == nodes[1]['_id']
+
+
+def test_ip_range_queries(imnetdb):
+    db_rt = imnetdb.routing_tables
+    rt_global = db_rt['global']
+
+    found = db_rt.get_contained_in(rt_global, '192.168.10.0/28', collections=['IPAddress'])
+    assert [node['name'] for node in found] == ['192.168.10.{}'.format(num) for num in range(1, 11)]
+
+    found = db_rt.get_containing(rt_global, '192.168.10.5', collections=['IPNetwork'])
+    assert [node['name'] for node in found] == ['192.168.10.0/24']
+
+    found = db_rt.get_overlapping(rt_global, '192.168.0.0/16', collections=['IPNetwork'])
+    assert [node['name'] for node in found] == ['192.168.10.0/24']
+
+
+def test_ip_sweep_conflicts():
+    ip_nodes = [
+        dict(_id='IPNetwork/1', name='10.1.1.0/24', **ip_value_fields(ip_network('10.1.1.0/24'))),
+        dict(_id='IPInterface/1', name='10.1.1.1/30', **ip_value_fields(ip_interface('10.1.1.1/30'))),
+        dict(_id='IPInterface/2', name='10.1.1.2/30', **ip_value_fields(ip_interface('10.1.1.2/30'))),
+        dict(_id='IPInterface/3', name='10.1.1.5/24', **ip_value_fields(ip_interface('10.1.1.5/24'))),
+        dict(_id='IPInterface/4', name='10.1.2.1/30', **ip_value_fields(ip_interface('10.1.2.1/30'))),
+    ]
+
+    for ip_node in ip_nodes:
+        ip_node['version'] = 4
+
+    ip_nodes.sort(key=lambda ip_node: (ip_node['ip_start'], ip_node['ip_end']))
+
+    found = [(item['conflict'], [ip_node['name'] for ip_node in item['nodes']])
+             for item in sweep_ip_conflicts(ip_nodes)]
+
+    assert found == [('overlap', ['10.1.1.5/24', '10.1.1.1/30']),
+                     ('outside', ['10.1.2.1/30'])]
+
+
+def test_ip_sweep_conflicts_shared_end():
+    # the nested networks end on the same address, 10.1.1.255
+
+    ip_nodes = [
+        dict(_id='IPNetwork/1', name='10.1.0.0/16', **ip_value_fields(ip_network('10.1.0.0/16'))),
+        dict(_id='IPInterface/1', name='10.1.1.5/24', **ip_value_fields(ip_interface('10.1.1.5/24'))),
+        dict(_id='IPInterface/2', name='10.1.1.253/30', **ip_value_fields(ip_interface('10.1.1.253/30'))),
+        dict(_id='IPInterface/3', name='10.1.1.254/30', **ip_value_fields(ip_interface('10.1.1.254/30'))),
+    ]
+
+    for ip_node in ip_nodes:
+        ip_node['version'] = 4
+
+    found = [(item['conflict'], [ip_node['name'] for ip_node in item['nodes']])
+             for item in sweep_ip_conflicts(ip_nodes)]
+
+    assert found == [('overlap', ['10.1.1.5/24', '10.1.1.253/30'])]
+
+
+def test_ip_find_conflicts_unindexed(imnetdb):
+    rt_node = imnetdb.routing_tables.ensure('legacy')
+    imnetdb.ip_net_addrs.ensure((rt_node, '10.50.0.0/16'))
+    imnetdb.db.collection('IPInterface').insert(dict(rt='legacy', name='10.50.1.1/24', version=4))
+
+    found = list(imnetdb.routing_tables.find_conflicts(rt_node))
+    assert [(item['conflict'], [ip_node['name'] for ip_node in item['nodes']]) for item in found] == [
+        ('unindexed', ['10.50.1.1/24'])]
+
+    assert backfill_ip_value_fields(imnetdb)['IPInterface'] == 1
+    assert list(imnetdb.routing_tables.find_conflicts(rt_node)) == []
+
+
+def test_ip_resolve(imnetdb):
+    rt_global = imnetdb.routing_tables['global']
+    router = imnetdb.devices.ensure('router1')
+    if_node = imnetdb.interfaces.ensure((router, 'eth0'))
+    ipif_node = imnetdb.ip_if_addrs.ensure((rt_global, '10.9.9.1/30'))
+    imnetdb.ip_if_addrs.assign(ipif_node, if_node)
+
+    # the IPInterface has priority over an IPAddress with the same host address
+
+    imnetdb.ip_host_addrs.ensure((rt_global, '10.9.9.1'))
+
+    resolved = resolve_ips(imnetdb, ['10.9.9.1', '10.9.9.2', 'not-an-ip'], rt=rt_global)
+
+    assert resolved['10.9.9.1']['ip_node']['_id'] == ipif_node['_id']
+    assert resolved['10.9.9.1']['assigned']['_id'] == if_node['_id']
+    assert resolved['10.9.9.1']['device']['name'] == 'router1'
+    assert resolved['10.9.9.2'] is None
+    assert resolved['not-an-ip'] is None
+
+
+def test_ip_resolve_invalid():
+    # no valid addresses, so no query is made
+    assert resolve_ips(None, ['not-an-ip', '10.1.1.1/24']) == {'not-an-ip': None, '10.1.1.1/24': None}
+
+
+def test_ip_iter_all_assignments(imnetdb):
+    rt_global = imnetdb.routing_tables['global']
+
+    assigned = [item for node_type, item in iter_all_assignments(imnetdb, rt=rt_global, batch_size=10)
+                if node_type == 'interface']
+
+    assert [item['ip']['name'] for item in assigned] == ['10.9.9.1/30']
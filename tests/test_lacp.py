@@ -63,3 +63,56 @@ def test_lacp_basic(imnetdb):
 
     assert found_lacp0_peers == {("spine1", "lag0"), ("leaf1", "lag0")}
     assert found_lacp1_peers == {("spine1", "lag1"), ("leaf2", "lag0")}
+
+
+def test_lacp_sync_from_cabling(imnetdb):
+    imnetdb.cabling.ensure_many([
+        ('spine1', 'Ethernet42', 'leaf2', 'Ethernet30'),
+        ('spine1', 'Ethernet43', 'leaf2', 'Ethernet31'),
+        ('leaf1', 'Ethernet22', 'leaf2', 'Ethernet32'),
+        ('leaf1', 'Ethernet23', 'leaf2', 'Ethernet33'),
+    ])
+
+    # spine1:lag1 <-> leaf2:lag0 already has an LACP node, leaf1:lag1 <-> leaf2:lag1 does
+    # not, and the LACP between spine1:lag0 <-> leaf1:lag0 is not cabled.
+
+    result = imnetdb.lacp.sync_from_cabling(dry_run=True)
+    assert len(result['created']) == 1
+    assert imnetdb.lacp.col.count() == 2
+
+    result = imnetdb.lacp.sync_from_cabling(role='auto')
+    assert len(result['created']) == 1
+    assert result['existing'] == 1
+    assert [item['reason'] for item in result['inconsistent']] == ['LAGs are not cabled together']
+
+    result = imnetdb.lacp.sync_from_cabling()
+    assert result['created'] == []
+    assert result['existing'] == 2
+
+    # only one side of a cabled LAG peering has an LACP node
+
+    leaf2_lag0 = imnetdb.lags[(imnetdb.devices['leaf2'], 'lag0')]
+    imnetdb.db.collection('lacp_member').delete_match(filters={'_from': leaf2_lag0['_id']})
+
+    result = imnetdb.lacp.sync_from_cabling(dry_run=True)
+    assert [item['reason'] for item in result['inconsistent']] == ['one of the LAGs is not a member of an LACP']
+
+
+def test_lacp_find_many(imnetdb):
+    spine1, leaf1, leaf2 = (imnetdb.devices[name] for name in ('spine1', 'leaf1', 'leaf2'))
+    spine1_lag0, spine1_lag1 = imnetdb.lags[(spine1, 'lag0')], imnetdb.lags[(spine1, 'lag1')]
+    leaf1_lag0, leaf2_lag0 = imnetdb.lags[(leaf1, 'lag0')], imnetdb.lags[(leaf2, 'lag0')]
+
+    found = imnetdb.lacp.find_many([
+        (spine1_lag0, leaf1_lag0),
+        (spine1_lag0,),
+        (spine1_lag0, leaf2_lag0),
+    ])
+
+    assert found[0]['peering_node'] == imnetdb.lacp.find([spine1_lag0])['peering_node']
+    assert {peer['_id'] for peer in found[1]['peer_nodes']} == {spine1_lag0['_id'], leaf1_lag0['_id']}
+    assert 'error' in found[2]
+
+    lacp_nodes = imnetdb.lacp.ensure_many([(spine1_lag0, leaf1_lag0), (spine1_lag1, leaf2_lag0)])
+    found = imnetdb.lacp.find_many([(spine1_lag0,), (leaf2_lag0,)])
+    assert [node['_id'] for node in lacp_nodes] == [item['peering_node']['_id'] for item in found]
@@ -37,3 +37,37 @@ def test_lag_more_device(imnetdb):
     create_device(imnetdb, 'leaf1', 'Ethernet[20-30]')
     create_device(imnetdb, 'leaf2', 'Ethernet[30-40]')
     create_device(imnetdb, 'leaf3', 'Ethernet[40-50]')
+
+
+def test_lag_cabling(imnetdb):
+    leaf1, leaf2 = imnetdb.devices['leaf1'], imnetdb.devices['leaf2']
+
+    imnetdb.cabling.ensure_many([
+        ('leaf1', 'Ethernet20', 'leaf2', 'Ethernet30'),
+        ('leaf1', 'Ethernet21', 'leaf2', 'Ethernet31'),
+    ])
+
+    lag1 = imnetdb.lags[(leaf1, 'ae0')]
+    lag2 = imnetdb.lags[(leaf2, 'ae0')]
+
+    cabling = imnetdb.lags.get_cabling(scope=leaf1)
+    lag_peers = tuple(sorted([('leaf1', lag1['_id']), ('leaf2', lag2['_id'])]))
+
+    assert list(cabling) == [lag_peers]
+    assert len(cabling[lag_peers]) == 2
+
+
+def test_lag_catalog_options(imnetdb):
+    catalog = imnetdb.lags.catalog_devices(['leaf1', 'leaf2'], ids_only=True)
+    assert set(catalog) == {'leaf1', 'leaf2'}
+    assert all(isinstance(lag_info['lag'], str) for lag_info in catalog['leaf1'].values())
+
+    catalog = imnetdb.lags.catalog_device('spine1', fields=['name'])
+    assert set(catalog['ae0']['lag']) == {'_id', 'name'}
+    assert all(set(if_node) == {'_id', 'name'} for if_node in catalog['ae0']['interfaces'].values())
+
+    assert imnetdb.lags.catalog_device('no-such-device') is None
+
+    streamed = dict(imnetdb.lags.iter_catalog())
+    assert streamed == imnetdb.lags.catalog()
+    assert set(streamed) == {'spine1', 'leaf1', 'leaf2', 'leaf3'}
@@ -0,0 +1,62 @@
+from ipaddress import ip_network
+
+from imnetdb.db.lpm import LPMTable
+
+
+def test_lpm_longest_match():
+    table = LPMTable()
+    table.insert(ip_network('10.0.0.0/8'), 'net8', 'net8')
+    table.insert(ip_network('10.1.0.0/16'), 'net16', 'net16')
+    table.insert(ip_network('10.1.1.0/24'), 'net24', 'net24')
+    table.insert(ip_network('2001:db8::/32'), 'net6', 'net6')
+
+    assert table.lookup('10.1.1.1') == 'net24'
+    assert table.lookup('10.1.2.1') == 'net16'
+    assert table.lookup('10.2.2.1') == 'net8'
+    assert table.lookup('11.1.1.1') is None
+    assert table.lookup('2001:db8::1') == 'net6'
+    assert table.lookup_many(['10.1.1.1', '10.2.2.1']) == ['net24', 'net8']
+
+
+def test_lpm_priority_and_remove():
+    table = LPMTable()
+    table.insert(ip_network('10.1.1.0/30'), 'ifaddr', 'connected', priority=1)
+    table.insert(ip_network('10.1.1.0/30'), 'network', 'network', priority=0)
+
+    assert table.lookup('10.1.1.2') == 'network'
+
+    table.remove('network')
+    assert table.lookup('10.1.1.2') == 'connected'
+
+    table.remove('ifaddr')
+    assert table.lookup('10.1.1.2') is None
+    assert len(table) == 0
+
+
+def test_lpm_same_prefix_twice():
+    table = LPMTable()
+    table.insert(ip_network('10.255.0.1/32'), 'lo0', 'network', priority=0)
+    table.insert(ip_network('10.255.0.1/32'), 'lo0', 'connected', priority=1)
+    assert table.lookup('10.255.0.1') == 'network'
+
+    table.remove('lo0')
+    assert table.lookup('10.255.0.1') is None
+    assert len(table) == 0
+
+
+def test_lpm_refresh_host_prefix(imnetdb):
+    imnetdb.reset_database()
+    rt_node = imnetdb.routing_tables.ensure('global')
+    loopback = imnetdb.ip_if_addrs.ensure((rt_node, '10.255.0.1/32'))
+    imnetdb.ip_if_addrs.ensure((rt_node, '10.0.0.1/31'))
+
+    lpm = imnetdb.routing_tables.lpm(rt_node)
+    assert lpm.lookup('10.255.0.1')['ip']['_id'] == loopback['_id']
+
+    imnetdb.ip_if_addrs.ensure((rt_node, '10.255.0.1/32'), role='loopback')
+    assert lpm.refresh() == (1, 0)
+    assert lpm.lookup('10.255.0.1')['ip']['role'] == 'loopback'
+
+    imnetdb.ip_if_addrs.remove(loopback)
+    assert lpm.refresh() == (0, 1)
+    assert lpm.lookup('10.255.0.1') is None
@@ -0,0 +1,80 @@
+from imnetdb.db.slowlog import find_full_scans, normalize_query
+
+
+def attr(var_name, name):
+    return dict(type='attribute access', name=name, subNodes=[dict(type='reference', name=var_name)])
+
+
+def test_find_full_scans():
+    # FOR dev IN Device FILTER dev.role == @role RETURN dev.name
+    plan = dict(nodes=[
+        dict(type='SingletonNode'),
+        dict(type='EnumerateCollectionNode', collection='Device', outVariable=dict(name='dev')),
+        dict(type='CalculationNode', outVariable=dict(name='1'), expression=dict(
+            type='compare ==', subNodes=[attr('dev', 'role'), dict(type='parameter', name='role')])),
+        dict(type='FilterNode', inVariable=dict(name='1')),
+        dict(type='CalculationNode', outVariable=dict(name='2'), expression=attr('dev', 'name')),
+        dict(type='IndexNode', collection='Interface', outVariable=dict(name='if'),
+             condition=dict(type='n-ary or', subNodes=[dict(type='n-ary and', subNodes=[attr('if', 'device')])])),
+        dict(type='ReturnNode', inVariable=dict(name='2')),
+    ])
+    assert find_full_scans(plan) == [dict(collection='Device', index=None, filter_attributes=['role'])]
+
+    # the optimizer moved the filter into the enumeration
+    plan = dict(nodes=[
+        dict(type='EnumerateCollectionNode', collection='Cable', outVariable=dict(name='c'),
+             filter=dict(type='n-ary and', subNodes=[attr('c', 'speed'), attr('c', 'media')])),
+    ])
+    assert find_full_scans(plan) == [dict(collection='Cable', index=None, filter_attributes=['media', 'speed'])]
+
+
+def test_find_full_scans_subquery_and_index():
+    # the UPSERT lookup subquery of a server before 3.8, and an index scan that only serves a SORT
+    plan = dict(nodes=[
+        dict(type='SubqueryNode', subquery=dict(nodes=[
+            dict(type='EnumerateCollectionNode', collection='Interface', outVariable=dict(name='if'),
+                 filter=attr('if', 'device')),
+        ])),
+        dict(type='IndexNode', collection='Device', outVariable=dict(name='dev'), condition=dict(),
+             indexes=[dict(name='primary', type='primary')]),
+        dict(type='IndexNode', collection='LAG', outVariable=dict(name='lag'), indexes=[dict(name='idx_1')],
+             condition=dict(type='n-ary or', subNodes=[dict(type='n-ary and', subNodes=[attr('lag', 'device')])])),
+    ])
+    assert find_full_scans(plan) == [
+        dict(collection='Interface', index=None, filter_attributes=['device']),
+        dict(collection='Device', index='primary', filter_attributes=[])]
+
+
+def test_normalize_query():
+    assert normalize_query('\n  FOR dev IN Device\n    RETURN dev\n ') == 'FOR dev IN Device RETURN dev'
+
+
+def test_slow_query_log(imnetdb, caplog):
+    imnetdb.reset_database()
+    slow_log = imnetdb.enable_slow_query_log(threshold=0)
+
+    try:
+        imnetdb.devices.ensure('leaf1')
+        list(imnetdb.query('FOR dev IN Device FILTER dev.role == @role RETURN dev', bind_vars={'role': 'leaf'}))
+    finally:
+        imnetdb.uninstrument()
+
+    entries = [entry for entry in slow_log.templates.values()
+               if entry['query'] == 'FOR dev IN Device FILTER dev.role == @role RETURN dev']
+    assert len(entries) == 1
+    plan_info, = entries[0]['plans'].values()
+    assert plan_info['full_scans'] == [dict(collection='Device', index=None, filter_attributes=['role'])]
+    assert 'FULL SCAN Device filtered on [role]' in slow_log.report()
+    assert 'slow query' in caplog.text
+
+
+def test_disable_slow_query_log(imnetdb):
+    slow_log = imnetdb.enable_slow_query_log(threshold=0)
+
+    try:
+        imnetdb.disable_slow_query_log(slow_log)
+        imnetdb.devices.ensure('leaf1')
+        assert slow_log.templates == {}
+        assert imnetdb.instrumentation is not None
+    finally:
+        imnetdb.uninstrument()
@@ -0,0 +1,126 @@
+from imnetdb.db.snapshot import GraphSnapshot
+
+
+def make_snapshot():
+    snap = GraphSnapshot(attributes=('name', 'device'))
+    snap.add_vertices('Device', [('leaf1', 'leaf1', None), ('leaf2', 'leaf2', None), ('spine1', 'spine1', None)])
+    snap.add_vertices('Interface', [
+        ('leaf1-e1', 'e1', 'Device/leaf1'),
+        ('leaf2-e1', 'e1', 'Device/leaf2'),
+        ('spine1-e1', 'e1', 'Device/spine1'),
+        ('spine1-e2', 'e2', 'Device/spine1'),
+    ])
+    snap.add_edges('equip_member', [
+        ('Interface/leaf1-e1', 'Device/leaf1'),
+        ('Interface/leaf2-e1', 'Device/leaf2'),
+        ('Interface/spine1-e1', 'Device/spine1'),
+        ('Interface/spine1-e2', 'Device/spine1'),
+        ('Interface/unknown', 'Device/spine1'),
+    ])
+    snap.add_edges('cabled', [
+        ('Interface/leaf1-e1', 'Interface/spine1-e1'),
+        ('Interface/leaf2-e1', 'Interface/spine1-e2'),
+    ])
+    return snap
+
+
+def test_snapshot_vertices():
+    snap = make_snapshot()
+    assert len(snap) == 7
+    assert snap.edge_count('equip_member') == 4
+
+    vid = snap.vertex_id('Interface/spine1-e2')
+    assert snap.doc_id(vid) == 'Interface/spine1-e2'
+    assert snap.vertex(vid) == dict(_id='Interface/spine1-e2', name='e2', device='Device/spine1')
+    assert snap.vertex_id('Device/nope') is None
+    assert [snap.doc_id(vid) for vid in snap.find('Interface', device='Device/spine1')] == [
+        'Interface/spine1-e1', 'Interface/spine1-e2']
+
+
+def test_snapshot_neighbors_and_paths():
+    snap = make_snapshot()
+    spine1 = snap.vertex_id('Device/spine1')
+    leaf1, leaf2 = snap.vertex_id('Device/leaf1'), snap.vertex_id('Device/leaf2')
+
+    assert snap.degree(spine1, 'equip_member', direction='inbound') == 2
+    assert snap.neighbors(spine1, 'equip_member') == []
+
+    path = snap.shortest_path(leaf1, leaf2)
+    assert [snap.doc_id(vid) for vid in path] == [
+        'Device/leaf1', 'Interface/leaf1-e1', 'Interface/spine1-e1', 'Device/spine1',
+        'Interface/spine1-e2', 'Interface/leaf2-e1', 'Device/leaf2']
+
+    assert snap.shortest_path(leaf1, leaf2, edge_types='equip_member') is None
+    assert dict(snap.bfs(leaf1))[leaf2] == 6
+    assert len(list(snap.bfs(leaf1, max_depth=2))) == 3
+    assert {vid for vid, _depth in snap.dfs(leaf1)} == set(range(len(snap)))
+
+
+def make_fabric_snapshot():
+    # two leafs cabled through a patch panel, with both leaf interfaces in a LAG, an orphan
+    # device and interface, and an empty collection.
+
+    snap = GraphSnapshot(attributes=('name',))
+    snap.add_vertices('Device', [(name, name) for name in ('leaf1', 'leaf2', 'panel1', 'orphan1')])
+    snap.add_vertices('Interface', [
+        (f'{dev}-{if_name}', if_name)
+        for dev, if_names in (('leaf1', ('e1', 'e2')), ('leaf2', ('e1', 'e2')), ('panel1', ('p1f', 'p1r')))
+        for if_name in if_names
+    ])
+    snap.add_vertices('LACP', [])
+    snap.add_vertices('Cable', [('c1', 'c1'), ('c2', 'c2'), ('c3', 'c3')])
+    snap.add_vertices('LAG', [('leaf1-ae0', 'ae0'), ('leaf2-ae0', 'ae0')])
+    snap.add_vertices('VLAN', [('orphan', 'orphan')])
+
+    snap.add_edges('equip_interface', [
+        (f'Device/{if_key.partition("-")[0]}', f'Interface/{if_key}')
+        for if_key in ('leaf1-e1', 'leaf1-e2', 'leaf2-e1', 'leaf2-e2', 'panel1-p1f', 'panel1-p1r')
+    ])
+    snap.add_edges('cabled', [
+        ('Interface/leaf1-e1', 'Cable/c1'), ('Interface/panel1-p1f', 'Cable/c1'),
+        ('Interface/panel1-p1r', 'Cable/c2'), ('Interface/leaf2-e1', 'Cable/c2'),
+        ('Interface/leaf1-e2', 'Cable/c3'), ('Interface/leaf2-e2', 'Cable/c3'),
+    ])
+    snap.add_edges('pass_through', [('Interface/panel1-p1f', 'Interface/panel1-p1r')])
+    snap.add_edges('lag_member', [
+        ('Interface/leaf1-e1', 'LAG/leaf1-ae0'), ('Interface/leaf1-e2', 'LAG/leaf1-ae0'),
+        ('Interface/leaf2-e1', 'LAG/leaf2-ae0'), ('Interface/leaf2-e2', 'LAG/leaf2-ae0'),
+    ])
+    snap.add_edges('lacp_member', [])
+    return snap
+
+
+def test_snapshot_fabric_csr():
+    snap = make_fabric_snapshot()
+    assert len(snap) == 16
+    assert snap.vertices('LACP') == range(10, 10)
+    assert snap.edge_count('lacp_member') == 0
+
+    lag1 = snap.vertex_id('LAG/leaf1-ae0')
+    assert sorted(snap.doc_id(vid) for vid in snap.neighbors(lag1, 'lag_member', direction='inbound')) == [
+        'Interface/leaf1-e1', 'Interface/leaf1-e2']
+    assert snap.neighbors(lag1, 'lag_member') == []
+    assert snap.degree(snap.vertex_id('Interface/leaf1-e1'), direction='any') == 3
+
+    # the orphans have no edges, including the last vertex of the snapshot
+
+    for doc_id in ('Device/orphan1', 'VLAN/orphan'):
+        vid = snap.vertex_id(doc_id)
+        assert snap.degree(vid, direction='any') == 0
+        assert list(snap.bfs(vid)) == [(vid, 0)]
+        assert snap.shortest_path(snap.vertex_id('Device/leaf1'), vid) is None
+
+
+def test_snapshot_multi_hop_cabling():
+    snap = make_fabric_snapshot()
+    leaf1_e1, leaf2_e1 = snap.vertex_id('Interface/leaf1-e1'), snap.vertex_id('Interface/leaf2-e1')
+
+    path = snap.shortest_path(leaf1_e1, leaf2_e1, edge_types=['cabled', 'pass_through'])
+    assert [snap.doc_id(vid) for vid in path] == [
+        'Interface/leaf1-e1', 'Cable/c1', 'Interface/panel1-p1f', 'Interface/panel1-p1r', 'Cable/c2',
+        'Interface/leaf2-e1']
+
+    # the pass-through is directional
+
+    assert snap.shortest_path(leaf2_e1, leaf1_e1, edge_types='pass_through', direction='outbound') is None
+    assert dict(snap.bfs(leaf1_e1, edge_types=['cabled', 'pass_through']))[leaf2_e1] == 5
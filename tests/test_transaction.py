@@ -0,0 +1,65 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_transaction_commit(imnetdb):
+    imnetdb.reset_database()
+
+    with imnetdb.transaction():
+        device = imnetdb.devices.ensure('leaf1')
+        imnetdb.interfaces.ensure((device, 'Ethernet1'))
+
+        # read-your-writes within the transaction
+        assert imnetdb.devices.col.has('leaf1')
+
+    assert imnetdb.transaction_db is None
+    assert imnetdb.devices.col.has('leaf1')
+    assert imnetdb.interfaces.col.count() == 1
+
+
+def test_transaction_abort(imnetdb):
+    imnetdb.reset_database()
+
+    with pytest.raises(RuntimeError):
+        with imnetdb.transaction():
+            device = imnetdb.devices.ensure('leaf2')
+            imnetdb.interfaces.ensure((device, 'Ethernet1'))
+            raise RuntimeError('fail halfway')
+
+    assert not imnetdb.devices.col.has('leaf2')
+    assert imnetdb.interfaces.col.count() == 0
+
+
+def test_transaction_nested(imnetdb):
+    imnetdb.reset_database()
+
+    with imnetdb.transaction() as outer:
+        with imnetdb.transaction() as inner:
+            assert inner is outer
+            imnetdb.devices.ensure('leaf3')
+
+    assert imnetdb.devices.col.has('leaf3')
+
+
+def test_transaction_abort_error(imnetdb):
+    # the transaction is already aborted, so the abort fails; the original error is raised
+
+    with pytest.raises(RuntimeError):
+        with imnetdb.transaction() as txn_db:
+            txn_db.abort_transaction()
+            raise RuntimeError('fail')
+
+    assert imnetdb.transaction_db is None
+
+
+def test_transaction_thread_local(imnetdb):
+    imnetdb.reset_database()
+
+    with imnetdb.transaction():
+        imnetdb.devices.ensure('leaf4')
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(lambda: imnetdb.transaction_db).result() is None
+            assert executor.submit(lambda: imnetdb.devices.col.has('leaf4')).result() is False
+
+    assert imnetdb.devices.col.has('leaf4')
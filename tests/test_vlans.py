@@ -0,0 +1,48 @@
+import pytest
+
+
+def test_vlans_attached_many(imnetdb):
+    dev_node = imnetdb.devices.ensure('leaf11')
+    if_nodes = [imnetdb.interfaces.ensure((dev_node, if_name)) for if_name in ('eth1', 'eth2', 'eth3')]
+
+    vlan_nodes = [imnetdb.vlans.ensure(str(vlan_id)) for vlan_id in (10, 20, 30)]
+    vlan_group = imnetdb.vlan_groups.ensure('servers')
+    for vlan_node in vlan_nodes[1:]:
+        imnetdb.vlan_groups.add_member(vlan_group, vlan_node)
+
+    imnetdb.ensure_edge((vlan_nodes[0], 'vlan_assigned', if_nodes[0]))
+    imnetdb.ensure_edge((vlan_group, 'vlan_assigned', if_nodes[0]))
+    imnetdb.ensure_edge((vlan_group, 'vlan_assigned', if_nodes[1]))
+
+    attached = imnetdb.vlans.get_attached_vlans_many(if_nodes)
+
+    assert sorted(vlan['name'] for vlan in attached[if_nodes[0]['_id']]) == ['10', '20', '30']
+    assert sorted(vlan['name'] for vlan in attached[if_nodes[1]['_id']]) == ['20', '30']
+    assert attached[if_nodes[2]['_id']] == []
+
+    attached = imnetdb.vlans.get_device_attached_vlans(dev_node)
+    assert set(attached) == {if_nodes[0]['_id'], if_nodes[1]['_id']}
+
+
+def test_vlans_range(imnetdb):
+    dev_node = imnetdb.devices['leaf11']
+    if_nodes = [imnetdb.interfaces.ensure((dev_node, if_name)) for if_name in ('eth4', 'eth5')]
+
+    vlan_nodes = imnetdb.vlans.ensure_range('[100-199]', role='server')
+    assert len(vlan_nodes) == 100
+
+    imnetdb.vlans.assign_range(['[100-149]', '[190-199]'], if_nodes)
+
+    attached = imnetdb.vlans.get_attached_vlans_many(if_nodes)
+    assert all(len(vlans) == 60 for vlans in attached.values())
+
+    imnetdb.vlans.assign_range('[100-149]', if_nodes, present=False)
+
+    attached = imnetdb.vlans.get_attached_vlans_many(if_nodes)
+    assert all(len(vlans) == 10 for vlans in attached.values())
+
+    with pytest.raises(ValueError):
+        imnetdb.vlans.assign_range('[198-201]', if_nodes)
+
+    attached = imnetdb.vlans.get_attached_vlans_many(if_nodes)
+    assert all(len(vlans) == 10 for vlans in attached.values())